@@ -0,0 +1,142 @@
+"""按实测延迟和内存自动调整 CSV 读取块大小和提交批量
+
+数据来自 PerformanceMonitor 的分阶段累计值：每次调整取上次以来 insert + derived 阶段的每行耗时
+和 commit 阶段的每行耗时（指数平滑），让单个数据块的写入和单次提交都接近目标延迟；
+同时按数据块的估算内存限制块大小和未提交的行数。
+"""
+import sys
+
+from columnar_parser import column_count
+
+# 单个数据块写入（及单次提交）的目标耗时：批量导入追求吞吐，界面导入和实时跟踪要及时刷新
+BULK_TARGET_LATENCY = 1.0
+NORMAL_TARGET_LATENCY = 0.25
+LIVE_TARGET_LATENCY = 0.1
+# 在途数据块和未提交行的内存上限
+MEMORY_CEILING = 256 * 1024 * 1024
+MIN_CHUNK_SIZE = 200
+MAX_CHUNK_SIZE = 200000
+MAX_COMMIT_ROWS = 1000000
+# 每次调整最多放大或缩小的倍数，单次异常的测量不会让批量大幅振荡
+MAX_STEP = 2.0
+# 平滑系数：新测量值的权重
+SMOOTHING = 0.3
+# 块大小或提交批量变化超过这个比例时才写日志
+LOG_CHANGE_RATIO = 0.25
+# 估算对象列内存时抽样的元素数
+SAMPLE_SIZE = 64
+
+
+def estimate_row_bytes(chunk):
+    """估算数据块每行占用的内存（列块按数组元素大小，对象列和字典行抽样 getsizeof）"""
+    if isinstance(chunk, dict):
+        if not column_count(chunk):
+            return 0
+        total = 0
+        for values in chunk.values():
+            if values.dtype == object:
+                head = values[:SAMPLE_SIZE]
+                total += values.itemsize + sum(sys.getsizeof(value) for value in head) / len(head)
+            else:
+                total += values.itemsize
+        return total
+    if not chunk:
+        return 0
+    head = chunk[:SAMPLE_SIZE]
+    return sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+               for row in head) / len(head)
+
+
+def smooth(previous, value):
+    return value if previous is None else previous + SMOOTHING * (value - previous)
+
+
+def step_towards(current, target, low, high):
+    """向 target 靠近，单次变化不超过 MAX_STEP 倍，结果限制在 [low, high]"""
+    target = min(max(target, current / MAX_STEP), current * MAX_STEP)
+    return int(min(max(target, low), high))
+
+
+class AdaptiveBatchSizer:
+    """导入过程中根据实测结果调整 chunk_size 和 commit_rows
+
+    写线程每写完一个数据块调用 adjust(chunk)，再用 apply(db_manager) 更新提交策略；
+    新的 chunk_size 由调用方在下一次读取或派发解析任务时使用。
+    """
+
+    def __init__(self, monitor, target_latency=NORMAL_TARGET_LATENCY, memory_ceiling=MEMORY_CEILING,
+                 chunk_size=1000, in_flight=1, max_commit_delay=5.0, min_chunk_size=MIN_CHUNK_SIZE,
+                 max_chunk_size=MAX_CHUNK_SIZE, on_log=print):
+        self.monitor = monitor
+        self.target_latency = target_latency
+        self.memory_ceiling = memory_ceiling
+        # 同时驻留内存的数据块数量（如导入流水线的队列长度），块大小的内存上限按它均分
+        self.in_flight = max(1, in_flight)
+        # 数据最长多久必须提交（读连接只能看到已提交的数据）
+        self.max_commit_delay = max_commit_delay
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.on_log = on_log
+        self.chunk_size = min(max(chunk_size, min_chunk_size), max_chunk_size)
+        self.commit_rows = self.chunk_size
+        self.write_cost = None
+        self.commit_cost = None
+        self.row_bytes = None
+        self.last_totals = monitor.stage_totals()
+        self.logged = (self.chunk_size, self.commit_rows)
+
+    def _delta(self, totals, name):
+        seconds, _, rows = totals.get(name, (0.0, 0, 0))
+        last_seconds, _, last_rows = self.last_totals.get(name, (0.0, 0, 0))
+        return seconds - last_seconds, rows - last_rows
+
+    def adjust(self, chunk=None):
+        """读取上次调整以来的测量值并更新 chunk_size 和 commit_rows，返回是否有变化"""
+        if chunk is not None:
+            row_bytes = estimate_row_bytes(chunk)
+            if row_bytes:
+                self.row_bytes = smooth(self.row_bytes, row_bytes)
+        totals = self.monitor.stage_totals()
+        insert_seconds, write_rows = self._delta(totals, 'insert')
+        derived_seconds, _ = self._delta(totals, 'derived')
+        commit_seconds, commit_rows = self._delta(totals, 'commit')
+        self.last_totals = totals
+        if write_rows > 0:
+            self.write_cost = smooth(self.write_cost, (insert_seconds + derived_seconds) / write_rows)
+        if commit_rows > 0:
+            self.commit_cost = smooth(self.commit_cost, commit_seconds / commit_rows)
+
+        previous = (self.chunk_size, self.commit_rows)
+        memory_rows = self.memory_ceiling / self.row_bytes if self.row_bytes else MAX_COMMIT_ROWS
+        if self.write_cost:
+            target = min(self.target_latency / self.write_cost, memory_rows / self.in_flight)
+            self.chunk_size = step_towards(self.chunk_size, target, self.min_chunk_size, self.max_chunk_size)
+        # max_commit_delay 为 0 时每次写入都提交，提交批量就是块大小
+        if self.commit_cost and self.max_commit_delay > 0:
+            target = min(self.target_latency / self.commit_cost, memory_rows)
+            self.commit_rows = step_towards(self.commit_rows, target, self.chunk_size, MAX_COMMIT_ROWS)
+        self.commit_rows = max(self.commit_rows, self.chunk_size)
+        self._log_if_changed()
+        return (self.chunk_size, self.commit_rows) != previous
+
+    def apply(self, db_manager):
+        db_manager.commit_rows = self.commit_rows
+        db_manager.commit_interval = self.max_commit_delay
+
+    def _log_if_changed(self):
+        logged_chunk, logged_commit = self.logged
+        if (abs(self.chunk_size - logged_chunk) < logged_chunk * LOG_CHANGE_RATIO
+                and abs(self.commit_rows - logged_commit) < logged_commit * LOG_CHANGE_RATIO):
+            return
+        self.logged = (self.chunk_size, self.commit_rows)
+        self.on_log(self.describe())
+
+    def describe(self):
+        parts = [f"块大小 {self.chunk_size} 行", f"提交批量 {self.commit_rows} 行"]
+        if self.write_cost:
+            parts.append(f"写入 {self.write_cost * 1000000:.1f} 微秒/行")
+        if self.commit_cost:
+            parts.append(f"提交 {self.commit_cost * 1000000:.1f} 微秒/行")
+        if self.row_bytes:
+            parts.append(f"约 {self.row_bytes:.0f} 字节/行")
+        return f"自适应批量：{'，'.join(parts)}"
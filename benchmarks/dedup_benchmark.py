@@ -0,0 +1,69 @@
+"""对比 UNIQUE 复合索引 + INSERT OR IGNORE 与行指纹暂存表合并两种去重方式
+
+分别导入同一文件两次（第二次全部为重复行），记录耗时和数据库文件大小。
+用法: python -m benchmarks.dedup_benchmark [行数]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from csv_processor_helpers import CSV_COLUMNS, FLOAT_COLUMNS
+from columnar_parser import ColumnarCSVReader
+from dedup import ensure_fingerprint_column, insert_deduplicated
+from benchmarks.parse_benchmark import write_sample_csv
+
+COLUMN_DEFS = ', '.join(f"{name} {'REAL' if name in FLOAT_COLUMNS else 'TEXT'}" for name in CSV_COLUMNS)
+
+
+def run_unique_index(db_path, file_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute(f"CREATE TABLE all_data (id INTEGER PRIMARY KEY AUTOINCREMENT, {COLUMN_DEFS}, "
+                 f"UNIQUE(ModelName, BarCode, V_Current, A_Current, Offset))")
+    query = (f"INSERT OR IGNORE INTO all_data ({', '.join(CSV_COLUMNS)}) "
+             f"VALUES ({', '.join(['?' for _ in CSV_COLUMNS])})")
+    timings = []
+    for _ in range(2):
+        start = time.perf_counter()
+        for columns in ColumnarCSVReader().read_in_chunks(file_path):
+            conn.executemany(query, zip(*(columns[name].tolist() for name in CSV_COLUMNS)))
+        conn.commit()
+        timings.append(time.perf_counter() - start)
+    rows = conn.execute("SELECT COUNT(*) FROM all_data").fetchone()[0]
+    conn.close()
+    return timings, rows
+
+
+def run_fingerprint(db_path, file_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute(f"CREATE TABLE all_data (id INTEGER PRIMARY KEY AUTOINCREMENT, {COLUMN_DEFS}, RowHash INTEGER)")
+    ensure_fingerprint_column(conn, 'all_data')
+    timings = []
+    for _ in range(2):
+        start = time.perf_counter()
+        for columns in ColumnarCSVReader().read_in_chunks(file_path):
+            insert_deduplicated(conn, 'all_data', columns)
+        conn.commit()
+        timings.append(time.perf_counter() - start)
+    rows = conn.execute("SELECT COUNT(*) FROM all_data").fetchone()[0]
+    conn.close()
+    return timings, rows
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'sample.csv')
+        write_sample_csv(file_path, rows)
+        for label, runner in (("UNIQUE 索引", run_unique_index), ("行指纹合并", run_fingerprint)):
+            db_path = os.path.join(tmp_dir, f'{runner.__name__}.db')
+            (first, second), count = runner(db_path, file_path)
+            size_mb = os.path.getsize(db_path) / 1024 / 1024
+            print(f"{label}: 首次导入 {first:.2f} 秒, 重复导入 {second:.2f} 秒, "
+                  f"{count} 行, 数据库 {size_mb:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""导入与查询基准：在同一份合成数据上比较各导入路径的速度和峰值内存，并计时绘图/统计背后的查询
+
+结果写成 JSON，便于比较不同版本；--baseline 指定上一次的结果文件时同时打印加速比。
+用法: python -m benchmarks.ingest_benchmark [--models 3] [--locations 40] [--rows-per-day 20000] [--days 3]
+                                          [--output benchmark_results.json] [--baseline 旧结果.json]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import queue
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+from csv_processor_helpers import CSVReader, PerformanceMonitor, validate_csv_row
+from columnar_parser import ColumnarCSVReader
+from database_manager import DatabaseManager
+from import_manifest import create_manifest_table
+from distribution_report import load_locations, load_page_data
+from benchmarks.synthetic_data import add_generator_arguments, generate_avi_csvs
+
+
+def run_csv2sqlite5(csv_files, db_path):
+    """csv2sqlite5.CSVToSQLiteApp.process_csv（不创建窗口，只借用其导入方法）"""
+    from csv2sqlite5 import CSVToSQLiteApp
+    app = CSVToSQLiteApp.__new__(CSVToSQLiteApp)
+    app.message_queue = queue.Queue()
+    conn = sqlite3.connect(db_path)
+    app.create_table(conn)
+    create_manifest_table(conn)
+    for file_path in csv_files:
+        app.process_csv(file_path, conn)
+    conn.close()
+    errors = [message for kind, message in app.message_queue.queue if '出错' in str(message)]
+    if errors:
+        raise RuntimeError(errors[0])
+
+
+def optimized_app(db_path, chunk_size=1000):
+    """构造一个不带窗口的 OptimizedCSVToSQLiteApp，界面回调替换为空操作"""
+    from optimized_csv_to_sqlite_app import OptimizedCSVToSQLiteApp
+    app = OptimizedCSVToSQLiteApp.__new__(OptimizedCSVToSQLiteApp)
+    app.config = {'chunk_size': chunk_size, 'storage_schema': 'wide'}
+    app.log_messages = []
+    app.log_message = app.log_messages.append
+    app.update_file_status = lambda file_name, status: None
+    app.db_path = db_path
+    app.db_manager = DatabaseManager(sqlite3.connect(db_path))
+    app.location_summary = None
+    app.model_catalog = None
+    app.sketch_store = None
+    app.csv_reader = ColumnarCSVReader(chunk_size=chunk_size)
+    app.performance_monitor = PerformanceMonitor()
+    app.create_table()
+    return app
+
+
+def run_optimized_app(csv_files, db_path):
+    """OptimizedCSVToSQLiteApp.process_csv（单文件路径：列式解析 + 去重 + 汇总表）"""
+    app = optimized_app(db_path)
+    for file_path in csv_files:
+        app.process_csv(file_path)
+    app.db_manager.close()
+    errors = [message for message in app.log_messages if '出错' in message]
+    if errors:
+        raise RuntimeError(errors[0])
+
+
+def parse_rows(csv_files, chunk_size=1000):
+    return [[validate_csv_row(row) for row in chunk]
+            for file_path in csv_files for chunk in CSVReader(chunk_size).read_in_chunks(file_path)]
+
+
+def run_bulk_insert(chunks, db_path):
+    """只计 DatabaseManager.bulk_insert 本身（解析结果预先准备好）"""
+    db_manager = DatabaseManager(sqlite3.connect(db_path))
+    db_manager.create_data_table('optimized_data')
+    for chunk in chunks:
+        db_manager.bulk_insert('optimized_data', chunk)
+    db_manager.close()
+
+
+def measure(runner, rows, measure_memory=True):
+    """运行两遍：第一遍计时，第二遍在 tracemalloc 下测峰值内存（避免跟踪开销影响计时）"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        runner(os.path.join(tmp_dir, 'timing.db'))
+        elapsed = time.perf_counter() - start
+        peak = None
+        if measure_memory:
+            tracemalloc.start()
+            runner(os.path.join(tmp_dir, 'memory.db'))
+            peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+    return {
+        'rows': rows,
+        'seconds': round(elapsed, 4),
+        'rows_per_second': round(rows / elapsed, 1),
+        'peak_memory_mb': round(peak, 2) if peak is not None else None,
+    }
+
+
+def best_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return {'seconds': round(min(timings), 4), 'result_rows': result}
+
+
+def run_queries(csv_files, tmp_dir, repeat=3):
+    """在两种导入结果上计时 plot_distribution / plot_histograms / calculate_statistics 所用的查询"""
+    legacy_db = os.path.join(tmp_dir, 'legacy.db')
+    run_csv2sqlite5(csv_files, legacy_db)
+    app = optimized_app(os.path.join(tmp_dir, 'optimized.db'))
+    for file_path in csv_files:
+        app.process_csv(file_path)
+    db_manager = app.db_manager
+    models = [row[0] for row in db_manager.execute_query("SELECT DISTINCT ModelName FROM optimized_data ORDER BY 1")]
+    legacy_conn = sqlite3.connect(legacy_db)
+
+    def optimized_distribution():
+        rows = 0
+        for model_name in models:
+            page_data = load_page_data(db_manager, model_name, load_locations(db_manager, model_name))
+            rows += sum(len(data) for _, data in page_data)
+        return rows
+
+    def legacy_query(sql):
+        def run():
+            return sum(len(legacy_conn.execute(sql, (model_name,)).fetchall()) for model_name in models)
+        return run
+
+    def statistics(use_summary):
+        def run():
+            captured = {}
+            app.display_statistics = captured.update
+            summary, app.location_summary = app.location_summary, app.location_summary if use_summary else None
+            try:
+                app.calculate_statistics()
+            finally:
+                app.location_summary = summary
+            return len(captured)
+        return run
+
+    queries = {
+        'optimized.plot_distribution': optimized_distribution,
+        'csv2sqlite5.plot_distribution': legacy_query(
+            "SELECT V_Current, V_Min, V_Max, A_Current, Offset FROM all_data WHERE ModelName = ?"),
+        'csv2sqlite5.plot_histograms': legacy_query(
+            "SELECT V_Current, A_Current, Offset FROM all_data WHERE ModelName = ?"),
+        'optimized.calculate_statistics.raw_scan': statistics(False),
+        'optimized.calculate_statistics.summary': statistics(True),
+    }
+    results = {name: best_time(func, repeat) for name, func in queries.items()}
+    legacy_conn.close()
+    db_manager.close()
+    return results
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"与基线 {baseline_path} 比较（>1 表示更快）:")
+    for section in ('ingest', 'queries'):
+        for name, entry in results[section].items():
+            old = baseline.get(section, {}).get(name)
+            if old and entry['seconds']:
+                print(f"  {name}: {old['seconds'] / entry['seconds']:.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="导入与查询基准测试")
+    add_generator_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=3, help="查询重复次数（取最快一次）")
+    parser.add_argument('--skip-memory', action='store_true', help="不测峰值内存")
+    parser.add_argument('--output', default='benchmark_results.json', help="结果 JSON 文件")
+    parser.add_argument('--baseline', help="用于比较的旧结果 JSON 文件")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_dir = os.path.join(tmp_dir, 'csv')
+        csv_files = generate_avi_csvs(csv_dir, args.models, args.locations, args.rows_per_day, args.days,
+                                      seed=args.seed)
+        rows = len(csv_files) * args.rows_per_day
+        measure_memory = not args.skip_memory
+        chunks = parse_rows(csv_files)
+
+        results = {
+            'generated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'dataset': {
+                'models': args.models, 'locations': args.locations, 'rows_per_day': args.rows_per_day,
+                'days': args.days, 'seed': args.seed, 'files': len(csv_files), 'rows': rows,
+                'bytes': sum(os.path.getsize(path) for path in csv_files),
+            },
+            'ingest': {
+                'csv2sqlite5.process_csv': measure(lambda db: run_csv2sqlite5(csv_files, db), rows, measure_memory),
+                'optimized.process_csv': measure(lambda db: run_optimized_app(csv_files, db), rows, measure_memory),
+                'DatabaseManager.bulk_insert': measure(lambda db: run_bulk_insert(chunks, db), rows, measure_memory),
+            },
+            'queries': run_queries(csv_files, tmp_dir, args.repeat),
+        }
+
+    for name, entry in results['ingest'].items():
+        memory = f", 峰值内存 {entry['peak_memory_mb']} MB" if entry['peak_memory_mb'] is not None else ""
+        print(f"{name}: {entry['rows_per_second']:.0f} 行/秒 ({entry['seconds']:.2f} 秒{memory})")
+    for name, entry in results['queries'].items():
+        print(f"{name}: {entry['seconds'] * 1000:.1f} 毫秒")
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
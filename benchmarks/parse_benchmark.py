@@ -0,0 +1,77 @@
+"""对比逐行解析（CSVReader + validate_csv_row + bulk_insert）与列式解析的导入速度
+
+用法: python -m benchmarks.parse_benchmark [行数] [块大小]
+"""
+import csv
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from csv_processor_helpers import CSVReader, CSV_COLUMNS, FLOAT_COLUMNS, validate_csv_row
+from columnar_parser import ColumnarCSVReader, column_count
+from database_manager import DatabaseManager
+
+CREATE_TABLE_SQL = f"""
+CREATE TABLE optimized_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    {', '.join(f"{name} {'REAL' if name in FLOAT_COLUMNS else 'TEXT'}" for name in CSV_COLUMNS)}
+)
+"""
+
+
+def write_sample_csv(file_path, rows):
+    with open(file_path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(CSV_COLUMNS)
+        for i in range(rows):
+            writer.writerow([
+                f"2024-07-01 08:{i // 3600 % 60:02d}:{i % 60:02d}", f"SN{i // 50:08d}", f"MODEL{i % 5}",
+                f"C{i % 50}", "OK", 1.0 + (i % 7) * 0.01, 0.9, 1.1, "OK", 2.0 + (i % 11) * 0.01, 1.8, 2.2,
+                "OK", (i % 13) * 0.001 - 0.006, -0.01, 0.01, "OK", "OK", "OK"
+            ])
+
+
+def run_row_path(file_path, chunk_size):
+    db_manager = DatabaseManager(sqlite3.connect(':memory:'))
+    db_manager.conn.execute(CREATE_TABLE_SQL)
+    reader = CSVReader(chunk_size=chunk_size)
+    rows = 0
+    start = time.perf_counter()
+    for chunk in reader.read_in_chunks(file_path):
+        db_manager.bulk_insert('optimized_data', [validate_csv_row(row) for row in chunk])
+        rows += len(chunk)
+    elapsed = time.perf_counter() - start
+    db_manager.close()
+    return rows, elapsed
+
+
+def run_columnar_path(file_path, chunk_size):
+    db_manager = DatabaseManager(sqlite3.connect(':memory:'))
+    db_manager.conn.execute(CREATE_TABLE_SQL)
+    reader = ColumnarCSVReader(chunk_size=chunk_size)
+    rows = 0
+    start = time.perf_counter()
+    for chunk in reader.read_in_chunks(file_path):
+        db_manager.insert_columns('optimized_data', chunk)
+        rows += column_count(chunk)
+    elapsed = time.perf_counter() - start
+    db_manager.close()
+    return rows, elapsed
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'sample.csv')
+        write_sample_csv(file_path, rows)
+        for label, runner in (("逐行解析", run_row_path), ("列式解析", run_columnar_path)):
+            count, elapsed = runner(file_path, chunk_size)
+            print(f"{label}: {count} 行, {elapsed:.2f} 秒, {count / elapsed:.0f} 行/秒")
+
+
+if __name__ == "__main__":
+    main()
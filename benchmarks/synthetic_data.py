@@ -0,0 +1,104 @@
+"""生成逼真的 AVI 测试 CSV：每个模型每天一个文件，每块板依次测量所有位置
+
+用法: python -m benchmarks.synthetic_data <输出目录> [--models 3] [--locations 40] [--rows-per-day 20000] [--days 3]
+"""
+import argparse
+import csv
+import datetime
+import os
+
+import numpy as np
+
+from csv_processor_helpers import CSV_COLUMNS
+
+# 各测量值的规格中心和公差（实际数据按位置在此基础上浮动）
+MEASURE_SPECS = {'V': (1.0, 0.1), 'A': (2.0, 0.2), 'Offset': (0.0, 0.01)}
+
+
+def location_specs(rng, locations):
+    """为每个测量位置生成规格上下限，返回 {测量: (下限数组, 上限数组)}"""
+    specs = {}
+    for measure, (centre, tolerance) in MEASURE_SPECS.items():
+        centres = centre + rng.uniform(-0.5, 0.5, locations) * tolerance
+        specs[measure] = (np.round(centres - tolerance, 4), np.round(centres + tolerance, 4))
+    return specs
+
+
+def status(values, low, high):
+    return np.where((values >= low) & (values <= high), 'OK', 'NG')
+
+
+def generate_day(rng, model_name, day, specs, locations, rows, fail_rate=0.02):
+    """生成一个模型一天的数据，返回按 CSV_COLUMNS 排列的行列表"""
+    boards = -(-rows // locations)
+    location_index = np.tile(np.arange(locations), boards)[:rows]
+    board_index = np.repeat(np.arange(boards), locations)[:rows]
+    seconds = np.sort(rng.integers(0, 86400, boards))[board_index]
+    start = datetime.datetime.combine(day, datetime.time())
+    times = [(start + datetime.timedelta(seconds=int(s))).strftime('%Y-%m-%d %H:%M:%S') for s in seconds]
+    barcodes = [f"{model_name}-{day:%y%m%d}-{b:06d}" for b in board_index]
+
+    columns = {}
+    statuses = []
+    for measure in ('V', 'A', 'Offset'):
+        low, high = specs[measure][0][location_index], specs[measure][1][location_index]
+        # 正态分布在规格中心附近，少量样本偏出规格
+        values = rng.normal((low + high) / 2, (high - low) / 8)
+        outliers = rng.random(rows) < fail_rate / 3
+        values[outliers] += (high - low)[outliers] * rng.choice([-1, 1], outliers.sum())
+        columns[measure] = (np.round(values, 4), low, high)
+        statuses.append(status(values, low, high))
+    overall = np.where((statuses[0] == 'OK') & (statuses[1] == 'OK') & (statuses[2] == 'OK'), 'OK', 'NG')
+
+    rows_out = []
+    for i in range(rows):
+        rows_out.append([
+            times[i], barcodes[i], model_name, f"C{location_index[i] + 1}",
+            statuses[0][i], columns['V'][0][i], columns['V'][1][i], columns['V'][2][i],
+            statuses[1][i], columns['A'][0][i], columns['A'][1][i], columns['A'][2][i],
+            statuses[2][i], columns['Offset'][0][i], columns['Offset'][1][i], columns['Offset'][2][i],
+            overall[i], overall[i], overall[i],
+        ])
+    return rows_out
+
+
+def generate_avi_csvs(output_dir, models=3, locations=40, rows_per_day=20000, days=3,
+                      start_day=datetime.date(2024, 7, 1), seed=0):
+    """在 output_dir 下生成 models x days 个 CSV 文件，返回文件路径列表（同样的参数总生成同样的数据）"""
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for m in range(models):
+        model_name = f"MODEL{m + 1:02d}"
+        specs = location_specs(rng, locations)
+        for d in range(days):
+            day = start_day + datetime.timedelta(days=d)
+            path = os.path.join(output_dir, f"{model_name}_{day:%Y%m%d}.csv")
+            with open(path, 'w', newline='', encoding='utf-8') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(CSV_COLUMNS)
+                writer.writerows(generate_day(rng, model_name, day, specs, locations, rows_per_day))
+            paths.append(path)
+    return paths
+
+
+def add_generator_arguments(parser):
+    parser.add_argument('--models', type=int, default=3, help="模型数")
+    parser.add_argument('--locations', type=int, default=40, help="每个模型的测量位置（Name_）数")
+    parser.add_argument('--rows-per-day', type=int, default=20000, help="每个模型每天的行数")
+    parser.add_argument('--days', type=int, default=3, help="天数")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成合成 AVI CSV 数据")
+    parser.add_argument('output_dir', help="输出目录")
+    add_generator_arguments(parser)
+    args = parser.parse_args(argv)
+    paths = generate_avi_csvs(args.output_dir, args.models, args.locations, args.rows_per_day, args.days,
+                              seed=args.seed)
+    print(f"已生成 {len(paths)} 个文件，共 {len(paths) * args.rows_per_day} 行: {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
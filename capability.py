@@ -0,0 +1,165 @@
+"""过程能力分析：按 (ModelName, Name_) 计算 V_Current/A_Current/Offset 的均值、标准差、Cp、Cpk、Sigma 水平、良率和 PPM
+
+一次 GROUP BY 查询在 SQLite 内完成逐行累计（无需把原始数据取到 Python；方差按两遍法，
+先用窗口函数求分组均值再累计离差平方和，避免平方和相减的精度损失），再用 NumPy 对所有分组向量化计算指标，结果写入 process_capability 表。
+"""
+import math
+import time
+
+import numpy as np
+
+CAPABILITY_TABLE = 'process_capability'
+CAPABILITY_MEASURES = [('V_Current', 'V_Min', 'V_Max'), ('A_Current', 'A_Min', 'A_Max'),
+                       ('Offset', 'Offset_Min', 'Offset_Max')]
+CAPABILITY_FIELDS = ['count', 'mean', 'std', 'lsl', 'usl', 'cp', 'cpk', 'sigma_level', 'yield_rate',
+                     'ppm', 'expected_ppm']
+
+CREATE_CAPABILITY_SQL = f"""
+CREATE TABLE IF NOT EXISTS {CAPABILITY_TABLE} (
+    ModelName TEXT,
+    Name_ TEXT,
+    measure TEXT,
+    count INTEGER,
+    mean REAL,
+    std REAL,
+    lsl REAL,
+    usl REAL,
+    cp REAL,
+    cpk REAL,
+    sigma_level REAL,
+    yield_rate REAL,
+    ppm REAL,
+    expected_ppm REAL,
+    computed_at TEXT,
+    PRIMARY KEY (ModelName, Name_, measure)
+)
+"""
+
+# 相对均值小于这个比例的标准差视为浮点舍入噪声
+NOISE_RATIO = 1e-12
+
+_normal_tail = np.frompyfunc(lambda z: 0.5 * math.erfc(z / math.sqrt(2)), 1, 1)
+
+
+def capability_indices(count, total, squared_deviations, lsl, usl, out_of_spec):
+    """由各分组的计数、和、离差平方和、规格上下限和超规格数向量化计算能力指标
+
+    上下限相等或标准差为 0 时 Cp/Cpk/Sigma 水平为 NaN（不会除零）。
+    """
+    count = np.asarray(count, dtype=np.float64)
+    lsl = np.asarray(lsl, dtype=np.float64)
+    usl = np.asarray(usl, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.asarray(total, dtype=np.float64) / count
+        # 样本标准差（n - 1）
+        std = np.sqrt(np.asarray(squared_deviations, dtype=np.float64) / (count - 1))
+        # 所有值相同时均值的舍入误差会留下 1e-17 量级的标准差，按 0 处理，否则 Cp/Cpk 会是天文数字
+        std = np.where(std <= np.abs(mean) * NOISE_RATIO, 0.0, std)
+        valid = (count > 1) & (usl > lsl) & (std > 0)
+        safe_std = np.where(valid, std, 1.0)
+        cp = np.where(valid, (usl - lsl) / (6 * safe_std), np.nan)
+        z_upper = (usl - mean) / safe_std
+        z_lower = (mean - lsl) / safe_std
+        cpk = np.where(valid, np.minimum(z_upper, z_lower) / 3, np.nan)
+        expected = np.where(valid, (_normal_tail(z_upper).astype(np.float64)
+                                    + _normal_tail(z_lower).astype(np.float64)) * 1e6, np.nan)
+        yield_rate = 1 - np.asarray(out_of_spec, dtype=np.float64) / count
+    return {
+        'count': count.astype(np.int64),
+        'mean': mean,
+        'std': std,
+        'lsl': lsl,
+        'usl': usl,
+        'cp': cp,
+        'cpk': cpk,
+        'sigma_level': cpk * 3,
+        'yield_rate': yield_rate,
+        'ppm': (1 - yield_rate) * 1e6,
+        'expected_ppm': expected,
+    }
+
+
+def sigma_scores(values, lsl, usl):
+    """逐行偏离规格中心的 Sigma 数（规格宽度的 1/6 为 1 Sigma）；上下限相等的行为 NaN"""
+    values, lsl, usl = (np.asarray(array, dtype=np.float64) for array in (values, lsl, usl))
+    width = usl - lsl
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(width > 0, np.abs(values - (lsl + usl) / 2) / (width / 6), np.nan)
+
+
+def capability_query(table_name, model_name=None):
+    """按 (ModelName, Name_) 分组累计每个测量值所需的量；规格有变化时取最宽的上下限，超规格按每行自己的上下限判断
+
+    离差以与 capability_indices 相同的均值（和 / 行数）为基准，由内层窗口函数按分组算出。
+    """
+    columns = ['ModelName', 'Name_']
+    parts = []
+    for measure, low, high in CAPABILITY_MEASURES:
+        columns += [measure, low, high, f"SUM({measure}) OVER w * 1.0 / COUNT(*) OVER w AS {measure}_mean"]
+        deviation = f"({measure} - {measure}_mean)"
+        parts.append(f"SUM({measure}), SUM({deviation} * {deviation}), MIN({low}), MAX({high}), "
+                     f"SUM({measure} < {low} OR {measure} > {high})")
+    where = "WHERE ModelName = ?" if model_name is not None else ""
+    return f"""
+    SELECT ModelName, Name_, COUNT(*), {', '.join(parts)}
+    FROM (
+        SELECT {', '.join(columns)}
+        FROM {table_name}
+        {where}
+        WINDOW w AS (PARTITION BY ModelName, Name_)
+    )
+    GROUP BY ModelName, Name_
+    ORDER BY ModelName, Name_
+    """
+
+
+def compute_capability(conn, table_name='optimized_data', model_name=None, store=True):
+    """计算所有（或指定模型的）位置的过程能力，返回 [(模型, 位置, 测量名, {指标})]；store 为真时写入能力表"""
+    params = (model_name,) if model_name is not None else ()
+    rows = conn.execute(capability_query(table_name, model_name), params).fetchall()
+    if not rows:
+        return []
+    data = np.array([row[2:] for row in rows], dtype=np.float64)
+    results = []
+    for i, (measure, _, _) in enumerate(CAPABILITY_MEASURES):
+        base = 1 + i * 5
+        indices = capability_indices(data[:, 0], data[:, base], data[:, base + 1], data[:, base + 2],
+                                     data[:, base + 3], data[:, base + 4])
+        for g, row in enumerate(rows):
+            results.append((row[0], row[1], measure, {field: indices[field][g].item() for field in CAPABILITY_FIELDS}))
+    if store:
+        store_capability(conn, results, model_name)
+    return results
+
+
+def store_capability(conn, results, model_name=None):
+    """替换能力表中对应模型（或全部）的结果"""
+    conn.execute(CREATE_CAPABILITY_SQL)
+    if model_name is None:
+        conn.execute(f"DELETE FROM {CAPABILITY_TABLE}")
+    else:
+        conn.execute(f"DELETE FROM {CAPABILITY_TABLE} WHERE ModelName = ?", (model_name,))
+    computed_at = time.strftime('%Y-%m-%d %H:%M:%S')
+    conn.executemany(
+        f"INSERT INTO {CAPABILITY_TABLE} VALUES ({', '.join(['?' for _ in range(len(CAPABILITY_FIELDS) + 4)])})",
+        [(model, location, measure) + tuple(None if isinstance(stats[field], float) and math.isnan(stats[field])
+                                            else stats[field] for field in CAPABILITY_FIELDS) + (computed_at,)
+         for model, location, measure, stats in results])
+    conn.commit()
+
+
+def capability_lookup(results):
+    """把结果转为 {(位置, 测量名): 指标}，便于绘图时标注"""
+    return {(location, measure): stats for _, location, measure, stats in results}
+
+
+def format_capability(results, limit=None):
+    """按 Cpk 从低到高排列的文本报告（Cpk 无法计算的排在最后）"""
+    ordered = sorted(results, key=lambda item: (math.isnan(item[3]['cpk']), item[3]['cpk']))
+    lines = [f"{'模型':<12}{'位置':<10}{'测量':<11}{'数量':>8}{'均值':>11}{'标准差':>11}"
+             f"{'Cp':>8}{'Cpk':>8}{'Sigma':>8}{'良率':>9}{'PPM':>10}"]
+    for model, location, measure, stats in ordered[:limit]:
+        lines.append(f"{model:<12}{location:<10}{measure:<11}{stats['count']:>8}{stats['mean']:>11.4f}"
+                     f"{stats['std']:>11.4f}{stats['cp']:>8.2f}{stats['cpk']:>8.2f}{stats['sigma_level']:>8.2f}"
+                     f"{stats['yield_rate']:>9.2%}{stats['ppm']:>10.0f}")
+    return "\n".join(lines)
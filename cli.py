@@ -0,0 +1,270 @@
+"""无界面的批处理入口，可在定时任务或服务器上运行（不创建任何 tkinter 控件）
+
+    python cli.py import <CSV目录> [--db avisql_single.db] [--chunk-size 1000] [--workers 4] [--adaptive] [--metrics-dir output]
+    python cli.py report [模型名 ...] [--db avisql_single.db] [--output output] [--workers 4] [--shared-js] [--since 2024-07-01]
+    python cli.py capability [模型名 ...] [--limit 20] [--db avisql_single.db] [--since 2024-07-01] [--until 2024-07-31]
+    python cli.py advise [--create [--covering]] [--db avisql_single.db]
+    python cli.py partitions [--drop 2024-01 ...] [--before 2024-06] [--db avisql_single.db]
+    python cli.py expand [--db avisql_single.db]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+from csv_processor_helpers import PerformanceMonitor
+from database_manager import DatabaseManager
+from import_pipeline import ImportPipeline
+from distribution_report import write_reports
+from query_indexes import advise, ensure_covering_indexes, index_sizes
+from capability import compute_capability, format_capability
+from partitions import UNDATED, PartitionStore, default_partition_directory
+from compact_schema import CompactStore, table_exists
+from model_catalog import CatalogCache
+
+
+def find_csv_files(directory):
+    for root, _, files in os.walk(directory):
+        for file in sorted(files):
+            if file.endswith('.csv'):
+                yield os.path.join(root, file)
+
+
+def format_stats(stats):
+    return (f"耗时 {stats['elapsed_time']:.2f} 秒，文件 {stats['files_processed']} 个，"
+            f"行 {stats['rows_processed']} 行，平均 {stats['avg_speed']:.0f} 行/秒")
+
+
+def format_stages(report):
+    """PerformanceMonitor.report() 中各阶段的耗时和写入/提交延迟，每行一项"""
+    lines = [f"  {name}: {values['seconds']:.2f} 秒，{values['calls']} 次，{values['rows']} 行"
+             for name, values in report['stages'].items()]
+    lines += [f"  {name} 延迟: p50 ≤ {values['p50']} 秒，p95 ≤ {values['p95']} 秒，p99 ≤ {values['p99']} 秒"
+              for name, values in report['latency'].items()]
+    return '\n'.join(lines)
+
+
+def run_import(args):
+    db_manager = DatabaseManager(sqlite3.connect(args.db))
+    db_manager.conn.execute("PRAGMA journal_mode=WAL")
+    if args.storage_schema == 'wide':
+        db_manager.create_data_table(args.table)
+    db_manager.close()
+
+    csv_files = list(find_csv_files(args.directory))
+    print(f"找到 {len(csv_files)} 个CSV文件")
+    performance_monitor = PerformanceMonitor()
+    pipeline = ImportPipeline(
+        args.db,
+        table_name=args.table,
+        chunk_size=args.chunk_size,
+        max_workers=args.workers,
+        parse_mode=args.parse_mode,
+        performance_monitor=performance_monitor,
+        use_manifest=not args.no_manifest,
+        deduplicate=not args.no_dedup,
+        bulk_load=args.bulk,
+        storage_schema=args.storage_schema,
+        metrics_dir=args.metrics_dir or None,
+        adaptive=args.adaptive,
+        on_log=(lambda message: None) if args.quiet else print
+    )
+    stats = pipeline.run(csv_files)
+    print(f"导入完成：{format_stats(stats)}")
+    print(format_stages(performance_monitor.report()))
+    return 0
+
+
+def data_source(db_manager, args):
+    """报告和能力分析查询的数据来源
+
+    主库中没有数据表、旁边有分区目录时按月分区存储处理：附加 --since/--until 范围内的分区，
+    返回可放在 FROM 后面的子查询；否则返回 --table 本身。数据来源不可读时抛出 sqlite3.Error 或 ValueError。
+    """
+    conn = db_manager.conn
+    directory = default_partition_directory(conn)
+    if (table_exists(conn, args.table) or table_exists(conn, args.table, 'view')
+            or directory is None or not os.path.isdir(directory)):
+        table = args.table
+    else:
+        store = PartitionStore(conn, directory, args.table)
+        db_manager.use_partitions(store)
+        table = store.range_table(args.since, args.until)
+    # execute_query 会吞掉查询错误，先确认数据来源可读
+    conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchall()
+    return table
+
+
+def open_data_source(args):
+    """返回 (db_manager, 数据来源)；出错时打印原因并返回 (None, None)"""
+    db_manager = DatabaseManager(sqlite3.connect(args.db))
+    try:
+        return db_manager, data_source(db_manager, args)
+    except (sqlite3.Error, ValueError) as e:
+        print(f"读取 {args.table} 时出错: {e}", file=sys.stderr)
+        db_manager.close()
+        return None, None
+
+
+def run_report(args):
+    db_manager, table = open_data_source(args)
+    if db_manager is None:
+        return 1
+    # 模型列表读导入时维护的模型目录，不扫描原始数据
+    models = args.models or CatalogCache().models(db_manager.conn)
+    if not models:
+        print("模型目录为空或尚未建立：先用 cli.py import 导入，或直接指定模型名", file=sys.stderr)
+        db_manager.close()
+        return 1
+    start = time.time()
+    reports = write_reports(db_manager, models, args.output, args.rows_per_page, table, args.workers,
+                            'directory' if args.shared_js else True,
+                            on_model=lambda model_name, paths: print(f"{model_name}: 生成 {len(paths)} 页"))
+    db_manager.close()
+    elapsed = time.time() - start
+    pages = sum(len(paths) for paths in reports.values())
+    print(f"报告完成：{len(models)} 个模型，{pages} 页，耗时 {elapsed:.2f} 秒，"
+          f"索引页 {os.path.join(args.output, 'index.html')}")
+    return 0 if pages else 1
+
+
+def run_capability(args):
+    db_manager, table = open_data_source(args)
+    if db_manager is None:
+        return 1
+    start = time.time()
+    results = []
+    try:
+        for model_name in args.models or [None]:
+            results += compute_capability(db_manager.conn, table, model_name)
+    except sqlite3.Error as e:
+        print(f"计算过程能力时出错: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db_manager.close()
+    print(format_capability(results, args.limit))
+    print(f"共 {len(results)} 项，耗时 {time.time() - start:.2f} 秒，结果已写入 process_capability 表")
+    return 0 if results else 1
+
+
+def run_advise(args):
+    conn = sqlite3.connect(args.db)
+    if args.create:
+        created = ensure_covering_indexes(conn, args.table, covering=args.covering)
+        print(f"已创建索引: {', '.join(created)}" if created else "索引已存在")
+    sizes = index_sizes(conn, args.table)
+    if sizes is not None:
+        table_bytes, indexes = sizes
+        print(f"数据表 {table_bytes / 1024 / 1024:.1f} MB")
+        for name, index_bytes in indexes:
+            share = f"，为数据表的 {index_bytes / table_bytes:.0%}" if table_bytes else ""
+            print(f"    {name}: {index_bytes / 1024 / 1024:.1f} MB{share}")
+    full_scans = 0
+    for name, access, details in advise(conn, args.table):
+        print(f"{name}: {access}")
+        for detail in details:
+            print(f"    {detail}")
+        full_scans += access == '全表扫描'
+    conn.close()
+    print(f"共 {full_scans} 个查询为全表扫描")
+    return 1 if full_scans else 0
+
+
+def run_partitions(args):
+    db_manager = DatabaseManager(sqlite3.connect(args.db))
+    store = PartitionStore(db_manager.conn, default_partition_directory(db_manager.conn), args.table)
+    db_manager.use_partitions(store)
+    drops = list(args.drop)
+    if args.before:
+        drops += [month for month in store.months() if month != UNDATED and month < args.before]
+    for month in drops:
+        print(f"已删除分区 {month}：{db_manager.drop_partition(month)} 行")
+    for month in store.months():
+        store.attach([month])
+        rows = db_manager.execute_query(f"SELECT COUNT(*) FROM {store.attached[month]}.{args.table}")[0][0]
+        print(f"{month}: {rows} 行，{os.path.getsize(store.path(month)) / 1024 / 1024:.1f} MB")
+    db_manager.close()
+    return 0
+
+
+def run_expand(args):
+    conn = sqlite3.connect(args.db)
+    if not table_exists(conn, args.table, 'view'):
+        print(f"{args.table} 不是紧凑存储的兼容视图，无需还原")
+        conn.close()
+        return 1
+    start = time.time()
+    restored = CompactStore(conn).expand(args.table)
+    conn.close()
+    print(f"已把 {restored} 行还原到宽表 {args.table}，耗时 {time.time() - start:.2f} 秒")
+    return 0
+
+
+def add_range_arguments(parser):
+    parser.add_argument('--since', metavar='YYYY-MM-DD', help="按月分区存储时只读取这一天及以后的数据")
+    parser.add_argument('--until', metavar='YYYY-MM-DD', help="按月分区存储时只读取这一天及以前的数据")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="AVI CSV 导入与报告批处理工具")
+    parser.add_argument('--db', default='avisql_single.db', help="SQLite 数据库文件路径")
+    parser.add_argument('--table', default='optimized_data', help="数据表（或兼容视图）名")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help="导入目录树下的所有CSV文件")
+    import_parser.add_argument('directory', help="CSV 文件目录")
+    import_parser.add_argument('--chunk-size', type=int, default=1000, help="CSV 读取块大小")
+    import_parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help="解析进程数")
+    import_parser.add_argument('--parse-mode', choices=['columnar', 'row'], default='columnar')
+    import_parser.add_argument('--storage-schema', choices=['wide', 'compact', 'partitioned'], default='wide')
+    import_parser.add_argument('--bulk', action='store_true', help="批量导入模式")
+    import_parser.add_argument('--adaptive', action='store_true',
+                               help="按实测写入/提交延迟和内存自动调整块大小和提交批量（--chunk-size 为初始值）")
+    import_parser.add_argument('--no-manifest', action='store_true', help="忽略导入清单，重新读取所有文件")
+    import_parser.add_argument('--no-dedup', action='store_true', help="不做行指纹去重")
+    import_parser.add_argument('--quiet', action='store_true', help="不输出每个文件的日志")
+    import_parser.add_argument('--metrics-dir', default='output',
+                               help="分阶段性能指标（JSON 和 Prometheus 文本）的输出目录，空字符串表示不导出")
+    import_parser.set_defaults(handler=run_import)
+
+    report_parser = subparsers.add_parser('report', help="把各模型的分布图写成 HTML")
+    report_parser.add_argument('models', nargs='*', help="模型名，留空表示全部模型")
+    report_parser.add_argument('--output', default='output', help="输出目录")
+    report_parser.add_argument('--rows-per-page', type=int, default=10, help="每页测量位置数")
+    report_parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help="生成页面的进程数")
+    report_parser.add_argument('--shared-js', action='store_true',
+                               help="plotly.js 只在输出目录保存一份（默认每个页面内嵌，可单独打开）")
+    add_range_arguments(report_parser)
+    report_parser.set_defaults(handler=run_report)
+
+    capability_parser = subparsers.add_parser('capability', help="计算各位置的 Cp/Cpk/PPM 并写入能力表")
+    capability_parser.add_argument('models', nargs='*', help="模型名，留空表示全部模型")
+    capability_parser.add_argument('--limit', type=int, default=20, help="只显示 Cpk 最低的前几项")
+    add_range_arguments(capability_parser)
+    capability_parser.set_defaults(handler=run_capability)
+
+    advise_parser = subparsers.add_parser('advise', help="检查绘图和统计查询的执行计划，报告全表扫描")
+    advise_parser.add_argument('--create', action='store_true', help="先创建缺少的查询索引")
+    advise_parser.add_argument('--covering', action='store_true',
+                               help="与 --create 一起使用，同时创建含测量值和规格上下限的完整覆盖索引"
+                                    "（绘图查询不必回表，但大小接近数据表本身）")
+    advise_parser.set_defaults(handler=run_advise)
+
+    partitions_parser = subparsers.add_parser('partitions', help="列出按月分区，删除旧月份")
+    partitions_parser.add_argument('--drop', nargs='*', default=[], metavar='YYYY-MM', help="要删除的月份")
+    partitions_parser.add_argument('--before', metavar='YYYY-MM', help="删除早于该月份的所有分区")
+    partitions_parser.set_defaults(handler=run_partitions)
+
+    expand_parser = subparsers.add_parser('expand', help="把紧凑存储还原为宽表（--storage-schema compact 的逆操作）")
+    expand_parser.set_defaults(handler=run_expand)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import csv
+from itertools import islice
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+from csv_processor_helpers import CSVReader, CSV_COLUMNS, FLOAT_COLUMNS, timed
+
+
+class ColumnarCSVReader(CSVReader):
+    """按列读取CSV，每个块直接生成类型化的列数组，不再逐行构造字典"""
+
+    def read_in_chunks(self, file_path: str) -> Iterator[Dict[str, np.ndarray]]:
+        with open(file_path, 'r', newline='', encoding='utf-8-sig') as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader, None)
+            if not header:
+                return
+            while True:
+                rows = list(islice(reader, self.chunk_size))
+                if not rows:
+                    break
+                yield validate_csv_columns(rows, header)
+
+    def parse_lines(self, header: List[str], lines: List[str]) -> Dict[str, np.ndarray]:
+        with timed(self.monitor, 'parse', rows=len(lines)):
+            rows = list(csv.reader(lines))
+        with timed(self.monitor, 'validate', rows=len(rows)):
+            return validate_csv_columns(rows, header)
+
+
+def validate_csv_columns(rows: List[List[str]], header: List[str]) -> Dict[str, np.ndarray]:
+    """验证并转换一个块的CSV数据，返回按列组织的数组（与 validate_csv_row 规则相同）"""
+    index = {name: i for i, name in enumerate(header)}
+    width = len(header)
+    # 与 csv.DictReader 一样跳过空行；缺失字段补空串，使数值列同样报转换错误
+    rows = [row if len(row) >= width else row + [''] * (width - len(row)) for row in rows if row]
+    count = len(rows)
+
+    columns = {}
+    for name in CSV_COLUMNS:
+        i = index.get(name)
+        if name in FLOAT_COLUMNS:
+            if i is None:
+                columns[name] = np.zeros(count, dtype=np.float64)
+                continue
+            try:
+                columns[name] = np.array([row[i] for row in rows], dtype=np.float64)
+            except ValueError as e:
+                raise ValueError(f"数据转换错误: {e}")
+        else:
+            if i is None:
+                columns[name] = np.full(count, '', dtype=object)
+            else:
+                columns[name] = np.array([row[i] for row in rows], dtype=object)
+    return columns
+
+
+def column_count(columns: Dict[str, np.ndarray]) -> int:
+    """返回列块中的行数"""
+    return len(next(iter(columns.values()))) if columns else 0
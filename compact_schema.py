@@ -0,0 +1,313 @@
+import calendar
+import time
+
+import numpy as np
+
+from csv_processor_helpers import CSV_COLUMNS
+from database_manager import CREATE_DATA_TABLE_SQL
+from dedup import (FINGERPRINT_VERSION_TABLE, backfill_fingerprints, fingerprint_index_name, insert_deduplicated,
+                   reset_outdated_fingerprints, row_fingerprints)
+
+COMPACT_TABLE = 'compact_data'
+# 以整数编码存储的重复字符串列
+ENCODED_COLUMNS = ['Status_V', 'Status_A', 'Status_O', 'Status_VAO', 'RResult', 'Result']
+LIMIT_COLUMNS = ['V_Min', 'V_Max', 'A_Min', 'A_Max', 'Offset_Min', 'Offset_Max']
+# 非 ISO 格式的 Time 逐个尝试这些格式
+TIME_FORMATS = ['%Y/%m/%d %H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y/%m/%d %H:%M', '%Y-%m-%d %H:%M', '%Y%m%d%H%M%S']
+# 能由时间戳按这些格式原样还原的 Time 只存时间戳和格式，其余保留原文
+STORED_TIME_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y/%m/%d %H:%M:%S']
+COMPACT_TABLES = ['compact_data', 'compact_spec_limits', 'compact_strings', 'compact_barcodes']
+
+CREATE_COMPACT_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS compact_strings (
+        id INTEGER PRIMARY KEY,
+        value TEXT UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS compact_barcodes (
+        id INTEGER PRIMARY KEY,
+        value TEXT UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS compact_spec_limits (
+        spec_id INTEGER PRIMARY KEY,
+        model_id INTEGER,
+        name_id INTEGER,
+        V_Min REAL,
+        V_Max REAL,
+        A_Min REAL,
+        A_Max REAL,
+        Offset_Min REAL,
+        Offset_Max REAL,
+        UNIQUE(model_id, name_id, V_Min, V_Max, A_Min, A_Max, Offset_Min, Offset_Max)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS compact_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts INTEGER,
+        barcode_id INTEGER,
+        spec_id INTEGER,
+        Status_V INTEGER,
+        V_Current REAL,
+        Status_A INTEGER,
+        A_Current REAL,
+        Status_O INTEGER,
+        Offset REAL,
+        Status_VAO INTEGER,
+        RResult INTEGER,
+        Result INTEGER,
+        RowHash INTEGER,
+        time_format INTEGER,
+        time_text TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_compact_data_spec ON compact_data (spec_id)",
+    f"CREATE INDEX IF NOT EXISTS {fingerprint_index_name(COMPACT_TABLE)} ON compact_data (RowHash)",
+]
+
+# 兼容视图：列名与 optimized_data/all_data 一致，现有查询无需修改。
+# 规格表及模型、位置名用内连接，按 ModelName/Name_ 过滤时可以先查规格再按 spec_id 走索引；
+# 其余字典列用 LEFT JOIN 连接主键，查询没有用到的列对应的连接会被 SQLite 省掉。
+# Time 优先取保留的原文，否则按存储的格式由时间戳还原
+CREATE_VIEW_SQL = """
+CREATE VIEW IF NOT EXISTS {view_name} AS
+SELECT d.id AS id,
+       COALESCE(d.time_text, strftime(tf.value, d.ts, 'unixepoch')) AS Time,
+       b.value AS BarCode,
+       m.value AS ModelName,
+       n.value AS Name_,
+       sv.value AS Status_V,
+       d.V_Current AS V_Current,
+       s.V_Min AS V_Min,
+       s.V_Max AS V_Max,
+       sa.value AS Status_A,
+       d.A_Current AS A_Current,
+       s.A_Min AS A_Min,
+       s.A_Max AS A_Max,
+       so.value AS Status_O,
+       d.Offset AS Offset,
+       s.Offset_Min AS Offset_Min,
+       s.Offset_Max AS Offset_Max,
+       svao.value AS Status_VAO,
+       rr.value AS RResult,
+       r.value AS Result,
+       d.RowHash AS RowHash
+FROM compact_data d
+JOIN compact_spec_limits s ON s.spec_id = d.spec_id
+JOIN compact_strings m ON m.id = s.model_id
+JOIN compact_strings n ON n.id = s.name_id
+LEFT JOIN compact_barcodes b ON b.id = d.barcode_id
+LEFT JOIN compact_strings sv ON sv.id = d.Status_V
+LEFT JOIN compact_strings sa ON sa.id = d.Status_A
+LEFT JOIN compact_strings so ON so.id = d.Status_O
+LEFT JOIN compact_strings svao ON svao.id = d.Status_VAO
+LEFT JOIN compact_strings rr ON rr.id = d.RResult
+LEFT JOIN compact_strings r ON r.id = d.Result
+LEFT JOIN compact_strings tf ON tf.id = d.time_format
+"""
+
+
+def parse_epoch(times):
+    """把 Time 文本转换为整数时间戳（按 UTC 解释）；无法解析的为 None"""
+    values = np.asarray(times, dtype=object).astype(str)
+    try:
+        stamps = np.array(values, dtype='datetime64[s]')
+        epochs = stamps.astype(np.int64).astype(object)
+        epochs[np.isnat(stamps)] = None
+        return epochs
+    except ValueError:
+        pass
+    uniques, inverse = np.unique(values, return_inverse=True)
+    parsed = np.empty(len(uniques), dtype=object)
+    for i, value in enumerate(uniques):
+        parsed[i] = None
+        for fmt in TIME_FORMATS:
+            try:
+                parsed[i] = calendar.timegm(time.strptime(value.strip(), fmt))
+                break
+            except ValueError:
+                continue
+    return parsed[inverse.reshape(-1)]
+
+
+def split_times(times):
+    """把 Time 文本拆成 (时间戳, 格式, 原文)，三者都与 times 对齐
+
+    时间戳按 STORED_TIME_FORMATS 之一格式化后与原文完全相同时，原文为 None；
+    否则（无法解析、带其他格式或多余空白等）格式为 None，原文原样保留。
+    """
+    values = np.asarray(times, dtype=object).astype(str)
+    epochs = parse_epoch(values)
+    formats = np.full(len(values), None, dtype=object)
+    texts = values.astype(object)
+    valid = np.flatnonzero([epoch is not None for epoch in epochs])
+    if len(valid):
+        stamps = np.array(epochs[valid].tolist(), dtype=np.int64).astype('datetime64[s]')
+        rendered = np.char.replace(np.datetime_as_string(stamps, unit='s'), 'T', ' ')
+        pending = np.ones(len(valid), dtype=bool)
+        for fmt, candidate in zip(STORED_TIME_FORMATS, (rendered, np.char.replace(rendered, '-', '/'))):
+            same = pending & (candidate == values[valid])
+            formats[valid[same]] = fmt
+            texts[valid[same]] = None
+            pending &= ~same
+    return epochs, formats, texts
+
+
+def table_exists(conn, name, kind='table'):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = ? AND name = ?", (kind, name)).fetchone() is not None
+
+
+class CompactStore:
+    """紧凑存储：重复字符串整数编码、规格上下限单独成表、时间存为整数时间戳（不能原样还原的保留原文）"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.string_ids = {}
+        self.spec_ids = {}
+
+    def create_schema(self, view_name):
+        """创建紧凑存储和名为 view_name 的兼容视图；同名宽表已存在时先迁移其数据，返回迁移行数"""
+        for sql in CREATE_COMPACT_SQL:
+            self.conn.execute(sql)
+        existing = [row[1] for row in self.conn.execute(f"PRAGMA table_info({COMPACT_TABLE})")]
+        upgraded = 'time_format' not in existing
+        if upgraded:
+            self.conn.execute(f"ALTER TABLE {COMPACT_TABLE} ADD COLUMN time_format INTEGER")
+            self.conn.execute(f"ALTER TABLE {COMPACT_TABLE} ADD COLUMN time_text TEXT")
+        # 视图定义可能来自旧版本，每次都重建
+        if table_exists(self.conn, view_name, 'view'):
+            self.conn.execute(f"DROP VIEW {view_name}")
+        # 旧版本的指纹先清空，迁移和建视图之后经兼容视图按原始字段重新计算
+        reset = reset_outdated_fingerprints(self.conn, view_name, COMPACT_TABLE)
+        self.load_caches()
+        if upgraded:
+            # 旧版本的行只有时间戳，原视图按 ISO 格式显示，这里记下同样的格式
+            format_id = self._encode([STORED_TIME_FORMATS[0]], 'compact_strings', self.string_ids)[0]
+            self.conn.execute(f"UPDATE {COMPACT_TABLE} SET time_format = ? WHERE ts IS NOT NULL", (int(format_id),))
+        self.conn.commit()
+        migrated = 0
+        if table_exists(self.conn, view_name):
+            migrated = self.migrate(view_name)
+        else:
+            self.conn.execute(CREATE_VIEW_SQL.format(view_name=view_name))
+        if reset:
+            backfill_fingerprints(self.conn, view_name, target_table=COMPACT_TABLE)
+        self.conn.commit()
+        return migrated
+
+    def load_caches(self):
+        """从数据库重新加载编码缓存（回滚后缓存中可能有已失效的 id）"""
+        self.string_ids = dict((value, id_) for id_, value in
+                               self.conn.execute("SELECT id, value FROM compact_strings"))
+        self.spec_ids = {row[1:]: row[0] for row in self.conn.execute(
+            f"SELECT spec_id, model_id, name_id, {', '.join(LIMIT_COLUMNS)} FROM compact_spec_limits")}
+
+    def _encode(self, values, table, cache=None):
+        """字典编码：按块内不同取值查找或新增 id，返回与 values 对齐的 id 数组"""
+        uniques, inverse = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True)
+        uniques = uniques.tolist()
+        if cache is None:
+            cache = {}
+        missing = [value for value in uniques if value not in cache]
+        if missing:
+            self.conn.executemany(f"INSERT OR IGNORE INTO {table} (value) VALUES (?)",
+                                  [(value,) for value in missing])
+            for start in range(0, len(missing), 500):
+                batch = missing[start:start + 500]
+                cache.update((value, id_) for id_, value in self.conn.execute(
+                    f"SELECT id, value FROM {table} WHERE value IN ({', '.join(['?' for _ in batch])})", batch))
+        ids = np.array([cache[value] for value in uniques], dtype=np.int64)
+        return ids[inverse.reshape(-1)]
+
+    def _encode_specs(self, model_ids, name_ids, columns):
+        keys = np.column_stack([model_ids, name_ids] + [np.asarray(columns[name], dtype=np.float64)
+                                                        for name in LIMIT_COLUMNS])
+        uniques, inverse = np.unique(keys, axis=0, return_inverse=True)
+        spec_ids = np.empty(len(uniques), dtype=np.int64)
+        for i, row in enumerate(uniques.tolist()):
+            key = (int(row[0]), int(row[1])) + tuple(row[2:])
+            if key not in self.spec_ids:
+                self.conn.execute(
+                    f"INSERT OR IGNORE INTO compact_spec_limits (model_id, name_id, {', '.join(LIMIT_COLUMNS)}) "
+                    f"VALUES ({', '.join(['?' for _ in key])})", key)
+                self.spec_ids[key] = self.conn.execute(
+                    f"SELECT spec_id FROM compact_spec_limits WHERE model_id = ? AND name_id = ? AND "
+                    f"{' AND '.join(f'{name} = ?' for name in LIMIT_COLUMNS)}", key).fetchone()[0]
+            spec_ids[i] = self.spec_ids[key]
+        return spec_ids[inverse.reshape(-1)]
+
+    def insert_columns(self, columns):
+        """编码并按行指纹去重插入一个列式数据块（不提交），返回新增行在块中的位置数组"""
+        if not columns or not len(columns['V_Current']):
+            return np.empty(0, dtype=np.int64)
+        model_ids = self._encode(columns['ModelName'], 'compact_strings', self.string_ids)
+        name_ids = self._encode(columns['Name_'], 'compact_strings', self.string_ids)
+        epochs, formats, texts = split_times(columns['Time'])
+        has_format = np.flatnonzero([fmt is not None for fmt in formats])
+        format_ids = np.full(len(formats), None, dtype=object)
+        if len(has_format):
+            format_ids[has_format] = self._encode(formats[has_format], 'compact_strings', self.string_ids)
+        encoded = {
+            'ts': epochs,
+            'time_format': format_ids,
+            'time_text': texts,
+            'barcode_id': self._encode(columns['BarCode'], 'compact_barcodes'),
+            'spec_id': self._encode_specs(model_ids, name_ids, columns),
+            'V_Current': columns['V_Current'],
+            'A_Current': columns['A_Current'],
+            'Offset': columns['Offset'],
+        }
+        for name in ENCODED_COLUMNS:
+            encoded[name] = self._encode(columns[name], 'compact_strings', self.string_ids)
+        return insert_deduplicated(self.conn, COMPACT_TABLE, encoded, hashes=row_fingerprints(columns))
+
+    def migrate(self, source_table, batch_size=50000):
+        """把宽表数据迁移到紧凑存储，删除原表并以同名兼容视图替代；逆操作见 expand"""
+        cursor = self.conn.execute(f"SELECT {', '.join(CSV_COLUMNS)} FROM {source_table}")
+        migrated = 0
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            columns = {name: np.array([row[i] for row in rows], dtype=object) for i, name in enumerate(CSV_COLUMNS)}
+            migrated += len(self.insert_columns(columns))
+        self.conn.execute(f"DROP TABLE {source_table}")
+        self.conn.execute(CREATE_VIEW_SQL.format(view_name=source_table))
+        self.conn.commit()
+        return migrated
+
+    def expand(self, view_name, batch_size=50000):
+        """migrate 的逆操作：把兼容视图中的数据写回同名宽表，删除视图和紧凑存储表，返回还原行数
+
+        行 id 保持不变；RowHash 不复制，下次导入时 ensure_fingerprint_column 会按宽表补算。
+        """
+        staging = f"{view_name}_expanding"
+        self.conn.execute(f"DROP TABLE IF EXISTS {staging}")
+        self.conn.execute(CREATE_DATA_TABLE_SQL.format(table_name=staging))
+        column_list = ', '.join(['id'] + CSV_COLUMNS)
+        last_id = -1
+        restored = 0
+        while True:
+            # 按 id 分批，避免一次事务过大
+            cursor = self.conn.execute(
+                f"INSERT INTO {staging} ({column_list}) SELECT {column_list} FROM {view_name} "
+                f"WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size))
+            if not cursor.rowcount:
+                break
+            restored += cursor.rowcount
+            last_id = self.conn.execute(f"SELECT MAX(id) FROM {staging}").fetchone()[0]
+            self.conn.commit()
+        self.conn.execute(f"DROP VIEW {view_name}")
+        self.conn.execute(f"ALTER TABLE {staging} RENAME TO {view_name}")
+        for table in COMPACT_TABLES:
+            self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+        if table_exists(self.conn, FINGERPRINT_VERSION_TABLE):
+            self.conn.execute(f"DELETE FROM {FINGERPRINT_VERSION_TABLE} WHERE table_name = ?", (COMPACT_TABLE,))
+        self.conn.commit()
+        self.string_ids = {}
+        self.spec_ids = {}
+        return restored
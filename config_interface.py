@@ -5,7 +5,7 @@ class ConfigInterface(tk.Toplevel):
     def __init__(self, master, current_config):
         super().__init__(master)
         self.title("配置设置")
-        self.geometry("400x300")
+        self.geometry("400x440")
         self.current_config = current_config
         self.result = None
 
@@ -32,15 +32,39 @@ class ConfigInterface(tk.Toplevel):
         self.log_level.set(self.current_config.get('log_level', 'INFO'))
         self.log_level.grid(row=3, column=1, padx=5, pady=5)
 
+        ttk.Label(self, text="解析模式:").grid(row=4, column=0, padx=5, pady=5, sticky="w")
+        self.parse_mode = ttk.Combobox(self, values=["columnar", "row"])
+        self.parse_mode.set(self.current_config.get('parse_mode', 'columnar'))
+        self.parse_mode.grid(row=4, column=1, padx=5, pady=5)
+
+        ttk.Label(self, text="导入模式:").grid(row=5, column=0, padx=5, pady=5, sticky="w")
+        self.import_mode = ttk.Combobox(self, values=["normal", "bulk"])
+        self.import_mode.set(self.current_config.get('import_mode', 'normal'))
+        self.import_mode.grid(row=5, column=1, padx=5, pady=5)
+
+        ttk.Label(self, text="存储结构:").grid(row=6, column=0, padx=5, pady=5, sticky="w")
+        self.storage_schema = ttk.Combobox(self, values=["wide", "compact", "partitioned"])
+        self.storage_schema.set(self.current_config.get('storage_schema', 'wide'))
+        self.storage_schema.grid(row=6, column=1, padx=5, pady=5)
+
+        ttk.Label(self, text="批量大小:").grid(row=7, column=0, padx=5, pady=5, sticky="w")
+        self.batch_mode = ttk.Combobox(self, values=["adaptive", "fixed"])
+        self.batch_mode.set(self.current_config.get('batch_mode', 'adaptive'))
+        self.batch_mode.grid(row=7, column=1, padx=5, pady=5)
+
         save_button = ttk.Button(self, text="保存", command=self.save_config)
-        save_button.grid(row=4, column=0, columnspan=2, pady=20)
+        save_button.grid(row=8, column=0, columnspan=2, pady=20)
 
     def save_config(self):
         self.result = {
             'chunk_size': int(self.chunk_size.get()),
             'db_path': self.db_path.get(),
             'max_threads': int(self.max_threads.get()),
-            'log_level': self.log_level.get()
+            'log_level': self.log_level.get(),
+            'parse_mode': self.parse_mode.get(),
+            'import_mode': self.import_mode.get(),
+            'storage_schema': self.storage_schema.get(),
+            'batch_mode': self.batch_mode.get()
         }
         self.destroy()
 
@@ -0,0 +1,90 @@
+"""一个写连接 + 多个只读 WAL 连接的连接池
+
+写连接由 DatabaseManager 的写锁保护；读连接按线程借出，同一线程嵌套借用时复用同一个连接。
+WAL 模式下读连接读取已提交的快照，不会被正在进行的导入阻塞。
+"""
+import pathlib
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+WRITER_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+}
+READER_PRAGMAS = {
+    'query_only': 'ON',
+    'busy_timeout': 5000,
+    'cache_size': -32768,
+    'temp_store': 'MEMORY',
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+
+def apply_pragmas(conn, pragmas):
+    for pragma, value in pragmas.items():
+        conn.execute(f"PRAGMA {pragma}={value}")
+
+
+class ConnectionPool:
+    def __init__(self, db_path, readers=4, writer_pragmas=None, reader_pragmas=None, checkout_timeout=30.0):
+        self.db_path = db_path
+        self.max_readers = max(1, readers)
+        self.reader_pragmas = READER_PRAGMAS if reader_pragmas is None else reader_pragmas
+        self.checkout_timeout = checkout_timeout
+        self.writer = sqlite3.connect(db_path, check_same_thread=False)
+        apply_pragmas(self.writer, WRITER_PRAGMAS if writer_pragmas is None else writer_pragmas)
+        self.idle = queue.LifoQueue()
+        self.readers = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _open_reader(self):
+        # 只读打开；借出后只在借用线程内使用，因此可以关闭同线程检查
+        # 路径按 URI 转义，含 ?、# 或 % 的路径也能打开同一个文件
+        uri = pathlib.Path(self.db_path).resolve().as_uri() + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        apply_pragmas(conn, self.reader_pragmas)
+        return conn
+
+    def _checkout(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if len(self.readers) < self.max_readers:
+                conn = self._open_reader()
+                self.readers.append(conn)
+                return conn
+        # 读连接都已借出时等待归还
+        try:
+            return self.idle.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("等待只读连接超时") from None
+
+    @contextmanager
+    def reader(self):
+        """借出当前线程的只读连接"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self._checkout()
+        self.local.conn = conn
+        try:
+            yield conn
+        finally:
+            self.local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            self.idle.put(conn)
+
+    def close(self):
+        with self.lock:
+            for conn in self.readers:
+                conn.close()
+            self.readers = []
+        self.writer.close()
@@ -2,7 +2,6 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
 import sqlite3
-import csv
 import logging
 import queue
 import threading
@@ -10,6 +9,16 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import numpy as np
 
+from columnar_parser import ColumnarCSVReader
+from csv_processor_helpers import DataAnalyzer
+from dedup import ensure_fingerprint_column, insert_deduplicated
+from import_manifest import create_manifest_table, load_manifest, plan_import, record_import
+from location_summary import LocationSummary
+from model_catalog import CatalogCache, ModelCatalog
+from quantile_sketch import SketchStore
+from query_indexes import ensure_covering_indexes
+from capability import compute_capability, format_capability, sigma_scores
+
 
 class CSVToSQLiteApp:
     def __init__(self, master):
@@ -63,6 +72,7 @@ class CSVToSQLiteApp:
 
         self.stop_event = threading.Event()
         self.message_queue = queue.Queue()
+        self.catalog_cache = CatalogCache()
 
         # 初始化时更新ModelName下拉菜单
         self.update_model_name_combobox()
@@ -75,6 +85,8 @@ class CSVToSQLiteApp:
             self.log_message(f"已选择目录: {self.directory}")
             self.log_message(f"数据库文件将保存为: {self.db_file}")
             print(self.directory)
+            # 换了数据库，缓存的目录代数不再适用
+            self.catalog_cache = CatalogCache()
             self.update_model_name_combobox()
             self.current_dir_label.config(text=f"当前目录: {self.directory}")
 
@@ -84,12 +96,13 @@ class CSVToSQLiteApp:
         conn = self.create_connection(self.db_file)
         if conn is not None:
             try:
-                cursor = conn.cursor()
-                cursor.execute("SELECT DISTINCT ModelName FROM all_data")
-                model_names = [row[0] for row in cursor.fetchall()]
+                # 界面只读目录：目录由导入线程创建和维护（旧库在下次导入时回填），尚未建立时列表为空
+                model_names = self.catalog_cache.models(conn)
                 self.model_name_combobox['values'] = model_names
                 if model_names:
                     self.model_name_combobox.set(model_names[0])
+                elif self.catalog_cache.generation is None:
+                    self.log_message("模型目录尚未建立，执行一次导入后即可选择ModelName")
             except sqlite3.Error as e:
                 self.log_message(f"获取ModelName时出错: {e}")
             finally:
@@ -109,6 +122,8 @@ class CSVToSQLiteApp:
 
         try:
             self.create_table(conn)
+            create_manifest_table(conn)
+            manifest = load_manifest(conn)
             csv_files = [f for f in self.get_all_csv_files(self.directory) if f.endswith('.csv')]
             total_files = len(csv_files)
             self.message_queue.put(("progress_max", total_files))
@@ -116,7 +131,10 @@ class CSVToSQLiteApp:
             for i, file_path in enumerate(csv_files):
                 if self.stop_event.is_set():
                     break
-                self.process_csv(file_path, conn)
+                # 根据导入清单跳过未变化的文件，只追加导入新增的部分
+                action, start_offset, final = plan_import(file_path, manifest)
+                if action != 'skip':
+                    self.process_csv(file_path, conn, start_offset, final)
                 self.message_queue.put(("progress", i + 1))
 
             conn.close()
@@ -142,6 +160,8 @@ class CSVToSQLiteApp:
                     messagebox.showerror("错误", message[1])
                 elif message[0] == "finished":
                     self.execute_button.config(state=tk.NORMAL)
+                    # 导入已创建或更新模型目录
+                    self.update_model_name_combobox()
                     return
                 self.master.update_idletasks()
         except queue.Empty:
@@ -179,12 +199,23 @@ class CSVToSQLiteApp:
             Status_VAO TEXT,
             RResult TEXT,
             Result TEXT,
-            UNIQUE(ModelName, BarCode, V_Current, A_Current, Offset)
+            RowHash INTEGER
         )
         """
         try:
             conn.execute(create_table_sql)
             conn.commit()
+            # 用 64 位行指纹索引去重，替代宽的 UNIQUE 复合索引（旧库会补算指纹）
+            ensure_fingerprint_column(conn, 'all_data')
+            # 绘图查询按 (ModelName, Name_, Result) 过滤，走查找索引
+            ensure_covering_indexes(conn, 'all_data')
+            # 按位置/日期的汇总表与原始数据在同一事务内更新
+            self.location_summary = LocationSummary(conn)
+            self.location_summary.ensure('all_data')
+            self.model_catalog = ModelCatalog(conn)
+            self.model_catalog.ensure('all_data')
+            self.sketch_store = SketchStore(conn)
+            self.sketch_store.ensure('all_data')
             self.message_queue.put(("log", "成功创建数据表"))
         except sqlite3.Error as e:
             self.message_queue.put(("log", f"创建数据表时出错: {e}"))
@@ -195,47 +226,25 @@ class CSVToSQLiteApp:
                 if file.endswith('.csv'):
                     yield os.path.join(root, file)
 
-    def process_csv(self, file_path, conn):
+    def process_csv(self, file_path, conn, start_offset=0, final=True):
         try:
-            with open(file_path, 'r', newline='', encoding='utf-8-sig') as csvfile:
-                csv_reader = csv.DictReader(csvfile)
-                if not csv_reader.fieldnames:
-                    self.message_queue.put(("log", f"警告: 跳过空文件 {file_path}"))
-                    return
-
-                cursor = conn.cursor()
-                cursor.execute("BEGIN TRANSACTION")
-                for row in csv_reader:
-                    cursor.execute("""
-                    INSERT OR IGNORE INTO all_data 
-                    (Time, BarCode, ModelName, Name_, Status_V, V_Current, V_Min, V_Max, 
-                    Status_A, A_Current, A_Min, A_Max, Status_O, Offset, Offset_Min, Offset_Max,
-                    Status_VAO, RResult, Result)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        row.get('Time', ''),
-                        row.get('BarCode', ''),
-                        row.get('ModelName', ''),
-                        row.get('Name_', ''),
-                        row.get('Status_V', ''),
-                        float(row.get('V_Current', '0')),
-                        float(row.get('V_Min', '0')),
-                        float(row.get('V_Max', '0')),
-                        row.get('Status_A', ''),
-                        float(row.get('A_Current', '0')),
-                        float(row.get('A_Min', '0')),
-                        float(row.get('A_Max', '0')),
-                        row.get('Status_O', ''),
-                        float(row.get('Offset', '0')),
-                        float(row.get('Offset_Min', '0')),
-                        float(row.get('Offset_Max', '0')),
-                        row.get('Status_VAO', ''),
-                        row.get('RResult', ''),
-                        row.get('Result', '')
-                    ))
-                conn.commit()
+            reader = ColumnarCSVReader(chunk_size=1000)
+            cursor = conn.cursor()
+            cursor.execute("BEGIN TRANSACTION")
+            for columns in reader.read_from_offset(file_path, start_offset, final):
+                positions = insert_deduplicated(conn, 'all_data', columns)
+                self.location_summary.update(columns, positions)
+                self.model_catalog.update(columns, positions)
+                self.sketch_store.update(columns, positions)
+            if reader.end_offset == 0:
+                self.message_queue.put(("log", f"警告: 跳过空文件 {file_path}"))
+            record_import(conn, file_path, reader.end_offset)
+            conn.commit()
             self.message_queue.put(("log", f"成功处理文件: {file_path}"))
         except Exception as e:
+            conn.rollback()
+            # 回滚丢弃了本次新增的桶范围，内存缓存也要重新加载
+            self.location_summary.load_bin_ranges()
             self.message_queue.put(("log", f"处理文件时出错 {file_path}: {e}"))
 
     def log_message(self, message):
@@ -247,7 +256,7 @@ class CSVToSQLiteApp:
         model_name = self.model_name_var.get()
         if not model_name:
             messagebox.showerror("错误", "请选择ModelName")
-            returnn
+            return
 
         conn = self.create_connection(self.db_file)
         if conn is None:
@@ -255,35 +264,27 @@ class CSVToSQLiteApp:
             return
 
         try:
-            query = """
-            SELECT V_Current, A_Current, Offset FROM all_data WHERE ModelName = ?
-            """
-            cursor = conn.cursor()
-            cursor.execute(query, (model_name,))
-            rows = cursor.fetchall()
-            if not rows:
+            # 桶边界取自汇总表（或 MIN/MAX），数据分批折叠进桶计数，内存不随行数增长
+            histograms = DataAnalyzer.streaming_histograms(conn, 'all_data', model_name)
+            if not histograms:
                 messagebox.showinfo("信息", f"没有找到ModelName为 {model_name} 的数据")
                 return
 
-            v_current_data = [row[0] for row in rows]
-            a_current_data = [row[1] for row in rows]
-            offset_data = [row[2] for row in rows]
-
             fig, axs = plt.subplots(3, 1, figsize=(8, 12))
-            axs[0].hist(v_current_data, bins=50, color='b', alpha=0.7)
-            axs[0].set_title('V_Current Histogram')
-            axs[0].set_xlabel('V_Current')
-            axs[0].set_ylabel('Frequency')
-
-            axs[1].hist(a_current_data, bins=50, color='r', alpha=0.7)
-            axs[1].set_title('A_Current Histogram')
-            axs[1].set_xlabel('A_Current')
-            axs[1].set_ylabel('Frequency')
-
-            axs[2].hist(offset_data, bins=50, color='g', alpha=0.7)
-            axs[2].set_title('Offset Histogram')
-            axs[2].set_xlabel('Offset')
-            axs[2].set_ylabel('Frequency')
+            for ax, measure, color in zip(axs, ('V_Current', 'A_Current', 'Offset'), ('b', 'r', 'g')):
+                if measure in histograms:
+                    histogram = histograms[measure]
+                    ax.stairs(histogram.counts, histogram.edges, fill=True, color=color, alpha=0.7)
+                ax.set_title(f'{measure} Histogram')
+                ax.set_xlabel(measure)
+                ax.set_ylabel('Frequency')
+
+            # 用分位数草图标出整个模型的 P1/P50/P99
+            sketch_store = SketchStore(conn)
+            for ax, measure in zip(axs, ('V_Current', 'A_Current', 'Offset')):
+                for value in sketch_store.model_percentiles(model_name, measure):
+                    if value == value:
+                        ax.axvline(value, color='k', linestyle=':', linewidth=1)
 
             plt.tight_layout()
             plt.show()
@@ -314,21 +315,22 @@ class CSVToSQLiteApp:
                 messagebox.showinfo("信息", f"没有找到ModelName为 {model_name} 的数据")
                 return
 
-            v_current_data = [row[0] for row in rows]
-            v_min_data = [row[1] for row in rows]
-            v_max_data = [row[2] for row in rows]
-            a_current_data = [row[3] for row in rows]
-            offset_data = [row[4] for row in rows]
+            data = np.array(rows, dtype=np.float64)
+            v_current_data = data[:, 0]
+            a_current_data = data[:, 3]
+            offset_data = data[:, 4]
 
-            # 计算V_current的Sigma值
-            v_nominal = [(v_min + v_max) / 2 for v_min, v_max in zip(v_min_data, v_max_data)]
-            v_sigma = [abs(v_current - v_nom) / ((v_max - v_min) / 6) for v_current, v_nom, v_min, v_max in zip(v_current_data, v_nominal, v_min_data, v_max_data)]
+            # 计算V_current的Sigma值（上下限相等的行无法计算，不参与统计）
+            v_sigma = sigma_scores(v_current_data, data[:, 1], data[:, 2])
+            v_sigma = v_sigma[~np.isnan(v_sigma)]
 
             fig, axs = plt.subplots(4, 1, figsize=(10, 20))
             fig.suptitle(f'数据分布图 - {model_name}', fontsize=16)
 
             def plot_distribution_histogram(ax, data, title, xlabel):
-                min_val, max_val = min(data), max(data)
+                if not len(data):
+                    return
+                min_val, max_val = np.min(data), np.max(data)
                 range_val = max_val - min_val
                 extended_min = min_val - 0.3 * range_val
                 extended_max = max_val + 0.3 * range_val
@@ -347,9 +349,11 @@ class CSVToSQLiteApp:
             plt.tight_layout()
             plt.show()
 
-            # 显示V_current的平均Sigma值
-            avg_sigma = sum(v_sigma) / len(v_sigma)
-            messagebox.showinfo("V_Current Sigma", f"V_Current的平均Sigma值: {avg_sigma:.4f}")
+            # 显示V_current的平均Sigma值和各位置中能力最差的几项
+            avg_sigma = v_sigma.mean() if len(v_sigma) else float('nan')
+            capability = compute_capability(conn, 'all_data', model_name)
+            messagebox.showinfo("V_Current Sigma", f"V_Current的平均Sigma值: {avg_sigma:.4f}\n\n"
+                                                   f"Cpk 最低的位置:\n{format_capability(capability, limit=5)}")
 
         except sqlite3.Error as e:
             messagebox.showerror("错误", f"查询数据库时出错: {e}")
@@ -1,10 +1,36 @@
+import bisect
 import csv
-from typing import List, Dict, Any
+import datetime
+import itertools
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import List, Dict, Any, Iterable, Sequence
 import time
 
+import numpy as np
+
+# CSV 文件的标准列布局（与 validate_csv_row 保持一致）
+CSV_COLUMNS = [
+    'Time', 'BarCode', 'ModelName', 'Name_', 'Status_V',
+    'V_Current', 'V_Min', 'V_Max', 'Status_A',
+    'A_Current', 'A_Min', 'A_Max', 'Status_O',
+    'Offset', 'Offset_Min', 'Offset_Max',
+    'Status_VAO', 'RResult', 'Result'
+]
+FLOAT_COLUMNS = [
+    'V_Current', 'V_Min', 'V_Max',
+    'A_Current', 'A_Min', 'A_Max',
+    'Offset', 'Offset_Min', 'Offset_Max'
+]
+
 class CSVReader:
-    def __init__(self, chunk_size: int = 1000):
+    def __init__(self, chunk_size: int = 1000, monitor: 'PerformanceMonitor' = None):
         self.chunk_size = chunk_size
+        # 给出 PerformanceMonitor 时，read_from_offset 记录 read（读文件和解码）阶段，parse_lines 记录 parse 阶段
+        self.monitor = monitor
 
     def read_in_chunks(self, file_path: str) -> List[Dict[str, Any]]:
         with open(file_path, 'r', newline='', encoding='utf-8-sig') as csvfile:
@@ -18,16 +44,145 @@ class CSVReader:
             if chunk:
                 yield chunk
 
+    def read_from_offset(self, file_path: str, start_offset: int = 0, final: bool = True):
+        """从字节偏移处读取完整行（表头始终取自文件开头），self.end_offset 记录已消费到的位置
+
+        final 为 False 时，末尾没有换行符的行视为仍在写入，留待下次读取。
+        """
+        self.end_offset = start_offset
+        with open(file_path, 'rb') as csvfile:
+            header_line = csvfile.readline()
+            if not header_line.strip() or (not final and not header_line.endswith(b'\n')):
+                return
+            header = next(csv.reader([header_line.decode('utf-8-sig')]))
+            offset = max(start_offset, csvfile.tell())
+            csvfile.seek(offset)
+            lines = []
+            read_start = time.perf_counter()
+            for line in csvfile:
+                if not final and not line.endswith(b'\n'):
+                    break
+                offset += len(line)
+                lines.append(line.decode('utf-8'))
+                if len(lines) >= self.chunk_size:
+                    self.end_offset = offset
+                    self._record_read(read_start, len(lines))
+                    yield self.parse_lines(header, lines)
+                    lines = []
+                    read_start = time.perf_counter()
+            self.end_offset = offset
+            if lines:
+                self._record_read(read_start, len(lines))
+                yield self.parse_lines(header, lines)
+
+    def _record_read(self, start: float, rows: int):
+        if self.monitor is not None:
+            self.monitor.record('read', time.perf_counter() - start, rows)
+
+    def parse_lines(self, header: List[str], lines: List[str]) -> List[Dict[str, Any]]:
+        with timed(self.monitor, 'parse', rows=len(lines)):
+            return list(csv.DictReader(lines, fieldnames=header))
+
+# 延迟直方图的桶上界（秒），与 Prometheus 默认桶相近
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 导出指标名的前缀
+METRIC_PREFIX = 'avi_import'
+
+
+class LatencyHistogram:
+    """固定桶的延迟直方图，observe 只做一次二分查找"""
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        """各桶（含 +Inf）的累计计数"""
+        return list(itertools.accumulate(self.counts))
+
+    def quantile(self, q: float) -> float:
+        """按桶上界估算分位数（落在 +Inf 桶时返回最后一个上界）"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for bound, total in zip(LATENCY_BUCKETS, self.cumulative()):
+            if total >= rank:
+                return bound
+        return LATENCY_BUCKETS[-1]
+
+
 class PerformanceMonitor:
+    """导入计数和分阶段计时
+
+    stage()/record() 按阶段累计耗时、调用次数和行数，并按文件分别统计；latency=True 的阶段另记延迟直方图。
+    每次计时只有两次 perf_counter 和一次加锁，按数据块调用，可以在生产环境常开。
+    """
+
     def __init__(self):
         self.start_time = time.time()
         self.file_count = 0
         self.row_count = 0
+        self.stages: Dict[str, List[float]] = {}
+        self.file_stages: Dict[str, Dict[str, List[float]]] = {}
+        self.latencies: Dict[str, LatencyHistogram] = {}
+        self.lock = threading.Lock()
+        # 当前线程正在处理的文件，stage/record 未指定文件时使用
+        self.local = threading.local()
 
     def update(self, file_count: int, row_count: int):
         self.file_count += file_count
         self.row_count += row_count
 
+    @contextmanager
+    def current_file(self, file_name: str):
+        """在这个范围内记录的阶段（包括 DatabaseManager 记录的写入和提交）都计入 file_name"""
+        previous = getattr(self.local, 'file_name', None)
+        self.local.file_name = file_name
+        try:
+            yield
+        finally:
+            self.local.file_name = previous
+
+    @contextmanager
+    def stage(self, name: str, rows: int = 0, latency: bool = False, file_name: str = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, rows, latency=latency, file_name=file_name)
+
+    def record(self, name: str, seconds: float, rows: int = 0, calls: int = 1, latency: bool = False,
+               file_name: str = None):
+        file_name = file_name or getattr(self.local, 'file_name', None)
+        with self.lock:
+            totals = self.stages.setdefault(name, [0.0, 0, 0])
+            totals[0] += seconds
+            totals[1] += calls
+            totals[2] += rows
+            if file_name is not None:
+                totals = self.file_stages.setdefault(file_name, {}).setdefault(name, [0.0, 0, 0])
+                totals[0] += seconds
+                totals[1] += calls
+                totals[2] += rows
+            if latency:
+                self.latencies.setdefault(name, LatencyHistogram()).observe(seconds)
+
+    def stage_totals(self) -> Dict[str, List[float]]:
+        """{阶段: [秒, 次数, 行数]}，可以传给另一个监控器的 merge_stages（如工作进程返回给主进程）"""
+        with self.lock:
+            return {name: list(totals) for name, totals in self.stages.items()}
+
+    def merge_stages(self, stage_totals: Dict[str, List[float]], file_name: str = None):
+        for name, (seconds, calls, rows) in stage_totals.items():
+            self.record(name, seconds, rows, calls=calls, file_name=file_name)
+
     def get_stats(self) -> Dict[str, Any]:
         elapsed_time = time.time() - self.start_time
         return {
@@ -37,6 +192,80 @@ class PerformanceMonitor:
             "avg_speed": self.row_count / elapsed_time if elapsed_time > 0 else 0
         }
 
+    def report(self) -> Dict[str, Any]:
+        """get_stats 加上分阶段、分文件和延迟直方图的完整报告"""
+        def stage_dict(totals):
+            return {name: {'seconds': seconds, 'calls': calls, 'rows': rows,
+                           'rows_per_second': rows / seconds if seconds > 0 and rows else 0}
+                    for name, (seconds, calls, rows) in sorted(totals.items())}
+
+        with self.lock:
+            return {
+                **self.get_stats(),
+                'started_at': datetime.datetime.fromtimestamp(self.start_time).isoformat(timespec='seconds'),
+                'stages': stage_dict(self.stages),
+                'files': {file_name: stage_dict(stages) for file_name, stages in sorted(self.file_stages.items())},
+                'latency': {name: {'buckets': dict(zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'],
+                                                       histogram.cumulative())),
+                                   'count': histogram.count, 'sum': histogram.sum,
+                                   'p50': histogram.quantile(0.5), 'p95': histogram.quantile(0.95),
+                                   'p99': histogram.quantile(0.99)}
+                            for name, histogram in sorted(self.latencies.items())},
+            }
+
+    def prometheus_text(self) -> str:
+        """Prometheus 文本格式（供 node_exporter textfile collector 读取）；分文件明细只写入 JSON，避免标签基数过大"""
+        report = self.report()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{METRIC_PREFIX}_{name}{labels} {value}")
+
+        metric('files_total', 'counter', '本次导入处理的文件数', [('', report['files_processed'])])
+        metric('rows_total', 'counter', '本次导入处理的行数', [('', report['rows_processed'])])
+        metric('elapsed_seconds', 'gauge', '本次导入的总耗时', [('', report['elapsed_time'])])
+        stages = report['stages']
+        for name, key, help_text in (('stage_seconds_total', 'seconds', '各导入阶段的累计耗时'),
+                                     ('stage_calls_total', 'calls', '各导入阶段的调用次数'),
+                                     ('stage_rows_total', 'rows', '各导入阶段处理的行数')):
+            metric(name, 'counter', help_text,
+                   [(f'{{stage="{stage}"}}', values[key]) for stage, values in stages.items()])
+        samples = []
+        for stage, histogram in report['latency'].items():
+            for bound, total in histogram['buckets'].items():
+                samples.append((f'_bucket{{stage="{stage}",le="{bound}"}}', total))
+            samples.append((f'_sum{{stage="{stage}"}}', histogram['sum']))
+            samples.append((f'_count{{stage="{stage}"}}', histogram['count']))
+        if samples:
+            lines.append(f"# HELP {METRIC_PREFIX}_latency_seconds 数据块写入和提交的单次延迟")
+            lines.append(f"# TYPE {METRIC_PREFIX}_latency_seconds histogram")
+            lines.extend(f"{METRIC_PREFIX}_latency_seconds{suffix} {value}" for suffix, value in samples)
+        return '\n'.join(lines) + '\n'
+
+    def export(self, output_dir: str = 'output', name: str = 'import_metrics') -> List[str]:
+        """把本次运行的报告写成 <name>.json 和 <name>.prom，返回两个文件路径
+
+        先写临时文件再替换，textfile collector 不会读到写了一半的文件。
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        for suffix, content in (('.json', json.dumps(self.report(), ensure_ascii=False, indent=2)),
+                                ('.prom', self.prometheus_text())):
+            path = os.path.join(output_dir, name + suffix)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(path + '.tmp', path)
+            paths.append(path)
+        return paths
+
+
+def timed(monitor, name: str, **kwargs):
+    """monitor 为 None 时不计时"""
+    return monitor.stage(name, **kwargs) if monitor is not None else nullcontext()
+
 def validate_csv_row(row: Dict[str, str]) -> Dict[str, Any]:
     """验证并转换CSV行数据"""
     try:
@@ -88,6 +317,91 @@ def validate_csv_row(row: Dict[str, str]) -> Dict[str, Any]:
 #             cursor.execute(query)
 #         return cursor.fetchall()
 
+STAT_MEASURES = ['V_Current', 'A_Current', 'Offset']
+
+
+class WelfordAccumulator:
+    """单个分组、单个测量值的 Welford 累加器，按批用 Chan 公式合并，内存与行数无关"""
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def merge(self, count: int, mean: float, m2: float, low: float, high: float):
+        if not count:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+
+    def result(self) -> Dict[str, float]:
+        std = (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+        return {'count': self.count, 'min': self.min, 'max': self.max, 'avg': self.mean, 'std': std}
+
+
+class GroupedStatistics:
+    """按分组折叠数据批次：每批先用 NumPy 求出各组的计数/均值/M2/极值，再合并进各组累加器"""
+
+    def __init__(self, measures: Sequence[str] = STAT_MEASURES):
+        self.measures = list(measures)
+        self.accumulators: Dict[Any, Dict[str, WelfordAccumulator]] = {}
+
+    def add_batch(self, groups: Sequence[Any], columns: Dict[str, Sequence[float]]):
+        if not len(groups):
+            return
+        keys, first, inverse = np.unique(np.asarray(groups, dtype=object).astype(str),
+                                         return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        group_values = [groups[i] for i in first]
+        for measure in self.measures:
+            values = np.asarray(columns[measure], dtype=np.float64)
+            valid = ~np.isnan(values)
+            index, values = inverse[valid], values[valid]
+            counts = np.bincount(index, minlength=len(keys))
+            sums = np.bincount(index, weights=values, minlength=len(keys))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                means = sums / counts
+            m2 = np.bincount(index, weights=(values - means[index]) ** 2, minlength=len(keys))
+            lows = np.full(len(keys), np.inf)
+            highs = np.full(len(keys), -np.inf)
+            np.minimum.at(lows, index, values)
+            np.maximum.at(highs, index, values)
+            for g, key in enumerate(group_values):
+                accumulator = self.accumulators.setdefault(key, {}).setdefault(measure, WelfordAccumulator())
+                accumulator.merge(int(counts[g]), float(means[g]), float(m2[g]), float(lows[g]), float(highs[g]))
+
+    def results(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        return {group: {measure: accumulators[measure].result() for measure in self.measures
+                        if measure in accumulators}
+                for group, accumulators in self.accumulators.items()}
+
+
+class StreamingHistogram:
+    """固定桶边界的流式直方图：逐批累加计数，内存只与桶数有关"""
+
+    def __init__(self, low: float, high: float, bins: int = 50):
+        if not high > low:
+            # 所有值相同时与 matplotlib 一样取 ±0.5 的范围
+            low, high = low - 0.5, high + 0.5
+        self.edges = np.linspace(low, high, bins + 1)
+        self.counts = np.zeros(bins, dtype=np.int64)
+
+    def add(self, values: Sequence[float]):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        # 与 np.histogram 一致：最后一个桶包含右边界；范围外的值（范围取自汇总表时可能略旧）计入首尾桶
+        index = np.clip(np.searchsorted(self.edges, values, side='right') - 1, 0, len(self.counts) - 1)
+        self.counts += np.bincount(index, minlength=len(self.counts))
+
+
 class DataAnalyzer:
     @staticmethod
     def calculate_statistics(data: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -114,4 +428,101 @@ class DataAnalyzer:
                 'max': max(offset),
                 'avg': sum(offset) / len(offset)
             }
-        }
\ No newline at end of file
+        }
+
+    @staticmethod
+    def grouped_statistics(conn, table_name: str = 'optimized_data', group_column: str = 'ModelName',
+                           measures: Sequence[str] = STAT_MEASURES, method: str = 'sql',
+                           batch_size: int = 50000) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """按分组计算 count/min/max/avg/std，返回 {分组: {测量名: 统计}}
+
+        method='sql' 在 SQLite 中一次查询完成（两遍法：窗口函数求组均值，再 GROUP BY 累计离差平方和）；
+        method='stream' 以 fetchmany 分批读取并折叠进各组 Welford 累加器，数值更稳定，内存只与分组数有关。
+        """
+        if method == 'sql':
+            return DataAnalyzer._sql_grouped_statistics(conn, table_name, group_column, measures)
+        cursor = conn.execute(f"SELECT {group_column}, {', '.join(measures)} FROM {table_name}")
+        return DataAnalyzer.fold_batches(iter(lambda: cursor.fetchmany(batch_size), []), measures)
+
+    @staticmethod
+    def fold_batches(batches: Iterable[List[tuple]], measures: Sequence[str] = STAT_MEASURES):
+        """折叠 (分组, 测量值...) 行批次，返回与 grouped_statistics 相同结构的结果"""
+        statistics = GroupedStatistics(measures)
+        for rows in batches:
+            columns = {measure: [row[i + 1] for row in rows] for i, measure in enumerate(measures)}
+            # None（SQL NULL）转为 NaN 后被忽略
+            columns = {measure: np.array(values, dtype=np.float64) for measure, values in columns.items()}
+            statistics.add_batch([row[0] for row in rows], columns)
+        return statistics.results()
+
+    @staticmethod
+    def _sql_grouped_statistics(conn, table_name, group_column, measures):
+        # 离差平方和相对组均值累计，不会像 SUM(x * x) - n * mean² 那样在均值远大于离散度时相消
+        columns = ', '.join(f"{m}, AVG({m}) OVER w AS {m}_mean" for m in measures)
+        parts = ', '.join(f"COUNT({m}), MIN({m}), MAX({m}), AVG({m}), SUM(({m} - {m}_mean) * ({m} - {m}_mean))"
+                          for m in measures)
+        stats = {}
+        for row in conn.execute(f"SELECT {group_column}, {parts} FROM ("
+                                f"SELECT {group_column}, {columns} FROM {table_name} "
+                                f"WINDOW w AS (PARTITION BY {group_column})) GROUP BY {group_column}"):
+            stats[row[0]] = {}
+            for i, measure in enumerate(measures):
+                count, low, high, mean, squared_deviations = row[1 + i * 5:6 + i * 5]
+                if not count:
+                    continue
+                variance = squared_deviations / (count - 1) if count > 1 else 0.0
+                stats[row[0]][measure] = {'count': count, 'min': low, 'max': high, 'avg': mean,
+                                          'std': variance ** 0.5}
+        return stats
+
+    @staticmethod
+    def value_ranges(conn, table_name: str = 'optimized_data', model_name: str = None,
+                     measures: Sequence[str] = STAT_MEASURES) -> Dict[str, tuple]:
+        """各测量值的 (最小值, 最大值)；指定模型时优先读取位置汇总表，否则在 SQL 中求 MIN/MAX。没有数据的为 None"""
+        from location_summary import SUMMARY_TABLE
+        row = None
+        if model_name is not None:
+            parts = ', '.join(f"MIN({m}_min), MAX({m}_max)" for m in measures)
+            try:
+                row = conn.execute(f"SELECT {parts} FROM {SUMMARY_TABLE} WHERE ModelName = ?", (model_name,)).fetchone()
+            except sqlite3.Error:
+                row = None
+        if row is None or row[0] is None:
+            where, params = ("WHERE ModelName = ?", (model_name,)) if model_name is not None else ("", ())
+            parts = ', '.join(f"MIN({m}), MAX({m})" for m in measures)
+            row = conn.execute(f"SELECT {parts} FROM {table_name} {where}", params).fetchone()
+        return {measure: (row[i * 2], row[i * 2 + 1]) if row[i * 2] is not None else None
+                for i, measure in enumerate(measures)}
+
+    @staticmethod
+    def streaming_histograms(conn, table_name: str = 'optimized_data', model_name: str = None,
+                             measures: Sequence[str] = STAT_MEASURES, bins: int = 50,
+                             batch_size: int = 50000) -> Dict[str, StreamingHistogram]:
+        """按 fetchmany 批次把测量值折叠进固定桶的直方图，返回 {测量名: StreamingHistogram}
+
+        桶边界来自 value_ranges，之后只需扫描一遍数据，内存占用与行数无关。
+        """
+        ranges = DataAnalyzer.value_ranges(conn, table_name, model_name, measures)
+        histograms = {measure: StreamingHistogram(*value_range, bins)
+                      for measure, value_range in ranges.items() if value_range is not None}
+        if not histograms:
+            return {}
+        where, params = ("WHERE ModelName = ?", (model_name,)) if model_name is not None else ("", ())
+        cursor = conn.execute(f"SELECT {', '.join(measures)} FROM {table_name} {where}", params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            # None（SQL NULL）转为 NaN 后被忽略
+            data = np.array(rows, dtype=np.float64)
+            for i, measure in enumerate(measures):
+                if measure in histograms:
+                    histograms[measure].add(data[:, i])
+        return histograms
+
+    @staticmethod
+    def location_percentiles(conn, model_name: str, measure: str, quantiles: Sequence[float] = (0.01, 0.5, 0.99),
+                             start_day: str = None, end_day: str = None) -> Dict[str, List[float]]:
+        """按位置返回日期范围内的分位数（合并导入时维护的每日 t-digest 草图，不读取原始数据）"""
+        from quantile_sketch import SketchStore
+        return SketchStore(conn).percentiles(model_name, measure, quantiles, start_day=start_day, end_day=end_day)
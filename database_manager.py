@@ -1,32 +1,333 @@
+import datetime
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from columnar_parser import column_count
+from csv_processor_helpers import timed
+from dedup import insert_deduplicated, rows_to_columns
+from query_cache import QueryResultCache, is_cacheable, normalize_sql
+
+CREATE_DATA_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS {table_name} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Time TEXT,
+    BarCode TEXT,
+    ModelName TEXT,
+    Name_ TEXT,
+    Status_V TEXT,
+    V_Current REAL,
+    V_Min REAL,
+    V_Max REAL,
+    Status_A TEXT,
+    A_Current REAL,
+    A_Min REAL,
+    A_Max REAL,
+    Status_O TEXT,
+    Offset REAL,
+    Offset_Min REAL,
+    Offset_Max REAL,
+    Status_VAO TEXT,
+    RResult TEXT,
+    Result TEXT
+)
+"""
 
 class DatabaseManager:
-    def __init__(self, connection):
+    def __init__(self, connection, pool=None):
+        # connection 为写连接；给出 pool（见 connection_pool.ConnectionPool）时查询走池中的只读连接
         self.conn = connection
+        self.pool = pool
+        # 写连接可能被多个线程使用，插入和提交串行执行，避免事务交叉
+        self.write_lock = threading.RLock()
+        # 提交策略：默认每次插入都提交；批量导入模式下按行数或时间合并提交
+        self.commit_rows = 1
+        self.commit_interval = 0.0
+        self.pending_rows = 0
+        self.last_commit = time.time()
+        # 已提交的次数，调用方据此判断之前写入的数据是否已落盘（出错回滚时还未提交的会一起丢弃）
+        self.commit_count = 0
+        # 插入钩子 hook(columns, positions)：在同一事务内、提交前调用，用于维护汇总表等派生数据
+        self.insert_hooks = []
+        # 回滚钩子 hook()：回滚后调用，让派生数据和编码缓存丢弃未提交事务中加入的内存状态
+        self.rollback_hooks = []
+        # 按月分区存储（见 partitions.PartitionStore），启用后写入和日期范围查询经由分区路由
+        self.partitions = None
+        # 可选的查询结果缓存（enable_result_cache 开启）
+        self.result_cache = None
+        # 可选的 PerformanceMonitor：记录 insert/commit（含延迟直方图）和 derived（插入钩子）阶段
+        self.monitor = None
+
+    def enable_result_cache(self, max_bytes=64 * 1024 * 1024):
+        self.result_cache = QueryResultCache(max_bytes)
+
+    def invalidate_cache(self):
+        if self.result_cache is not None:
+            self.result_cache.clear()
+
+    def cache_stats(self):
+        return self.result_cache.stats() if self.result_cache is not None else None
+
+    def write_generation(self):
+        """数据库写入代数：本连接的累计修改行数、其他连接提交时变化的 data_version 和表结构版本"""
+        return (self.conn.total_changes, self.conn.execute("PRAGMA data_version").fetchone()[0],
+                self.conn.execute("PRAGMA schema_version").fetchone()[0])
+
+    def use_partitions(self, partition_store):
+        self.partitions = partition_store
+
+    def is_partitioned(self, table_name):
+        return self.partitions is not None and table_name == self.partitions.table_name
+
+    def add_insert_hook(self, hook):
+        self.insert_hooks.append(hook)
+
+    def add_rollback_hook(self, hook):
+        self.rollback_hooks.append(hook)
+
+    def _run_insert_hooks(self, columns, positions):
+        if not self.insert_hooks:
+            return
+        with timed(self.monitor, 'derived', rows=len(positions)):
+            for hook in self.insert_hooks:
+                hook(columns, positions)
+
+    @contextmanager
+    def reader(self):
+        """借出一个只读连接；没有连接池或启用了分区存储（分区只附加在写连接上）时返回写连接"""
+        if self.pool is None or self.partitions is not None:
+            yield self.conn
+        else:
+            with self.pool.reader() as conn:
+                yield conn
 
     def execute_query(self, query, params=None):
+        key = None
+        if self.result_cache is not None:
+            normalized = normalize_sql(query)
+            if is_cacheable(normalized):
+                key = (normalized, tuple(params or ()), self.write_generation())
+                rows = self.result_cache.get(key)
+                if rows is not None:
+                    # 返回副本，调用方修改列表不会影响缓存
+                    return list(rows)
         try:
-            cursor = self.conn.cursor()
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            return cursor.fetchall()
+            with self.reader() as conn:
+                cursor = conn.cursor()
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+                rows = cursor.fetchall()
+            if key is not None:
+                self.result_cache.put(key, rows)
+                rows = list(rows)
+            return rows
         except sqlite3.Error as e:
             print(f"数据库查询错误: {e}")
             return []
 
+    def query_range(self, query, start_day=None, end_day=None, params=None, table_name='optimized_data'):
+        """日期范围查询：query 中的 {table} 替换为只读取范围内数据的来源
+
+        启用分区时只附加范围涉及的月份；未启用分区时退回到在原表上按 Time 前 10 个字符过滤（需扫描全表）。
+        """
+        if self.is_partitioned(table_name):
+            try:
+                source = self.partitions.range_table(start_day, end_day)
+            except (ValueError, sqlite3.Error) as e:
+                print(f"数据库查询错误: {e}")
+                return []
+        else:
+            clauses = []
+            for operator, day in (('>=', start_day), ('<=', end_day)):
+                if day:
+                    # 日期校验后直接写入子查询，query 自身的参数顺序不受影响
+                    day = datetime.date.fromisoformat(day).isoformat()
+                    clauses.append(f"replace(substr(Time, 1, 10), '/', '-') {operator} '{day}'")
+            where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+            source = f"(SELECT * FROM {table_name}{where})"
+        return self.execute_query(query.format(table=source), params)
+
+    def drop_partition(self, month):
+        """删除一个月的分区文件（及派生表中该月的数据），返回删除的行数"""
+        if self.partitions is None:
+            raise ValueError("未启用按月分区存储")
+        self.commit()
+        self.invalidate_cache()
+        return self.partitions.drop_month(month)
+
+    # 以下插入方法出错时回滚未提交的数据并重新抛出 sqlite3.Error，由调用方决定是否记录导入清单
     def bulk_insert(self, table_name, data):
-        try:
-            cursor = self.conn.cursor()
-            placeholders = ', '.join(['?' for _ in data[0]])
-            query = f"INSERT INTO {table_name} VALUES ({placeholders})"
-            cursor.executemany(query, data)
-            self.conn.commit()
-        except sqlite3.Error as e:
-            print(f"批量插入错误: {e}")
+        with self.write_lock:
+            try:
+                cursor = self.conn.cursor()
+                hook_columns = None
+                if isinstance(data[0], dict):
+                    if self.insert_hooks:
+                        hook_columns = rows_to_columns(data)
+                    # 字典行按键名指定列，避免与自增 id 列错位
+                    columns = list(data[0].keys())
+                    placeholders = ', '.join(['?' for _ in columns])
+                    query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+                    data = [tuple(row[column] for column in columns) for row in data]
+                else:
+                    placeholders = ', '.join(['?' for _ in data[0]])
+                    query = f"INSERT INTO {table_name} VALUES ({placeholders})"
+                with timed(self.monitor, 'insert', rows=len(data), latency=True):
+                    cursor.executemany(query, data)
+                self.invalidate_cache()
+                if hook_columns is not None:
+                    self._run_insert_hooks(hook_columns, np.arange(len(data)))
+                self.maybe_commit(len(data))
+            except sqlite3.Error as e:
+                print(f"批量插入错误: {e}")
+                self.rollback()
+                raise
+
+    def insert_columns(self, table_name, columns):
+        """插入按列组织的数据块（列名 -> 数组），无需逐行构造字典"""
+        if not columns:
+            return
+        if self.is_partitioned(table_name):
+            # 分区存储总是按行指纹去重写入
+            self.insert_columns_deduplicated(table_name, columns)
+            return
+        with self.write_lock:
+            try:
+                names = list(columns.keys())
+                placeholders = ', '.join(['?' for _ in names])
+                query = f"INSERT INTO {table_name} ({', '.join(names)}) VALUES ({placeholders})"
+                cursor = self.conn.cursor()
+                with timed(self.monitor, 'insert', rows=len(columns[names[0]]), latency=True):
+                    cursor.executemany(query, zip(*(columns[name].tolist() for name in names)))
+                self.invalidate_cache()
+                self._run_insert_hooks(columns, np.arange(len(columns[names[0]])))
+                self.maybe_commit(len(columns[names[0]]))
+            except sqlite3.Error as e:
+                print(f"批量插入错误: {e}")
+                self.rollback()
+                raise
+
+    def insert_columns_deduplicated(self, table_name, columns):
+        """按行指纹去重后插入列式数据块，返回新增行数"""
+        with self.write_lock:
+            try:
+                with timed(self.monitor, 'insert', rows=column_count(columns), latency=True):
+                    if self.is_partitioned(table_name):
+                        positions = self.partitions.insert_columns(columns)
+                    else:
+                        positions = insert_deduplicated(self.conn, table_name, columns)
+                if len(positions):
+                    self.invalidate_cache()
+                self._run_insert_hooks(columns, positions)
+                self.maybe_commit(len(positions))
+                return len(positions)
+            except sqlite3.Error as e:
+                print(f"批量插入错误: {e}")
+                self.rollback()
+                raise
+
+    def insert_compact(self, compact_store, columns):
+        """写入紧凑存储（见 compact_schema.CompactStore），返回新增行数"""
+        with self.write_lock:
+            try:
+                with timed(self.monitor, 'insert', rows=column_count(columns), latency=True):
+                    positions = compact_store.insert_columns(columns)
+                if len(positions):
+                    self.invalidate_cache()
+                self._run_insert_hooks(columns, positions)
+                self.maybe_commit(len(positions))
+                return len(positions)
+            except sqlite3.Error as e:
+                print(f"批量插入错误: {e}")
+                self.rollback()
+                raise
+
+    def create_data_table(self, table_name='optimized_data'):
+        """创建原始数据表及 ModelName/BarCode 索引（已存在时不做改动）"""
+        self.conn.execute(CREATE_DATA_TABLE_SQL.format(table_name=table_name))
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_model_name ON {table_name} (ModelName)")
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_bar_code ON {table_name} (BarCode)")
+        self.commit()
+
+    def maybe_commit(self, rows=0):
+        """累计待提交行数，达到行数或时间阈值时才真正提交"""
+        with self.write_lock:
+            self.pending_rows += rows
+            if self.pending_rows >= self.commit_rows or time.time() - self.last_commit >= self.commit_interval:
+                self.commit()
+
+    def commit(self):
+        with self.write_lock:
+            with timed(self.monitor, 'commit', rows=self.pending_rows, latency=True):
+                self.conn.commit()
+            self.pending_rows = 0
+            self.last_commit = time.time()
+            self.commit_count += 1
+            # 读连接在提交后才能看到新数据，提交前缓存的结果要丢弃
+            self.invalidate_cache()
+
+    def rollback(self):
+        with self.write_lock:
             self.conn.rollback()
+            self.pending_rows = 0
+            self.invalidate_cache()
+            for hook in self.rollback_hooks:
+                hook()
+
+    def drop_secondary_indexes(self, table_name, keep=()):
+        """删除表上的二级索引（保留 keep 中的索引），返回用于重建的 (名称, SQL) 列表"""
+        indexes = self.conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (table_name,)
+        ).fetchall()
+        dropped = [(name, sql) for name, sql in indexes if name not in keep]
+        for name, _ in dropped:
+            self.conn.execute(f"DROP INDEX IF EXISTS {name}")
+        self.commit()
+        return dropped
+
+    def rebuild_indexes(self, indexes):
+        for _, sql in indexes:
+            self.conn.execute(sql)
+        if indexes:
+            self.conn.execute("PRAGMA optimize")
+        self.commit()
+
+    @contextmanager
+    def bulk_load(self, table_name, keep_indexes=(), drop_indexes=True, commit_rows=50000,
+                  commit_interval=5.0, cache_size_mb=256, synchronous='NORMAL'):
+        """批量导入模式：放宽 PRAGMA、合并提交、导入期间删除二级索引，结束后重建并恢复安全设置
+
+        synchronous 默认 NORMAL：WAL 模式下断电只会丢失最后几次提交，数据库不会损坏；
+        OFF 在断电时可能损坏数据库文件，只应在可以整个重建的库上使用。
+        """
+        saved_pragmas = {
+            pragma: self.conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+            for pragma in ('cache_size', 'temp_store', 'synchronous')
+        }
+        saved_commit = (self.commit_rows, self.commit_interval)
+        self.commit()
+        self.conn.execute(f"PRAGMA cache_size=-{cache_size_mb * 1024}")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute(f"PRAGMA synchronous={synchronous}")
+        dropped = self.drop_secondary_indexes(table_name, keep_indexes) if drop_indexes else []
+        self.commit_rows, self.commit_interval = commit_rows, commit_interval
+        try:
+            yield self
+        finally:
+            self.commit()
+            self.commit_rows, self.commit_interval = saved_commit
+            self.rebuild_indexes(dropped)
+            for pragma, value in saved_pragmas.items():
+                self.conn.execute(f"PRAGMA {pragma}={value}")
 
     def close(self):
-        if self.conn:
-            self.conn.close()
\ No newline at end of file
+        if self.pool is not None:
+            self.pool.close()
+        elif self.conn:
+            self.conn.close()
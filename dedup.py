@@ -0,0 +1,195 @@
+import hashlib
+import re
+
+import numpy as np
+
+from csv_processor_helpers import CSV_COLUMNS, FLOAT_COLUMNS
+
+# 行指纹覆盖 CSV 的全部字段：同一条码在不同位置（Name_）或不同时间的测量值相同也是不同的行
+FINGERPRINT_TEXT_COLUMNS = [name for name in CSV_COLUMNS if name not in FLOAT_COLUMNS]
+FINGERPRINT_FLOAT_COLUMNS = list(FLOAT_COLUMNS)
+FINGERPRINT_COLUMN = 'RowHash'
+# 指纹算法的版本，覆盖字段变化时加一；旧版本的指纹在 ensure_fingerprint_column 中重新计算
+FINGERPRINT_VERSION = 2
+FINGERPRINT_VERSION_TABLE = 'fingerprint_versions'
+
+_MIX_1 = np.uint64(0xbf58476d1ce4e5b9)
+_MIX_2 = np.uint64(0x94d049bb133111eb)
+_GOLDEN = np.uint64(0x9e3779b97f4a7c15)
+
+
+def _mix64(h):
+    # splitmix64 的终结函数，uint64 乘法按 2**64 取模
+    h = h ^ (h >> np.uint64(30))
+    h = h * _MIX_1
+    h = h ^ (h >> np.uint64(27))
+    h = h * _MIX_2
+    return h ^ (h >> np.uint64(31))
+
+
+def _hash_text_column(values):
+    """对字符串列做稳定的 64 位哈希，每个不同取值只计算一次"""
+    uniques, inverse = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True)
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+         for value in uniques],
+        dtype=np.uint64
+    )
+    return hashes[inverse.reshape(-1)]
+
+
+def row_fingerprints(columns):
+    """为列式数据块计算 64 位行指纹（以有符号整数返回，便于存入 SQLite INTEGER）"""
+    count = len(columns[FINGERPRINT_FLOAT_COLUMNS[0]])
+    h = np.full(count, _GOLDEN, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for name in FINGERPRINT_TEXT_COLUMNS:
+            h = _mix64(h ^ _hash_text_column(columns[name]))
+        for name in FINGERPRINT_FLOAT_COLUMNS:
+            # 加 0.0 把 -0.0 归一为 0.0，再按位取 IEEE 754 表示
+            values = np.asarray(columns[name], dtype=np.float64) + 0.0
+            h = _mix64((h + _GOLDEN) ^ values.view(np.uint64))
+    return h.view(np.int64)
+
+
+def rows_to_columns(rows):
+    """把 validate_csv_row 产生的字典行转换为列式数据块"""
+    if not rows:
+        return {}
+    return {name: np.array([row[name] for row in rows],
+                           dtype=np.float64 if isinstance(rows[0][name], float) else object)
+            for name in rows[0]}
+
+
+def fingerprint_index_name(table_name):
+    return f"idx_{table_name}_row_hash"
+
+
+def drop_unique_constraints(conn, table_name):
+    """去掉旧库数据表上的 UNIQUE 表约束，返回是否重建了表
+
+    旧版 csv2sqlite5 建的 all_data 带 UNIQUE(ModelName, BarCode, V_Current, A_Current, Offset)，
+    行指纹去重保留的“只有时间等字段不同”的行会违反它。SQLite 不能删除约束，
+    这里按去掉 UNIQUE 子句的定义重建表（同一事务内复制数据、保留 id 并重建其他索引）。
+    """
+    schema, _, name = table_name.rpartition('.')
+    prefix = f"{schema}." if schema else ""
+    if not any(row[3] == 'u' for row in conn.execute(f"PRAGMA {prefix}index_list({name})")):
+        return False
+    create_sql = conn.execute(f"SELECT sql FROM {prefix}sqlite_master WHERE type = 'table' AND name = ?",
+                              (name,)).fetchone()[0]
+    index_sqls = [row[0] for row in conn.execute(
+        f"SELECT sql FROM {prefix}sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (name,))]
+    definition = re.sub(r',\s*UNIQUE\s*\([^)]*\)', '', create_sql[create_sql.index('('):], flags=re.IGNORECASE)
+    rebuilt = f"{name}_rebuild"
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    conn.execute(f"CREATE TABLE {prefix}{rebuilt} {definition}")
+    conn.execute(f"INSERT INTO {prefix}{rebuilt} SELECT * FROM {table_name}")
+    conn.execute(f"DROP TABLE {table_name}")
+    conn.execute(f"ALTER TABLE {prefix}{rebuilt} RENAME TO {name}")
+    for sql in index_sqls:
+        conn.execute(sql)
+    conn.commit()
+    return True
+
+
+def ensure_fingerprint_column(conn, table_name, batch_size=10000):
+    """确保表有 RowHash 列及其索引，并为已有数据补算指纹（旧版本的指纹重新计算）；旧库表上的 UNIQUE 约束会被去掉"""
+    drop_unique_constraints(conn, table_name)
+    existing = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+    if FINGERPRINT_COLUMN not in existing:
+        conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {FINGERPRINT_COLUMN} INTEGER")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {fingerprint_index_name(table_name)} "
+                 f"ON {table_name} ({FINGERPRINT_COLUMN})")
+    reset_outdated_fingerprints(conn, table_name)
+    backfill_fingerprints(conn, table_name, batch_size)
+    conn.commit()
+
+
+def reset_outdated_fingerprints(conn, table_name, target_table=None):
+    """表的指纹版本低于 FINGERPRINT_VERSION 时清空其 RowHash 以便重新补算，返回是否清空
+
+    版本记录在与表同库的 fingerprint_versions 表中（分区表在各自的分区库里）。
+    target_table 是实际存放 RowHash 的表（紧凑存储中为 compact_data），默认即 table_name。
+    """
+    target_table = target_table or table_name
+    schema, _, name = target_table.rpartition('.')
+    versions = f"{schema}.{FINGERPRINT_VERSION_TABLE}" if schema else FINGERPRINT_VERSION_TABLE
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {versions} (table_name TEXT PRIMARY KEY, version INTEGER)")
+    row = conn.execute(f"SELECT version FROM {versions} WHERE table_name = ?", (name,)).fetchone()
+    if row is not None and row[0] >= FINGERPRINT_VERSION:
+        return False
+    conn.execute(f"UPDATE {target_table} SET {FINGERPRINT_COLUMN} = NULL WHERE {FINGERPRINT_COLUMN} IS NOT NULL")
+    conn.execute(f"INSERT OR REPLACE INTO {versions} (table_name, version) VALUES (?, ?)",
+                 (name, FINGERPRINT_VERSION))
+    return True
+
+
+def backfill_fingerprints(conn, table_name, batch_size=10000, target_table=None):
+    """为 RowHash 为空的行补算指纹
+
+    table_name 需要有 id 和 CSV 全部字段；紧凑存储从兼容视图读取，写回 target_table（compact_data）。
+    """
+    target_table = target_table or table_name
+    names = FINGERPRINT_TEXT_COLUMNS + FINGERPRINT_FLOAT_COLUMNS
+    last_id = -1
+    while True:
+        rows = conn.execute(
+            f"SELECT id, {', '.join(names)} FROM {table_name} "
+            f"WHERE {FINGERPRINT_COLUMN} IS NULL AND id > ? ORDER BY id LIMIT ?",
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        columns = {name: [row[i + 1] for row in rows] for i, name in enumerate(names)}
+        hashes = row_fingerprints(columns).tolist()
+        conn.executemany(
+            f"UPDATE {target_table} SET {FINGERPRINT_COLUMN} = ? WHERE id = ?",
+            zip(hashes, (row[0] for row in rows))
+        )
+
+
+def insert_deduplicated(conn, table_name, columns, hashes=None):
+    """经临时暂存表批量合并：块内重复行在写入暂存表前去掉，已存在的行用 NOT EXISTS 反连接过滤
+
+    指纹只用于经索引快速找到候选行，是否重复由全部字段逐一比较决定，指纹碰撞不会丢行。
+    hashes 为空时按 columns 计算行指纹。不提交事务，返回新增行在数据块中的位置数组。
+    """
+    if not columns:
+        return np.empty(0, dtype=np.int64)
+    names = [name for name in columns if name != FINGERPRINT_COLUMN]
+    # table_name 可以带库名（如附加的分区 p_2024_07.optimized_data）
+    staging = f"staging_{table_name.replace('.', '_')}"
+    conn.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {staging} "
+        f"(seq INTEGER PRIMARY KEY, {FINGERPRINT_COLUMN} INTEGER, {', '.join(names)})"
+    )
+    conn.execute(f"DELETE FROM {staging}")
+
+    if hashes is None:
+        hashes = row_fingerprints(columns)
+    hashes = hashes.tolist()
+    rows = zip(*(columns[name].tolist() for name in names))
+    if len(set(hashes)) < len(hashes):
+        # 块内有相同指纹时按整行比较，重复的行只保留第一次出现的
+        seen = set()
+        rows = [row if not (row in seen or seen.add(row)) else None for row in rows]
+    placeholders = ', '.join(['?' for _ in range(len(names) + 2)])
+    # seq 即行在数据块中的位置
+    conn.executemany(
+        f"INSERT INTO {staging} (seq, {FINGERPRINT_COLUMN}, {', '.join(names)}) VALUES ({placeholders})",
+        ((seq, row_hash) + row for seq, row_hash, row in zip(range(len(hashes)), hashes, rows) if row is not None)
+    )
+    # IS 比较把 NULL 视为相等
+    same_row = ' AND '.join(f"t.{name} IS {staging}.{name}" for name in names)
+    conn.execute(
+        f"DELETE FROM {staging} WHERE EXISTS (SELECT 1 FROM {table_name} t "
+        f"WHERE t.{FINGERPRINT_COLUMN} = {staging}.{FINGERPRINT_COLUMN} AND {same_row})"
+    )
+    positions = np.array([row[0] for row in conn.execute(f"SELECT seq FROM {staging} ORDER BY seq")],
+                         dtype=np.int64)
+    column_list = ', '.join(names + [FINGERPRINT_COLUMN])
+    conn.execute(f"INSERT INTO {table_name} ({column_list}) SELECT {column_list} FROM {staging} ORDER BY seq")
+    return positions
@@ -0,0 +1,266 @@
+import hashlib
+import html
+import math
+import os
+import time
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
+import plotly.graph_objects as go
+from plotly.offline import get_plotlyjs
+from plotly.subplots import make_subplots
+
+from capability import capability_lookup, compute_capability
+from compact_schema import table_exists
+from parallel_parser import process_pool
+from quantile_sketch import SKETCH_TABLE, SketchStore
+from query_indexes import DATA_COLUMNS, grouped_data_query, location_query
+
+
+def load_locations(db_manager, model_name, table_name='optimized_data'):
+    """获取模型所有唯一的测量位置"""
+    return [row[0] for row in db_manager.execute_query(location_query(table_name), (model_name,))]
+
+
+def split_by_location(rows):
+    """把按 Name_ 排序的 (Name_, 数据列...) 结果一次切分为 {位置: float64 数组}"""
+    if not rows:
+        return {}
+    values = np.array([row[1:] for row in rows], dtype=np.float64)
+    result = {}
+    start = 0
+    for location, group in groupby(rows, key=itemgetter(0)):
+        count = sum(1 for _ in group)
+        result[location] = values[start:start + count]
+        start += count
+    return result
+
+
+def load_grouped_data(db_manager, model_name, locations=None, table_name='optimized_data'):
+    """一次查询取出模型（或指定位置）的全部 OK 数据，返回 {位置: 数组}，列顺序见 DATA_COLUMNS"""
+    params = [model_name] + list(locations or [])
+    data_query = grouped_data_query(table_name, None if locations is None else len(locations))
+    return split_by_location(db_manager.execute_query(data_query, params))
+
+
+def load_page_data(db_manager, model_name, locations, table_name='optimized_data'):
+    """返回 [(位置, 数组)]，数组每行为 (V, A, Offset, V_Min, V_Max, A_Min, A_Max, Offset_Min, Offset_Max)"""
+    if not locations:
+        return []
+    grouped = load_grouped_data(db_manager, model_name, locations, table_name)
+    empty = np.empty((0, len(DATA_COLUMNS)))
+    return [(location, grouped.get(location, empty)) for location in locations]
+
+
+class DistributionDataSource:
+    """分布图数据访问：缓存各模型的位置列表，翻页时不再重复查询位置"""
+
+    def __init__(self, db_manager, table_name='optimized_data'):
+        self.db_manager = db_manager
+        self.table_name = table_name
+        self.location_cache = {}
+
+    def locations(self, model_name):
+        if model_name not in self.location_cache:
+            self.location_cache[model_name] = load_locations(self.db_manager, model_name, self.table_name)
+        return self.location_cache[model_name]
+
+    def page_data(self, model_name, page, rows_per_page):
+        return load_page_data(self.db_manager, model_name,
+                              page_slice(self.locations(model_name), page, rows_per_page), self.table_name)
+
+    def invalidate(self, model_name=None):
+        """导入新数据后清除缓存（不指定模型时全部清除）"""
+        if model_name is None:
+            self.location_cache.clear()
+        else:
+            self.location_cache.pop(model_name, None)
+
+
+# 每列的测量值和直方图颜色
+TRACE_STYLES = [('V_Current', 'blue'), ('A_Current', 'green'), ('Offset', 'orange')]
+
+
+def page_count(total_locations, rows_per_page):
+    return math.ceil(total_locations / rows_per_page)
+
+
+def page_slice(locations, page, rows_per_page):
+    start_index = (page - 1) * rows_per_page
+    return locations[start_index:start_index + rows_per_page]
+
+
+def sketch_percentiles(sketch_store, model_name, measures=('V_Current', 'A_Current', 'Offset')):
+    """从分位数草图读取模型各位置的 P1/P50/P99，返回 {(位置, 测量名): [P1, P50, P99]}"""
+    return {(location, measure): values
+            for measure in measures
+            for location, values in sketch_store.percentiles(model_name, measure).items()}
+
+
+def subplot_title(location, measure, capability=None, percentiles=None):
+    if capability is None and percentiles is None:
+        return f"{location} - V_Current | A_Current | Offset"
+    title = f"{location} - {measure}"
+    if capability is not None:
+        stats = capability.get((location, measure))
+        cpk = stats['cpk'] if stats else float('nan')
+        title += f" (Cpk {cpk:.2f})" if cpk == cpk else " (Cpk -)"
+    if percentiles is not None and (location, measure) in percentiles:
+        p1, p50, p99 = percentiles[(location, measure)]
+        title += f"<br>P1 {p1:.4g} / P50 {p50:.4g} / P99 {p99:.4g}"
+    return title
+
+
+def build_distribution_figure(model_name, page_data, page, total_pages, capability=None, percentiles=None):
+    """为一页测量位置生成 V_Current | A_Current | Offset 分布图
+
+    capability 为 {(位置, 测量名): 指标} 时在标题中标注 Cpk，percentiles 为 {(位置, 测量名): [P1, P50, P99]} 时标注分位数。
+    """
+    fig = make_subplots(rows=len(page_data), cols=3,
+                        subplot_titles=[subplot_title(location, measure, capability, percentiles)
+                                        for location, _ in page_data
+                                        for measure in ('V_Current', 'A_Current', 'Offset')],
+                        vertical_spacing=0.05,
+                        horizontal_spacing=0.02)
+
+    # 直方图和规格上下限竖线都一次性加入；逐条 add_trace/add_vline 每次都要重新校验整个图，页面大时非常慢
+    traces, rows, cols, shapes = [], [], [], []
+    for i, (location, data) in enumerate(page_data):
+        row = i + 1
+        if not len(data):
+            continue
+
+        for col, (measure, color) in enumerate(TRACE_STYLES, start=1):
+            traces.append(go.Histogram(x=data[:, col - 1], name=measure, marker_color=color, opacity=0.7))
+            rows.append(row)
+            cols.append(col)
+            axis = (row - 1) * 3 + col
+            suffix = '' if axis == 1 else str(axis)
+            for limit in data[0, 3 + (col - 1) * 2:5 + (col - 1) * 2].tolist():
+                shapes.append(dict(type='line', xref=f'x{suffix}', yref=f'y{suffix} domain', x0=limit, x1=limit,
+                                   y0=0, y1=1, line=dict(dash='dash', color='red')))
+
+    if traces:
+        fig.add_traces(traces, rows=rows, cols=cols)
+    fig.update_layout(
+        height=300 * len(page_data),
+        width=1500,
+        title_text=f"Distribution for {model_name} (Page {page}/{total_pages})",
+        showlegend=False,
+        shapes=shapes,
+    )
+    fig.update_xaxes(title_text="Value")
+    fig.update_yaxes(title_text="Frequency")
+
+    return fig
+
+
+def report_file_name(model_name, page):
+    """模型名中不能用于文件名的字符替换为 _；有替换时追加原名的短哈希，A/B 和 A_B 不会写到同一个文件"""
+    safe_name = "".join(c if c.isalnum() or c in '-_.' else '_' for c in model_name)
+    if safe_name != model_name:
+        safe_name += '_' + hashlib.blake2b(model_name.encode('utf-8'), digest_size=4).hexdigest()
+    return f"{safe_name}_page{page}.html"
+
+
+def render_report_page(job):
+    """生成并写出一页报告（可在工作进程中运行），返回文件路径"""
+    model_name, page, total_pages, page_data, capability, percentiles, path, include_plotlyjs = job
+    fig = build_distribution_figure(model_name, page_data, page, total_pages, capability, percentiles)
+    fig.write_html(path, include_plotlyjs=include_plotlyjs)
+    return path
+
+
+def model_report_jobs(db_manager, model_name, output_dir='output', rows_per_page=10, table_name='optimized_data',
+                      include_plotlyjs=True):
+    """整个模型只查询一次，再按页切分为 render_report_page 的任务列表"""
+    grouped = load_grouped_data(db_manager, model_name, table_name=table_name)
+    # 只读计算，生成报告不改写能力表
+    with db_manager.reader() as conn:
+        capability = capability_lookup(compute_capability(conn, table_name, model_name, store=False))
+        percentiles = None
+        if table_exists(conn, SKETCH_TABLE):
+            percentiles = sketch_percentiles(SketchStore(conn), model_name)
+    locations = sorted(grouped)
+    total_pages = page_count(len(locations), rows_per_page)
+    jobs = []
+    for page in range(1, total_pages + 1):
+        page_locations = page_slice(locations, page, rows_per_page)
+        # 每个任务只带本页位置的指标，减少传给工作进程的数据
+        page_capability = {key: stats for key, stats in capability.items() if key[0] in page_locations}
+        page_percentiles = None if percentiles is None else {
+            key: values for key, values in percentiles.items() if key[0] in page_locations}
+        jobs.append((model_name, page, total_pages, [(location, grouped[location]) for location in page_locations],
+                     page_capability, page_percentiles, os.path.join(output_dir, report_file_name(model_name, page)),
+                     include_plotlyjs))
+    return jobs
+
+
+def write_model_report(db_manager, model_name, output_dir='output', rows_per_page=10, table_name='optimized_data',
+                       include_plotlyjs=True):
+    """把模型的所有分布图页面写成 HTML 文件（在当前进程中逐页生成），返回文件路径列表"""
+    os.makedirs(output_dir, exist_ok=True)
+    return [render_report_page(job) for job in
+            model_report_jobs(db_manager, model_name, output_dir, rows_per_page, table_name, include_plotlyjs)]
+
+
+def write_reports(db_manager, model_names, output_dir='output', rows_per_page=10, table_name='optimized_data',
+                  max_workers=None, include_plotlyjs=True, on_model=None):
+    """在进程池中生成多个模型的全部页面并写出 index.html，返回 {模型: [文件路径]}
+
+    主进程按模型读取数据并切分任务，工作进程构建图形和写文件；读取下一个模型时上一个模型的页面仍在生成。
+    include_plotlyjs='directory' 时 plotly.js 只在输出目录保存一份，页面体积小得多但需和它放在一起。
+    on_model(模型, 文件路径列表) 在每个模型完成后调用。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if include_plotlyjs == 'directory':
+        # 预先写好，避免多个工作进程同时复制
+        bundle_path = os.path.join(output_dir, 'plotly.min.js')
+        if not os.path.exists(bundle_path):
+            with open(bundle_path, 'w', encoding='utf-8') as f:
+                f.write(get_plotlyjs())
+    reports = {}
+    index_entries = []
+
+    def collect(model_name, jobs, futures):
+        reports[model_name] = [future.result() for future in futures]
+        index_entries.append((model_name, [(os.path.basename(job[6]), [location for location, _ in job[3]])
+                                           for job in jobs]))
+        if on_model is not None:
+            on_model(model_name, reports[model_name])
+
+    # 界面从后台线程调用，与导入一样不能直接 fork 多线程的进程
+    with process_pool(max_workers) as executor:
+        pending = None
+        for model_name in model_names:
+            jobs = model_report_jobs(db_manager, model_name, output_dir, rows_per_page, table_name, include_plotlyjs)
+            futures = [executor.submit(render_report_page, job) for job in jobs]
+            if pending is not None:
+                collect(*pending)
+            pending = (model_name, jobs, futures)
+        if pending is not None:
+            collect(*pending)
+    write_report_index(output_dir, index_entries)
+    return reports
+
+
+def write_report_index(output_dir, index_entries):
+    """写出列出所有模型和页面的 index.html；index_entries 为 [(模型, [(文件名, [位置])])]"""
+    lines = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8"><title>分布图报告</title>',
+             '<style>body{font-family:sans-serif;margin:2em}td,th{padding:2px 12px;text-align:left}</style>',
+             '</head><body>', f'<h1>分布图报告</h1><p>生成时间 {time.strftime("%Y-%m-%d %H:%M:%S")}</p>']
+    for model_name, pages in index_entries:
+        location_total = sum(len(locations) for _, locations in pages)
+        lines.append(f'<h2>{html.escape(model_name)}</h2><p>{location_total} 个测量位置，{len(pages)} 页</p>')
+        lines.append('<table><tr><th>页</th><th>测量位置</th></tr>')
+        for page, (file_name, locations) in enumerate(pages, start=1):
+            span = f"{locations[0]} – {locations[-1]}" if locations else ""
+            lines.append(f'<tr><td><a href="{html.escape(file_name)}">第 {page} 页</a></td>'
+                         f'<td>{html.escape(span)}</td></tr>')
+        lines.append('</table>')
+    lines.append('</body></html>')
+    path = os.path.join(output_dir, 'index.html')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines))
+    return path
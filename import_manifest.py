@@ -0,0 +1,74 @@
+import hashlib
+import os
+import time
+
+# 采样哈希所取的块大小：文件开头一块 + 已导入区域末尾一块
+HASH_BLOCK_SIZE = 64 * 1024
+
+CREATE_MANIFEST_SQL = """
+CREATE TABLE IF NOT EXISTS import_manifest (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    content_hash TEXT,
+    last_offset INTEGER,
+    imported_at REAL
+)
+"""
+
+
+def create_manifest_table(conn):
+    conn.execute(CREATE_MANIFEST_SQL)
+    conn.commit()
+
+
+def load_manifest(conn):
+    """读取导入清单，返回 {path: (size, mtime, content_hash, last_offset)}"""
+    rows = conn.execute("SELECT path, size, mtime, content_hash, last_offset FROM import_manifest").fetchall()
+    return {row[0]: row[1:] for row in rows}
+
+
+def sampled_hash(file_path, end_offset):
+    """对 [0, end_offset) 的首块和末块做哈希，无需重读整个已导入区域"""
+    digest = hashlib.sha1(str(end_offset).encode())
+    with open(file_path, 'rb') as f:
+        digest.update(f.read(min(HASH_BLOCK_SIZE, end_offset)))
+        tail_start = max(HASH_BLOCK_SIZE, end_offset - HASH_BLOCK_SIZE)
+        if tail_start < end_offset:
+            f.seek(tail_start)
+            digest.update(f.read(end_offset - tail_start))
+    return digest.hexdigest()
+
+
+def plan_import(file_path, manifest, settle_seconds=60):
+    """根据清单（load_manifest 的结果）决定如何处理文件
+
+    返回 (action, start_offset, final)：action 为 'skip'、'append' 或 'full'；
+    final 为 False 表示文件仍在写入，末尾不完整的行暂不导入。
+    """
+    stat = os.stat(file_path)
+    final = time.time() - stat.st_mtime > settle_seconds
+    entry = manifest.get(os.path.abspath(file_path))
+    if entry is None:
+        return 'full', 0, final
+
+    size, mtime, content_hash, last_offset = entry
+    # 未变化的文件直接跳过；上次留下的不完整末行在文件写完后再补导
+    if stat.st_size == size and stat.st_mtime == mtime and (last_offset == size or not final):
+        return 'skip', last_offset, final
+    if stat.st_size >= last_offset and sampled_hash(file_path, last_offset) == content_hash:
+        if stat.st_size == last_offset:
+            return 'skip', last_offset, final
+        return 'append', last_offset, final
+    # 已导入的内容发生了变化，只能整体重新导入
+    return 'full', 0, final
+
+
+def record_import(conn, file_path, end_offset):
+    """记录文件已导入到 end_offset，由调用方与数据写入一起提交"""
+    stat = os.stat(file_path)
+    conn.execute(
+        "INSERT OR REPLACE INTO import_manifest (path, size, mtime, content_hash, last_offset, imported_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (os.path.abspath(file_path), stat.st_size, stat.st_mtime, sampled_hash(file_path, end_offset), end_offset, time.time())
+    )
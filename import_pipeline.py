@@ -0,0 +1,391 @@
+import os
+import queue
+import sqlite3
+import threading
+from collections import deque
+
+from adaptive_batch import BULK_TARGET_LATENCY, NORMAL_TARGET_LATENCY, AdaptiveBatchSizer
+from csv_processor_helpers import CSVReader, PerformanceMonitor, validate_csv_row
+from columnar_parser import ColumnarCSVReader, column_count
+from database_manager import DatabaseManager
+from import_manifest import create_manifest_table, load_manifest, plan_import, record_import
+from dedup import ensure_fingerprint_column, fingerprint_index_name, rows_to_columns
+from compact_schema import COMPACT_TABLE, CompactStore
+from parallel_parser import SPLIT_THRESHOLD_BYTES, parse_csv_range, process_pool, split_ranges
+from partitions import PartitionStore, default_partition_directory
+from location_summary import LocationSummary
+from model_catalog import ModelCatalog
+from quantile_sketch import SketchStore
+from query_indexes import ensure_covering_indexes
+
+# 估算导入行数时按每行约 150 字节计算
+BYTES_PER_ROW_ESTIMATE = 150
+# 新增行数超过现有行数的这个比例时，批量模式才删除并重建二级索引
+DROP_INDEX_RATIO = 0.25
+
+
+def parse_csv_file(file_path, chunk_size, parse_mode='columnar', start_offset=0, final=True):
+    """在工作进程中解析并验证文件（从 start_offset 开始），返回 (数据块列表, 结束偏移, 分阶段耗时)
+
+    分阶段耗时为 PerformanceMonitor.stage_totals() 的结果，由主进程合并到导入的监控器中。
+    """
+    monitor = PerformanceMonitor()
+    if parse_mode == 'columnar':
+        reader = ColumnarCSVReader(chunk_size=chunk_size, monitor=monitor)
+        chunks = list(reader.read_from_offset(file_path, start_offset, final))
+    else:
+        reader = CSVReader(chunk_size=chunk_size, monitor=monitor)
+        chunks = []
+        for chunk in reader.read_from_offset(file_path, start_offset, final):
+            with monitor.stage('validate', rows=len(chunk)):
+                chunks.append([validate_csv_row(row) for row in chunk])
+    return chunks, reader.end_offset, monitor.stage_totals()
+
+
+class ChunkWriter:
+    """按存储结构和去重设置把解析好的数据块写入数据库，导入流水线和实时跟踪共用"""
+
+    def __init__(self, db_manager, table_name='optimized_data', deduplicate=True, storage_schema='wide',
+                 on_log=print):
+        self.db_manager = db_manager
+        self.table_name = table_name
+        self.deduplicate = deduplicate
+        self.storage_schema = storage_schema
+        self.on_log = on_log
+        self.storage_table = table_name
+        self.compact_store = None
+        self.partition_store = None
+        self.location_summary = None
+
+    def prepare(self):
+        conn = self.db_manager.conn
+        if self.storage_schema == 'compact':
+            # 紧凑存储写入 compact_data，table_name 作为兼容视图
+            self.compact_store = CompactStore(conn)
+            migrated = self.compact_store.create_schema(self.table_name)
+            if migrated:
+                self.on_log(f"已把 {self.table_name} 的 {migrated} 行迁移到紧凑存储")
+            self.storage_table = COMPACT_TABLE
+            self.db_manager.add_rollback_hook(self.compact_store.load_caches)
+        elif self.storage_schema == 'partitioned':
+            # 按月分区：原始数据写入主库旁的 YYYY-MM.db 文件，派生表仍在主库
+            directory = default_partition_directory(conn)
+            if directory is None:
+                raise ValueError("内存数据库不支持按月分区存储")
+            self.partition_store = PartitionStore(conn, directory, self.table_name)
+            self.db_manager.use_partitions(self.partition_store)
+        else:
+            self.db_manager.create_data_table(self.table_name)
+            if self.deduplicate:
+                ensure_fingerprint_column(conn, self.table_name)
+        # 汇总表通过插入钩子在写入原始数据的同一事务内更新
+        self.location_summary = LocationSummary(conn)
+        backfilled = self.location_summary.ensure(self.table_name)
+        if backfilled:
+            self.on_log(f"已从 {self.table_name} 回填 {backfilled} 行到位置汇总表")
+        self.db_manager.add_insert_hook(self.location_summary.update)
+        self.db_manager.add_rollback_hook(self.location_summary.load_bin_ranges)
+        catalog = ModelCatalog(conn)
+        catalog.ensure(self.table_name)
+        self.db_manager.add_insert_hook(catalog.update)
+        sketches = SketchStore(conn)
+        sketches.ensure(self.table_name)
+        self.db_manager.add_insert_hook(sketches.update)
+
+    def write(self, chunk):
+        """写入一个数据块，返回 (块行数, 新增行数)"""
+        chunk_rows = column_count(chunk) if isinstance(chunk, dict) else len(chunk)
+        if not chunk_rows:
+            return 0, 0
+        if self.compact_store is not None:
+            columns = chunk if isinstance(chunk, dict) else rows_to_columns(chunk)
+            return chunk_rows, self.db_manager.insert_compact(self.compact_store, columns)
+        if self.deduplicate or self.partition_store is not None:
+            columns = chunk if isinstance(chunk, dict) else rows_to_columns(chunk)
+            return chunk_rows, self.db_manager.insert_columns_deduplicated(self.table_name, columns)
+        if isinstance(chunk, dict):
+            self.db_manager.insert_columns(self.table_name, chunk)
+        else:
+            self.db_manager.bulk_insert(self.table_name, chunk)
+        return chunk_rows, chunk_rows
+
+
+class ImportPipeline:
+    """多进程解析 + 单写线程的导入流水线
+
+    进程池并行解析文件，解析结果经有界队列交给唯一持有写连接的写线程，
+    队列满时停止派发新文件，从而形成背压。超过 split_threshold 字节的文件按行边界拆成多个
+    字节范围并行解析（见 parallel_parser），各范围按文件顺序写入。
+    """
+
+    def __init__(self, db_path, table_name='optimized_data', chunk_size=1000, max_workers=4,
+                 parse_mode='columnar', queue_size=None, performance_monitor=None,
+                 use_manifest=True, deduplicate=True, bulk_load=False, storage_schema='wide',
+                 metrics_dir='output', adaptive=False, split_threshold=SPLIT_THRESHOLD_BYTES,
+                 on_status=None, on_log=None, on_progress=None):
+        self.db_path = db_path
+        self.table_name = table_name
+        self.chunk_size = chunk_size
+        self.max_workers = max(1, max_workers)
+        self.parse_mode = parse_mode
+        self.queue_size = queue_size or self.max_workers * 2
+        self.performance_monitor = performance_monitor or PerformanceMonitor()
+        self.use_manifest = use_manifest
+        self.deduplicate = deduplicate
+        self.bulk_load = bulk_load
+        self.storage_schema = storage_schema
+        # 每次运行结束后把分阶段指标导出到这个目录（JSON 和 Prometheus 文本），None 表示不导出
+        self.metrics_dir = metrics_dir
+        # adaptive 为 True 时 chunk_size 只是初始值，导入中按实测写入/提交延迟和内存调整（见 adaptive_batch）
+        self.adaptive = adaptive
+        self.sizer = None
+        self.split_threshold = split_threshold
+        # 有范围解析或写入失败的文件，其后续范围不再写入
+        self.failed_files = set()
+        # 按范围写入的文件在写完最后一个范围前累计的 (处理行数, 新增行数)
+        self.file_rows = {}
+        # 合并提交时已写完但还未提交的文件（或范围），写入出错回滚时它们会一起丢失
+        self.uncommitted_files = []
+        self.seen_commits = 0
+        self.on_status = on_status or (lambda file_name, status: None)
+        self.on_log = on_log or print
+        self.on_progress = on_progress or (lambda done, total: None)
+
+    def run(self, file_paths):
+        file_paths = list(file_paths)
+        total_files = len(file_paths)
+        manifest = self._load_manifest()
+        plans = []
+        for file_path in file_paths:
+            plan = ('full', 0, True)
+            if manifest is not None:
+                plan = plan_import(file_path, manifest)
+                if plan[0] == 'full' and os.path.abspath(file_path) in manifest:
+                    self.on_log(f"文件内容已变化，重新整体导入: {file_path}")
+            plans.append((file_path, plan))
+
+        self.failed_files = set()
+        self.file_rows = {}
+        self.uncommitted_files = []
+        self.seen_commits = 0
+        self.writer_error = None
+        self.queue_closed = False
+        if self.adaptive:
+            self.sizer = AdaptiveBatchSizer(
+                self.performance_monitor,
+                target_latency=BULK_TARGET_LATENCY if self.bulk_load else NORMAL_TARGET_LATENCY,
+                chunk_size=self.chunk_size,
+                in_flight=self.queue_size,
+                max_commit_delay=5.0 if self.bulk_load else 1.0,
+                on_log=self.on_log
+            )
+
+        write_queue = queue.Queue(maxsize=self.queue_size)
+        writer = threading.Thread(target=self._writer_loop,
+                                  args=(write_queue, total_files, self._incoming_bytes(plans)), daemon=True)
+        writer.start()
+
+        try:
+            with process_pool(self.max_workers) as pool:
+                pending = deque()
+                for file_path, (action, start_offset, final) in plans:
+                    if self.writer_error is not None:
+                        # 写线程已失败，不再派发新文件
+                        break
+                    if action == 'skip':
+                        # 未变化的文件不再读取，只在写线程里计入进度
+                        self.on_status(os.path.basename(file_path), "未变化，已跳过")
+                        write_queue.put((file_path, None, True))
+                        continue
+                    self.on_status(os.path.basename(file_path), "解析中")
+                    chunk_size = self.sizer.chunk_size if self.sizer is not None else self.chunk_size
+                    tasks = self._parse_tasks(file_path, chunk_size, start_offset, final)
+                    for i, task in enumerate(tasks):
+                        pending.append((file_path, pool.submit(*task), i == len(tasks) - 1))
+                        # 在途任务数受限，写线程跟不上时这里会阻塞在队列上
+                        if len(pending) >= self.queue_size:
+                            self._hand_off(pending.popleft(), write_queue)
+                while pending and self.writer_error is None:
+                    self._hand_off(pending.popleft(), write_queue)
+                for _, future, _ in pending:
+                    future.cancel()
+        finally:
+            write_queue.put(None)
+            writer.join()
+
+        if self.writer_error is not None:
+            raise self.writer_error
+
+        if self.sizer is not None:
+            self.on_log(f"{self.sizer.describe()}（导入结束时）")
+        if self.metrics_dir:
+            try:
+                paths = self.performance_monitor.export(self.metrics_dir)
+                self.on_log(f"性能指标已导出: {', '.join(paths)}")
+            except OSError as e:
+                self.on_log(f"导出性能指标失败: {e}")
+        return self.performance_monitor.get_stats()
+
+    def _parse_tasks(self, file_path, chunk_size, start_offset, final):
+        """大文件按字节范围拆成多个解析任务（按文件顺序排列），其余文件整个交给一个进程"""
+        if self.max_workers > 1 and os.path.getsize(file_path) - start_offset >= self.split_threshold:
+            header, ranges = split_ranges(file_path, self.max_workers, start_offset, final)
+            if len(ranges) > 1:
+                self.on_log(f"大文件按 {len(ranges)} 个字节范围并行解析: {file_path}")
+                return [(parse_csv_range, file_path, header, start, end, chunk_size, self.parse_mode)
+                        for start, end in ranges]
+        return [(parse_csv_file, file_path, chunk_size, self.parse_mode, start_offset, final)]
+
+    def _incoming_bytes(self, plans):
+        return sum(os.path.getsize(file_path) - start_offset
+                   for file_path, (action, start_offset, _) in plans if action != 'skip')
+
+    def _load_manifest(self):
+        if not self.use_manifest:
+            return None
+        conn = sqlite3.connect(self.db_path)
+        try:
+            create_manifest_table(conn)
+            return load_manifest(conn)
+        finally:
+            conn.close()
+
+    def _hand_off(self, item, write_queue):
+        """把一个解析任务的结果交给写线程；last 表示这是该文件的最后一个任务，写线程据此计入进度"""
+        file_path, future, last = item
+        if file_path in self.failed_files:
+            # 同一文件前面的范围已失败，清单停在最后写入的范围，后续范围不再写入
+            future.cancel()
+        else:
+            try:
+                chunks, end_offset, stage_totals = future.result()
+            except Exception as e:
+                self.on_log(f"处理文件时出错 {file_path}: {e}")
+                self.on_status(os.path.basename(file_path), "处理失败")
+                self.failed_files.add(file_path)
+            else:
+                # 工作进程的读文件、解析和验证耗时（各进程耗时之和，可能超过总耗时）
+                self.performance_monitor.merge_stages(stage_totals, os.path.basename(file_path))
+                write_queue.put((file_path, (chunks, end_offset), last))
+                return
+        if last:
+            write_queue.put((file_path, None, True))
+
+    def _track_uncommitted(self, db_manager, file_path):
+        if db_manager.commit_count != self.seen_commits:
+            self.seen_commits = db_manager.commit_count
+            self.uncommitted_files = []
+        if db_manager.conn.in_transaction:
+            self.uncommitted_files.append(file_path)
+
+    def _report_rolled_back(self, failed_path):
+        """合并提交时，出错回滚会连带丢弃之前已写完但未提交的文件，把它们也标记为失败"""
+        for file_path in dict.fromkeys(self.uncommitted_files):
+            if file_path == failed_path:
+                continue
+            self.failed_files.add(file_path)
+            self.on_status(os.path.basename(file_path), "处理失败")
+            self.on_log(f"{file_path} 的数据尚未提交，已随出错回滚，下次导入时重新读取")
+        self.uncommitted_files = []
+
+    def _writer_loop(self, write_queue, total_files, incoming_bytes):
+        try:
+            self._write_all(write_queue, total_files, incoming_bytes)
+        except BaseException as e:
+            # 异常交给 run() 重新抛出；继续取走队列中的数据，派发线程不会阻塞在 put 上
+            self.writer_error = e
+            self.on_log(f"写入线程出错，导入中止: {e}")
+            while not self.queue_closed and write_queue.get() is not None:
+                pass
+
+    def _write_all(self, write_queue, total_files, incoming_bytes):
+        # 写连接只在写线程内创建和使用
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        db_manager = DatabaseManager(conn)
+        db_manager.monitor = self.performance_monitor
+        try:
+            chunk_writer = ChunkWriter(db_manager, self.table_name, self.deduplicate, self.storage_schema,
+                                       self.on_log)
+            chunk_writer.prepare()
+            storage_table = chunk_writer.storage_table
+            partitioned = chunk_writer.partition_store is not None
+            if self.bulk_load and partitioned:
+                # 每个分区文件都较小，只放宽 PRAGMA 和合并提交，不删除索引
+                with db_manager.bulk_load(storage_table, drop_indexes=False):
+                    self._drain(write_queue, chunk_writer, total_files)
+            elif self.bulk_load:
+                existing_rows = conn.execute(f"SELECT MAX(rowid) FROM {storage_table}").fetchone()[0] or 0
+                drop_indexes = incoming_bytes / BYTES_PER_ROW_ESTIMATE >= existing_rows * DROP_INDEX_RATIO
+                # 去重依赖指纹索引，不能在导入期间删除
+                with db_manager.bulk_load(storage_table, keep_indexes=[fingerprint_index_name(storage_table)],
+                                          drop_indexes=drop_indexes):
+                    self._drain(write_queue, chunk_writer, total_files)
+                if drop_indexes:
+                    self.on_log("批量导入完成，已重建二级索引")
+            else:
+                self._drain(write_queue, chunk_writer, total_files)
+            # 查询索引在导入完成后才建，批量导入时不拖慢写入
+            created = [] if partitioned else ensure_covering_indexes(conn, self.table_name)
+            if created:
+                self.on_log(f"已创建索引: {', '.join(created)}")
+        finally:
+            db_manager.close()
+
+    def _drain(self, write_queue, chunk_writer, total_files):
+        if self.sizer is not None:
+            # 在 bulk_load 设定的提交策略之后应用，批量导入结束时 bulk_load 会恢复原设置
+            self.sizer.apply(chunk_writer.db_manager)
+        done = 0
+        while True:
+            item = write_queue.get()
+            if item is None:
+                self.queue_closed = True
+                break
+            file_path, parsed, last = item
+            if parsed is not None and file_path in self.failed_files:
+                # 前面的范围写入失败（已回滚）时，已在队列中的后续范围也不写入，
+                # 清单不会越过失败的范围，下次导入从最后提交的位置续传
+                parsed = None
+            if parsed is not None:
+                self._write_file(chunk_writer, file_path, *parsed, last)
+            if last:
+                self.file_rows.pop(file_path, None)
+                done += 1
+                self.on_progress(done, total_files)
+
+    def _write_file(self, chunk_writer, file_path, chunks, end_offset, last=True):
+        file_name = os.path.basename(file_path)
+        self.on_status(file_name, "写入中")
+        rows_processed, rows_inserted = self.file_rows.pop(file_path, (0, 0))
+        # 写入、派生表和提交阶段由 DatabaseManager 记录，这里把它们归到当前文件
+        try:
+            with self.performance_monitor.current_file(file_name):
+                for chunk in chunks:
+                    chunk_rows, inserted = chunk_writer.write(chunk)
+                    rows_processed += chunk_rows
+                    rows_inserted += inserted
+                    self.performance_monitor.update(0, chunk_rows)
+                    if self.sizer is not None:
+                        self.sizer.adjust(chunk)
+                        self.sizer.apply(chunk_writer.db_manager)
+                if self.use_manifest:
+                    # 只有全部数据块都写入成功才记录清单；按范围写入时每个范围结束都是有效的续传位置
+                    record_import(chunk_writer.db_manager.conn, file_path, end_offset)
+                    chunk_writer.db_manager.maybe_commit()
+        except sqlite3.Error as e:
+            # 插入方法出错时已经回滚，这里再回滚一次以覆盖记录清单时的错误；
+            # 清单停在上次成功提交的位置，下次导入会重新读取
+            chunk_writer.db_manager.rollback()
+            self.failed_files.add(file_path)
+            self.on_status(file_name, "处理失败")
+            self.on_log(f"写入文件时出错 {file_path}: {e}，未提交的数据已回滚，下次导入时重新读取")
+            self._report_rolled_back(file_path)
+            return
+        self._track_uncommitted(chunk_writer.db_manager, file_path)
+        if not last:
+            self.file_rows[file_path] = (rows_processed, rows_inserted)
+            return
+        self.performance_monitor.update(1, 0)
+        self.on_status(file_name, "已完成")
+        self.on_log(f"成功处理文件: {file_path}，共处理 {rows_processed} 行，新增 {rows_inserted} 行")
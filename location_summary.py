@@ -0,0 +1,301 @@
+import numpy as np
+
+from compact_schema import parse_epoch, table_exists
+
+SUMMARY_TABLE = 'location_daily_summary'
+BINS_TABLE = 'location_histogram_bins'
+SUMMARY_MEASURES = [('V_Current', 'V_Min', 'V_Max'), ('A_Current', 'A_Min', 'A_Max'),
+                    ('Offset', 'Offset_Min', 'Offset_Max')]
+# 每个测量值的固定直方图桶数，另加下溢/上溢两个桶
+HISTOGRAM_BINS = 50
+# 桶范围在规格上下限两侧各扩展的比例
+HISTOGRAM_MARGIN = 0.5
+SOURCE_COLUMNS = ['Time', 'ModelName', 'Name_', 'Result'] + [name for measure in SUMMARY_MEASURES for name in measure]
+
+# 每天每个测量值存均值和离差平方和（M2），合并时按 Chan 的并行公式，不用平方和相减
+MEASURE_FIELDS = ['mean', 'm2', 'min', 'max', 'hist']
+SUMMARY_FIELDS = ['row_count', 'pass_count', 'fail_count'] + [
+    f"{measure}_{field}" for measure, _, _ in SUMMARY_MEASURES for field in MEASURE_FIELDS]
+
+CREATE_SUMMARY_SQL = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE} (
+        ModelName TEXT,
+        Name_ TEXT,
+        day TEXT,
+        row_count INTEGER,
+        pass_count INTEGER,
+        fail_count INTEGER,
+        {', '.join(f"{measure}_mean REAL, {measure}_m2 REAL, {measure}_min REAL, {measure}_max REAL, "
+                   f"{measure}_hist BLOB" for measure, _, _ in SUMMARY_MEASURES)},
+        PRIMARY KEY (ModelName, Name_, day)
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {BINS_TABLE} (
+        ModelName TEXT,
+        Name_ TEXT,
+        measure TEXT,
+        lo REAL,
+        hi REAL,
+        PRIMARY KEY (ModelName, Name_, measure)
+    )
+    """,
+]
+
+
+def day_strings(times):
+    """把 Time 文本转换为 'YYYY-MM-DD'，无法解析的为空字符串"""
+    epochs = parse_epoch(times)
+    valid = np.array([epoch is not None for epoch in epochs], dtype=bool)
+    days = np.full(len(epochs), '', dtype=object)
+    if valid.any():
+        stamps = np.array(epochs[valid].tolist(), dtype=np.int64).astype('datetime64[s]')
+        days[valid] = stamps.astype('datetime64[D]').astype(str)
+    return days
+
+
+def histogram_range(limit_min, limit_max, values):
+    """按规格上下限确定直方图范围；上下限无效时退回到数据本身的范围"""
+    try:
+        lo, hi = float(limit_min), float(limit_max)
+    except (TypeError, ValueError):
+        lo, hi = np.nan, np.nan
+    if not np.isfinite(lo) or not np.isfinite(hi) or hi <= lo:
+        finite = values[np.isfinite(values)]
+        lo, hi = (float(finite.min()), float(finite.max())) if len(finite) else (0.0, 0.0)
+    margin = (hi - lo) * HISTOGRAM_MARGIN
+    if margin <= 0:
+        margin = abs(lo) * HISTOGRAM_MARGIN or 1.0
+    return lo - margin, hi + margin
+
+
+def sql_value(value):
+    """numpy 标量转为 Python 值，直方图数组转为 BLOB"""
+    if isinstance(value, np.ndarray):
+        return value.tobytes()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def merge_moments(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+    """合并两组的 (计数, 均值, 离差平方和)（Chan 等人的并行算法），合并后的计数不能为 0"""
+    count = count_a + count_b
+    weight = count_b / count
+    delta = mean_b - mean_a
+    return count, mean_a + delta * weight, m2_a + m2_b + delta * delta * count_a * weight
+
+
+def combine_statistics(count, mean, m2, low, high):
+    """由计数、均值和离差平方和得到 min/max/avg/std（样本标准差，与 DataAnalyzer.grouped_statistics 一致）"""
+    if not count:
+        return {'min': 0.0, 'max': 0.0, 'avg': 0.0, 'std': 0.0}
+    variance = m2 / (count - 1) if count > 1 else 0.0
+    return {'min': low, 'max': high, 'avg': mean, 'std': max(variance, 0.0) ** 0.5}
+
+
+class LocationSummary:
+    """按 (模型, 测量位置, 日期) 增量维护的汇总表
+
+    汇总在原始数据插入的同一事务内更新（由 DatabaseManager 的插入钩子调用），
+    统计和分布图可以直接读汇总表，无需扫描原始数据。
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.bin_ranges = {}
+
+    def ensure(self, table_name='optimized_data', batch_size=50000):
+        """创建汇总表；汇总表是新建的且原始表已有数据时从原始表回填，返回回填行数"""
+        has_source = table_exists(self.conn, table_name) or table_exists(self.conn, table_name, 'view')
+        if self._outdated() and has_source:
+            # 旧版汇总表存的是和与平方和，能读到原始数据时删除后按新结构精确回填
+            self.conn.execute(f"DROP TABLE {SUMMARY_TABLE}")
+        created = not table_exists(self.conn, SUMMARY_TABLE)
+        if not created and self._outdated():
+            self._convert_sums()
+        for sql in CREATE_SUMMARY_SQL:
+            self.conn.execute(sql)
+        self.load_bin_ranges()
+        backfilled = 0
+        if created and has_source:
+            cursor = self.conn.execute(f"SELECT {', '.join(SOURCE_COLUMNS)} FROM {table_name}")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                columns = {name: np.array([row[i] for row in rows], dtype=object)
+                           for i, name in enumerate(SOURCE_COLUMNS)}
+                self.update(columns)
+                backfilled += len(rows)
+        self.conn.commit()
+        return backfilled
+
+    def _outdated(self):
+        columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({SUMMARY_TABLE})")]
+        return bool(columns) and f"{SUMMARY_MEASURES[0][0]}_m2" not in columns
+
+    def _convert_sums(self):
+        """没有原始数据可回填时（如分区存储），把旧版的和与平方和就地换算为均值和离差平方和"""
+        legacy = f"{SUMMARY_TABLE}_legacy"
+        self.conn.execute(f"ALTER TABLE {SUMMARY_TABLE} RENAME TO {legacy}")
+        self.conn.execute(CREATE_SUMMARY_SQL[0])
+        converted = ', '.join(
+            f"{m}_sum / row_count, MAX({m}_sumsq - {m}_sum * {m}_sum / row_count, 0), {m}_min, {m}_max, {m}_hist"
+            for m, _, _ in SUMMARY_MEASURES)
+        self.conn.execute(f"INSERT INTO {SUMMARY_TABLE} (ModelName, Name_, day, {', '.join(SUMMARY_FIELDS)}) "
+                          f"SELECT ModelName, Name_, day, row_count, pass_count, fail_count, {converted} "
+                          f"FROM {legacy} WHERE row_count > 0")
+        self.conn.execute(f"DROP TABLE {legacy}")
+
+    def load_bin_ranges(self):
+        """从数据库重新加载桶范围缓存（回滚后缓存中可能有未提交就被丢弃的范围）"""
+        self.bin_ranges = {tuple(row[:3]): (row[3], row[4]) for row in
+                           self.conn.execute(f"SELECT ModelName, Name_, measure, lo, hi FROM {BINS_TABLE}")}
+
+    def _add_bin_range(self, key, limit_min, limit_max, values):
+        # 其他连接可能已经写入了该位置的桶范围，以库中已有的为准
+        self.conn.execute(f"INSERT OR IGNORE INTO {BINS_TABLE} VALUES (?, ?, ?, ?, ?)",
+                          key + histogram_range(limit_min, limit_max, values))
+        self.bin_ranges[key] = self.conn.execute(
+            f"SELECT lo, hi FROM {BINS_TABLE} WHERE ModelName = ? AND Name_ = ? AND measure = ?", key).fetchone()
+
+    def update(self, columns, positions=None):
+        """把数据块中 positions 指定的行（默认全部）合并进汇总表，不提交"""
+        if positions is not None:
+            if not len(positions):
+                return
+            columns = {name: np.asarray(columns[name])[positions] for name in SOURCE_COLUMNS}
+        if not len(columns['ModelName']):
+            return
+        models = np.asarray(columns['ModelName'], dtype=object).astype(str)
+        names = np.asarray(columns['Name_'], dtype=object).astype(str)
+        days = day_strings(columns['Time'])
+        keys, first, inverse = np.unique(np.char.add(np.char.add(np.char.add(models, '\x1f'), names),
+                                                     np.char.add('\x1f', days.astype(str))),
+                                         return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        group_count = len(keys)
+
+        merged = {
+            'row_count': np.bincount(inverse, minlength=group_count),
+            'pass_count': np.bincount(inverse, weights=np.asarray(columns['Result'], dtype=object) == 'OK',
+                                      minlength=group_count).astype(np.int64),
+        }
+        merged['fail_count'] = merged['row_count'] - merged['pass_count']
+        for measure, limit_min, limit_max in SUMMARY_MEASURES:
+            values = np.asarray(columns[measure], dtype=np.float64)
+            # 两遍法：先求组均值，再累计离差平方和
+            mean = np.bincount(inverse, weights=values, minlength=group_count) / merged['row_count']
+            deviations = values - mean[inverse]
+            merged[f"{measure}_mean"] = mean
+            merged[f"{measure}_m2"] = np.bincount(inverse, weights=deviations * deviations, minlength=group_count)
+            low = np.full(group_count, np.inf)
+            high = np.full(group_count, -np.inf)
+            np.minimum.at(low, inverse, values)
+            np.maximum.at(high, inverse, values)
+            merged[f"{measure}_min"], merged[f"{measure}_max"] = low, high
+
+            # 每组的桶范围取自该 (模型, 位置) 首次出现时的规格上下限
+            ranges = np.empty((group_count, 2))
+            for g, i in enumerate(first):
+                key = (models[i], names[i], measure)
+                if key not in self.bin_ranges:
+                    self._add_bin_range(key, columns[limit_min][i], columns[limit_max][i], values[inverse == g])
+                ranges[g] = self.bin_ranges[key]
+            lo, hi = ranges[inverse, 0], ranges[inverse, 1]
+            bins = np.floor((values - lo) / (hi - lo) * HISTOGRAM_BINS)
+            bins = np.clip(np.nan_to_num(bins, nan=-1), -1, HISTOGRAM_BINS).astype(np.int64) + 1
+            hist = np.zeros((group_count, HISTOGRAM_BINS + 2), dtype=np.int64)
+            np.add.at(hist, (inverse, bins), 1)
+            merged[f"{measure}_hist"] = hist
+
+        records = []
+        for g, i in enumerate(first):
+            key = (models[i], names[i], days[i])
+            record = {field: merged[field][g] for field in SUMMARY_FIELDS}
+            existing = self.conn.execute(
+                f"SELECT {', '.join(SUMMARY_FIELDS)} FROM {SUMMARY_TABLE} WHERE ModelName = ? AND Name_ = ? AND day = ?",
+                key).fetchone()
+            if existing is not None:
+                existing = dict(zip(SUMMARY_FIELDS, existing))
+                for measure, _, _ in SUMMARY_MEASURES:
+                    _, record[f"{measure}_mean"], record[f"{measure}_m2"] = merge_moments(
+                        existing['row_count'], existing[f"{measure}_mean"], existing[f"{measure}_m2"],
+                        record['row_count'], record[f"{measure}_mean"], record[f"{measure}_m2"])
+                for field in SUMMARY_FIELDS:
+                    if field.endswith('_mean') or field.endswith('_m2'):
+                        continue
+                    if field.endswith('_min'):
+                        record[field] = min(record[field], existing[field])
+                    elif field.endswith('_max'):
+                        record[field] = max(record[field], existing[field])
+                    elif field.endswith('_hist'):
+                        record[field] = record[field] + np.frombuffer(existing[field], dtype=np.int64)
+                    else:
+                        record[field] = record[field] + existing[field]
+            records.append(key + tuple(sql_value(record[field]) for field in SUMMARY_FIELDS))
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO {SUMMARY_TABLE} (ModelName, Name_, day, {', '.join(SUMMARY_FIELDS)}) "
+            f"VALUES ({', '.join(['?' for _ in range(len(SUMMARY_FIELDS) + 3)])})", records)
+
+    def _day_filter(self, start_day, end_day):
+        clauses, params = [], []
+        if start_day:
+            clauses.append("day >= ?")
+            params.append(start_day)
+        if end_day:
+            clauses.append("day <= ?")
+            params.append(end_day)
+        return ''.join(f" AND {clause}" for clause in clauses), params
+
+    def location_statistics(self, model_name, start_day=None, end_day=None):
+        """返回 {位置: {'count', 'pass', 'fail', 测量名: {min, max, avg, std}}}，可按日期范围过滤"""
+        day_filter, params = self._day_filter(start_day, end_day)
+        # 各天合并：总均值由内层窗口函数算出，总 M2 = Σ(M2ᵢ + nᵢ·(均值ᵢ - 总均值)²)
+        columns = ', '.join(f"{m}_mean, {m}_m2, {m}_min, {m}_max, "
+                            f"SUM(row_count * {m}_mean) OVER w / SUM(row_count) OVER w AS {m}_total_mean"
+                            for m, _, _ in SUMMARY_MEASURES)
+        measure_sql = ', '.join(
+            f"MAX({m}_total_mean), SUM({m}_m2 + row_count * ({m}_mean - {m}_total_mean) * ({m}_mean - {m}_total_mean)), "
+            f"MIN({m}_min), MAX({m}_max)" for m, _, _ in SUMMARY_MEASURES)
+        rows = self.conn.execute(
+            f"SELECT Name_, SUM(row_count), SUM(pass_count), SUM(fail_count), {measure_sql} FROM ("
+            f"SELECT Name_, row_count, pass_count, fail_count, {columns} FROM {SUMMARY_TABLE} "
+            f"WHERE ModelName = ?{day_filter} AND row_count > 0 WINDOW w AS (PARTITION BY Name_)"
+            f") GROUP BY Name_ ORDER BY Name_",
+            [model_name] + params).fetchall()
+        result = {}
+        for row in rows:
+            stats = {'count': row[1], 'pass': row[2], 'fail': row[3]}
+            for i, (measure, _, _) in enumerate(SUMMARY_MEASURES):
+                stats[measure] = combine_statistics(row[1], *row[4 + i * 4:8 + i * 4])
+            result[row[0]] = stats
+        return result
+
+    def histogram(self, model_name, location, measure, start_day=None, end_day=None):
+        """返回 (桶边界, 计数)；计数首尾两项为下溢/上溢桶，没有数据时返回 None"""
+        bin_range = self.bin_ranges.get((model_name, location, measure))
+        if bin_range is None:
+            return None
+        day_filter, params = self._day_filter(start_day, end_day)
+        counts = np.zeros(HISTOGRAM_BINS + 2, dtype=np.int64)
+        for (blob,) in self.conn.execute(
+                f"SELECT {measure}_hist FROM {SUMMARY_TABLE} WHERE ModelName = ? AND Name_ = ?{day_filter}",
+                [model_name, location] + params):
+            counts += np.frombuffer(blob, dtype=np.int64)
+        return np.linspace(bin_range[0], bin_range[1], HISTOGRAM_BINS + 1), counts
+
+    def model_statistics(self):
+        """按模型汇总，返回与 DataAnalyzer.calculate_statistics 相同结构的 {模型: {测量名: {min, max, avg}}}"""
+        measure_sql = ', '.join(f"SUM(row_count * {m}_mean), MIN({m}_min), MAX({m}_max)" for m, _, _ in SUMMARY_MEASURES)
+        stats = {}
+        for row in self.conn.execute(
+                f"SELECT ModelName, SUM(row_count), {measure_sql} FROM {SUMMARY_TABLE} GROUP BY ModelName"):
+            count = row[1]
+            stats[row[0]] = {
+                measure: {'min': row[3 + i * 3], 'max': row[4 + i * 3], 'avg': row[2 + i * 3] / count}
+                for i, (measure, _, _) in enumerate(SUMMARY_MEASURES)
+            }
+        return stats
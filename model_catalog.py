@@ -0,0 +1,125 @@
+"""模型/测量位置目录：导入时维护行数和首末出现时间，界面读取带代数校验的内存缓存"""
+import sqlite3
+
+import numpy as np
+
+from compact_schema import parse_epoch, table_exists
+
+CATALOG_TABLE = 'model_catalog'
+GENERATION_TABLE = 'catalog_generation'
+
+CREATE_CATALOG_SQL = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {CATALOG_TABLE} (
+        ModelName TEXT,
+        Name_ TEXT,
+        row_count INTEGER,
+        first_seen INTEGER,
+        last_seen INTEGER,
+        PRIMARY KEY (ModelName, Name_)
+    )
+    """,
+    f"CREATE TABLE IF NOT EXISTS {GENERATION_TABLE} (id INTEGER PRIMARY KEY CHECK (id = 1), generation INTEGER)",
+    f"INSERT OR IGNORE INTO {GENERATION_TABLE} VALUES (1, 0)",
+]
+
+# 已有行与新数据块合并：行数累加，首末时间取两者的最小/最大值（忽略空值）
+UPSERT_SQL = f"""
+INSERT INTO {CATALOG_TABLE} (ModelName, Name_, row_count, first_seen, last_seen) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (ModelName, Name_) DO UPDATE SET
+    row_count = row_count + excluded.row_count,
+    first_seen = COALESCE(MIN(first_seen, excluded.first_seen), first_seen, excluded.first_seen),
+    last_seen = COALESCE(MAX(last_seen, excluded.last_seen), last_seen, excluded.last_seen)
+"""
+
+
+def current_generation(conn):
+    """目录的代数；每次导入写入都会加一，表不存在时返回 None"""
+    try:
+        row = conn.execute(f"SELECT generation FROM {GENERATION_TABLE} WHERE id = 1").fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+
+class ModelCatalog:
+    """在原始数据插入的同一事务内更新目录（作为 DatabaseManager 的插入钩子）"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def ensure(self, table_name='optimized_data', batch_size=50000):
+        """创建目录表；目录是新建的且原始表已有数据时从原始表回填，返回回填行数"""
+        created = not table_exists(self.conn, CATALOG_TABLE)
+        for sql in CREATE_CATALOG_SQL:
+            self.conn.execute(sql)
+        backfilled = 0
+        if created and (table_exists(self.conn, table_name) or table_exists(self.conn, table_name, 'view')):
+            cursor = self.conn.execute(f"SELECT ModelName, Name_, Time FROM {table_name}")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                self.update({name: np.array([row[i] for row in rows], dtype=object)
+                             for i, name in enumerate(['ModelName', 'Name_', 'Time'])})
+                backfilled += len(rows)
+        self.conn.commit()
+        return backfilled
+
+    def update(self, columns, positions=None):
+        """把数据块中 positions 指定的行（默认全部）计入目录并增加代数，不提交"""
+        if positions is not None:
+            if not len(positions):
+                return
+            columns = {name: np.asarray(columns[name])[positions] for name in ('ModelName', 'Name_', 'Time')}
+        models = np.asarray(columns['ModelName'], dtype=object).astype(str)
+        if not len(models):
+            return
+        names = np.asarray(columns['Name_'], dtype=object).astype(str)
+        epochs = np.array([np.nan if epoch is None else epoch for epoch in parse_epoch(columns['Time'])],
+                          dtype=np.float64)
+        keys, first, inverse = np.unique(np.char.add(np.char.add(models, '\x1f'), names),
+                                         return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse, minlength=len(keys))
+        first_seen = np.full(len(keys), np.inf)
+        last_seen = np.full(len(keys), -np.inf)
+        np.fmin.at(first_seen, inverse, epochs)
+        np.fmax.at(last_seen, inverse, epochs)
+        self.conn.executemany(UPSERT_SQL, [
+            (models[i], names[i], int(counts[g]),
+             int(first_seen[g]) if np.isfinite(first_seen[g]) else None,
+             int(last_seen[g]) if np.isfinite(last_seen[g]) else None)
+            for g, i in enumerate(first)
+        ])
+        self.conn.execute(f"UPDATE {GENERATION_TABLE} SET generation = generation + 1 WHERE id = 1")
+
+
+class CatalogCache:
+    """目录的内存缓存：只有数据库中的代数变化时才重新读取目录表"""
+
+    def __init__(self):
+        self.generation = None
+        self.entries = []
+        self.model_names = []
+
+    def refresh(self, conn):
+        generation = current_generation(conn)
+        if generation is None:
+            self.generation, self.entries, self.model_names = None, [], []
+        elif generation != self.generation:
+            self.entries = conn.execute(
+                f"SELECT ModelName, Name_, row_count, first_seen, last_seen FROM {CATALOG_TABLE} "
+                f"ORDER BY ModelName, Name_").fetchall()
+            self.model_names = sorted({entry[0] for entry in self.entries})
+            self.generation = generation
+        return self.entries
+
+    def models(self, conn):
+        """按名称排序的模型列表"""
+        self.refresh(conn)
+        return self.model_names
+
+    def locations(self, conn, model_name):
+        """模型的 [(位置, 行数, 首次出现, 最后出现)]，时间为 UTC 时间戳"""
+        return [entry[1:] for entry in self.refresh(conn) if entry[0] == model_name]
@@ -1,20 +1,38 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
-import math
 import sqlite3
 import logging
 import queue
 import threading
 import asyncio
+import webbrowser
 from concurrent.futures import ThreadPoolExecutor
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 
 # 导入新的辅助类和函数
 from csv_processor_helpers import CSVReader, PerformanceMonitor, validate_csv_row, DataAnalyzer
 from config_interface import show_config_dialog
 from database_manager import DatabaseManager  # 新增这行
+from connection_pool import ConnectionPool
+from ui_events import UIEventBus
+from columnar_parser import ColumnarCSVReader, column_count
+from import_pipeline import ImportPipeline
+from dedup import ensure_fingerprint_column, rows_to_columns
+from compact_schema import CompactStore, table_exists
+from partitions import UNDATED, PartitionStore, default_partition_directory
+from tail_ingest import TailIngester
+from location_summary import LocationSummary
+from model_catalog import CatalogCache, ModelCatalog
+from quantile_sketch import SketchStore
+from query_indexes import ensure_covering_indexes
+from capability import compute_capability, format_capability
+from distribution_report import (DistributionDataSource, page_count, build_distribution_figure, sketch_percentiles,
+                                 write_reports)
+
+# 日志区域最多保留的行数
+MAX_LOG_LINES = 2000
+# 按月分区存储时，分布图和能力分析只读取最近几个月的分区
+PARTITION_PLOT_MONTHS = 3
 
 
 class OptimizedCSVToSQLiteApp:
@@ -27,7 +45,12 @@ class OptimizedCSVToSQLiteApp:
             'chunk_size': 1000,
             'db_path': 'avisql_single.db',
             'max_threads': 4,
-            'log_level': 'INFO'
+            'log_level': 'INFO',
+            'parse_mode': 'columnar',
+            'import_mode': 'normal',
+            'storage_schema': 'wide',
+            # adaptive：chunk_size 只作为初始值，导入中按实测延迟和内存自动调整
+            'batch_mode': 'adaptive'
         }
 
         self.setup_async_processor()
@@ -35,14 +58,23 @@ class OptimizedCSVToSQLiteApp:
         self.setup_database()  # 移到这里
         self.setup_ui()  # 移到数据库设置之后
         
-        self.csv_reader = CSVReader(chunk_size=self.config['chunk_size'])
+        self.csv_reader = self.create_csv_reader()
         self.performance_monitor = PerformanceMonitor()
 
+    def create_csv_reader(self):
+        if self.config['parse_mode'] == 'columnar':
+            return ColumnarCSVReader(chunk_size=self.config['chunk_size'])
+        return CSVReader(chunk_size=self.config['chunk_size'])
+
     def setup_ui(self):
         self.create_menu()
         self.create_file_list()
         self.create_progress_bars()
         self.create_log_area()
+        # 工作线程只投递事件，由 Tk 线程定时批量刷新界面
+        self.ui_events = UIEventBus(self.master, self.apply_file_statuses, self.append_log_lines,
+                                    self.apply_overall_progress)
+        self.ui_events.start()
         self.create_model_selector()
         self.update_model_list()  # 确保在这里调用
 
@@ -54,10 +86,18 @@ class OptimizedCSVToSQLiteApp:
             messagebox.showerror("错误", f"数据库文件 {db_path} 不存在")
             return
 
+        self.db_path = db_path
         try:
-            connection = sqlite3.connect(db_path, check_same_thread=False)
-            self.db_manager = DatabaseManager(connection)
-            self.db_manager.conn.execute("PRAGMA journal_mode=WAL")
+            # 一个写连接 + 若干只读 WAL 连接：导入期间绘图和模型列表查询不必排在写入后面
+            pool = ConnectionPool(db_path, readers=self.config['max_threads'])
+            self.db_manager = DatabaseManager(pool.writer, pool)
+            # 翻页和重新选择模型时重复的位置列表/分页数据查询直接命中缓存
+            self.db_manager.enable_result_cache()
+            self.location_summary = None
+            self.model_catalog = None
+            self.sketch_store = None
+            self.catalog_cache = CatalogCache()
+            self.distribution_source = DistributionDataSource(self.db_manager)
             self.log_message(f"成功连接到数据库: {db_path}")
         except sqlite3.Error as e:
             self.log_message(f"连接数据库时出错: {e}")
@@ -79,11 +119,13 @@ class OptimizedCSVToSQLiteApp:
 
     def update_model_list(self):
         if hasattr(self, 'db_manager'):
+            self.distribution_source.invalidate()
             try:
-                query = "SELECT DISTINCT ModelName FROM optimized_data"
-                models = self.db_manager.execute_query(query)
+                # 读取导入时维护的模型目录，目录代数不变时直接使用内存缓存
+                with self.db_manager.reader() as conn:
+                    models = self.catalog_cache.models(conn)
                 if models:
-                    self.model_selector['values'] = [model[0] for model in models]
+                    self.model_selector['values'] = models
                     self.log_message(f"成功更新模型列表，找到 {len(models)} 个模型")
                 else:
                     self.log_message("警告：没有找到任何模型")
@@ -112,12 +154,15 @@ class OptimizedCSVToSQLiteApp:
         menubar.add_cascade(label="文件", menu=file_menu)
         file_menu.add_command(label="选择CSV文件夹", command=self.select_directory)
         file_menu.add_command(label="执行导入", command=self.execute_import)
+        file_menu.add_command(label="开始/停止实时跟踪", command=self.toggle_follow_mode)
         file_menu.add_separator()
         file_menu.add_command(label="退出", command=self.master.quit)
 
         view_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="查看", menu=view_menu)
         view_menu.add_command(label="生成数据分布图", command=self.plot_distribution)
+        view_menu.add_command(label="过程能力分析", command=self.show_capability)
+        view_menu.add_command(label="导出全部HTML报告", command=self.export_reports)
 
         config_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="配置", menu=config_menu)
@@ -128,6 +173,8 @@ class OptimizedCSVToSQLiteApp:
         self.file_list.heading("Status", text="状态")
         self.file_list.column("Status", width=100)
         self.file_list.pack(pady=10, padx=10, fill=tk.BOTH, expand=True)
+        # 文件名 -> Treeview 条目 id，更新状态时不必遍历所有条目
+        self.file_items = {}
 
     def create_progress_bars(self):
         self.overall_progress = ttk.Progressbar(self.master, length=400, mode='determinate')
@@ -155,35 +202,22 @@ class OptimizedCSVToSQLiteApp:
                                 format='%(asctime)s:%(levelname)s:%(message)s')
 
     def create_table(self):
-        create_table_sql = """
-        CREATE TABLE IF NOT EXISTS optimized_data (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            Time TEXT,
-            BarCode TEXT,
-            ModelName TEXT,
-            Name_ TEXT,
-            Status_V TEXT,
-            V_Current REAL,
-            V_Min REAL,
-            V_Max REAL,
-            Status_A TEXT,
-            A_Current REAL,
-            A_Min REAL,
-            A_Max REAL,
-            Status_O TEXT,
-            Offset REAL,
-            Offset_Min REAL,
-            Offset_Max REAL,
-            Status_VAO TEXT,
-            RResult TEXT,
-            Result TEXT
-        )
-        """
+        if self.db_manager.partitions is not None and self.config['storage_schema'] != 'partitioned':
+            self.db_manager.partitions.detach_all()
+            self.db_manager.use_partitions(None)
+        if self.config['storage_schema'] == 'partitioned':
+            self.create_partition_store()
+            self.ensure_location_summary()
+            return
+        if self.config['storage_schema'] == 'compact':
+            self.create_compact_schema()
+            self.ensure_location_summary()
+            return
         try:
-            self.db_manager.conn.execute(create_table_sql)
-            self.db_manager.conn.commit()
-            self.log_message("成功创建或验证数据表存在")
-            self.create_indexes()
+            self.db_manager.create_data_table('optimized_data')
+            self.log_message("成功创建或验证数据表及索引存在")
+            ensure_fingerprint_column(self.db_manager.conn, 'optimized_data')
+            ensure_covering_indexes(self.db_manager.conn, 'optimized_data')
         except sqlite3.Error as e:
             self.log_message(f"创建或验证数据表时出错: {e}")
             messagebox.showerror("数据库错误", f"创建或验证数据表时出错: {e}")
@@ -199,15 +233,55 @@ class OptimizedCSVToSQLiteApp:
         except sqlite3.Error as e:
             self.log_message(f"创建 optimized_data 视图时出错: {e}")
             messagebox.showerror("数据库错误", f"创建 optimized_data 视图时出错: {e}")
+        self.ensure_location_summary()
 
-    def create_indexes(self):
+    def ensure_location_summary(self):
+        """创建位置汇总表、模型目录和分位数草图，并挂到单文件导入的插入钩子上（只挂一次）"""
         try:
-            self.db_manager.conn.execute("CREATE INDEX IF NOT EXISTS idx_model_name ON optimized_data (ModelName)")
-            self.db_manager.conn.execute("CREATE INDEX IF NOT EXISTS idx_bar_code ON optimized_data (BarCode)")
-            self.db_manager.conn.commit()
-            self.log_message("成功创建索引")
+            if self.location_summary is None:
+                self.location_summary = LocationSummary(self.db_manager.conn)
+                self.db_manager.add_insert_hook(self.location_summary.update)
+                self.db_manager.add_rollback_hook(self.location_summary.load_bin_ranges)
+            backfilled = self.location_summary.ensure('optimized_data')
+            if backfilled:
+                self.log_message(f"已回填 {backfilled} 行到位置汇总表")
+            if self.model_catalog is None:
+                self.model_catalog = ModelCatalog(self.db_manager.conn)
+                self.db_manager.add_insert_hook(self.model_catalog.update)
+            self.model_catalog.ensure('optimized_data')
+            if self.sketch_store is None:
+                self.sketch_store = SketchStore(self.db_manager.conn)
+                self.db_manager.add_insert_hook(self.sketch_store.update)
+            self.sketch_store.ensure('optimized_data')
         except sqlite3.Error as e:
-            self.log_message(f"创建索引时出错: {e}")
+            self.log_message(f"创建位置汇总表时出错: {e}")
+
+    def create_compact_schema(self):
+        try:
+            if table_exists(self.db_manager.conn, 'optimized_data'):
+                self.log_message("正在把 optimized_data 迁移到紧凑存储...")
+            migrated = CompactStore(self.db_manager.conn).create_schema('optimized_data')
+            if migrated:
+                self.log_message(f"迁移完成，共 {migrated} 行")
+            ensure_covering_indexes(self.db_manager.conn, 'optimized_data')
+            self.log_message("成功创建或验证紧凑存储及 optimized_data 兼容视图")
+        except sqlite3.Error as e:
+            self.log_message(f"创建紧凑存储时出错: {e}")
+            messagebox.showerror("数据库错误", f"创建紧凑存储时出错: {e}")
+
+    def create_partition_store(self):
+        directory = default_partition_directory(self.db_manager.conn)
+        if self.db_manager.partitions is None:
+            self.db_manager.use_partitions(PartitionStore(self.db_manager.conn, directory, 'optimized_data'))
+        self.log_message(f"使用按月分区存储，分区目录: {directory}")
+
+    def data_table(self, db_manager=None):
+        """绘图和统计查询的数据来源：原表（或兼容视图），分区存储时为最近几个月分区的子查询"""
+        partitions = (db_manager or self.db_manager).partitions
+        if partitions is None:
+            return 'optimized_data'
+        months = [month for month in partitions.months() if month != UNDATED][-PARTITION_PLOT_MONTHS:]
+        return partitions.range_table(f"{months[0]}-01" if months else None)
 
     def select_directory(self):
         self.directory = filedialog.askdirectory(title="选择包含CSV文件的目录")
@@ -217,25 +291,47 @@ class OptimizedCSVToSQLiteApp:
 
     def update_file_list(self):
         self.file_list.delete(*self.file_list.get_children())
+        self.file_items = {}
         for file in os.listdir(self.directory):
             if file.endswith('.csv'):
-                self.file_list.insert('', 'end', text=file, values=("待处理",))
+                self.file_items[file] = self.file_list.insert('', 'end', text=file, values=("待处理",))
 
     async def process_csv_files(self):
         csv_files = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith('.csv')]
         total_files = len(csv_files)
-        self.overall_progress['maximum'] = total_files
-
-        for i, file_path in enumerate(csv_files):
-            try:
-                await self.loop.run_in_executor(self.executor, self.process_csv, file_path)
-                self.overall_progress['value'] = i + 1
-                self.master.update_idletasks()
-            except Exception as e:
-                self.log_message(f"处理文件 {file_path} 时出错: {e}")
+        self.update_overall_progress(0, total_files)
+
+        # 进程池并行解析，写线程独占写连接；max_threads 决定解析进程数
+        pipeline = ImportPipeline(
+            self.db_path,
+            table_name='optimized_data',
+            chunk_size=self.config['chunk_size'],
+            max_workers=self.config['max_threads'],
+            parse_mode=self.config['parse_mode'],
+            bulk_load=self.config['import_mode'] == 'bulk',
+            storage_schema=self.config['storage_schema'],
+            adaptive=self.config['batch_mode'] == 'adaptive',
+            performance_monitor=self.performance_monitor,
+            metrics_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output'),
+            on_status=self.update_file_status,
+            on_log=self.log_message,
+            on_progress=self.update_overall_progress
+        )
+        try:
+            await self.loop.run_in_executor(self.executor, pipeline.run, csv_files)
+        except Exception as e:
+            self.log_message(f"导入过程中出错: {e}")
 
         self.log_message(f"处理完成。性能统计：{self.performance_monitor.get_stats()}")
 
+    def update_overall_progress(self, done, total):
+        """可在任意线程调用"""
+        self.ui_events.post_progress(done, total)
+
+    def apply_overall_progress(self, done, total):
+        self.overall_progress['maximum'] = total
+        self.overall_progress['value'] = done
+
     def process_csv(self, file_path):
         try:
             file_name = os.path.basename(file_path)
@@ -243,10 +339,15 @@ class OptimizedCSVToSQLiteApp:
             
             rows_processed = 0
             for chunk in self.csv_reader.read_in_chunks(file_path):
-                validated_chunk = [validate_csv_row(row) for row in chunk]
-                self.db_manager.bulk_insert('optimized_data', validated_chunk)
-                rows_processed += len(chunk)
-                self.performance_monitor.update(0, len(chunk))
+                if isinstance(self.csv_reader, ColumnarCSVReader):
+                    # 列式块已在解析时完成验证和类型转换
+                    columns = chunk
+                else:
+                    columns = rows_to_columns([validate_csv_row(row) for row in chunk])
+                self.db_manager.insert_columns_deduplicated('optimized_data', columns)
+                chunk_rows = column_count(columns)
+                rows_processed += chunk_rows
+                self.performance_monitor.update(0, chunk_rows)
 
             self.performance_monitor.update(1, 0)  # 更新处理的文件数
             self.update_file_status(file_name, "已完成")
@@ -256,10 +357,14 @@ class OptimizedCSVToSQLiteApp:
             self.update_file_status(file_name, "处理失败")
 
     def update_file_status(self, file_name, status):
-        for item in self.file_list.get_children():
-            if self.file_list.item(item)["text"] == file_name:
+        """可在任意线程调用，同一文件在一个刷新周期内的多次状态只显示最新的一次"""
+        self.ui_events.post_status(file_name, status)
+
+    def apply_file_statuses(self, statuses):
+        for file_name, status in statuses.items():
+            item = self.file_items.get(file_name)
+            if item is not None:
                 self.file_list.set(item, "Status", status)
-                break
 
     def execute_import(self):
         if not hasattr(self, 'directory'):
@@ -271,6 +376,34 @@ class OptimizedCSVToSQLiteApp:
         self.master.after(0, self.start_import_process)
         self.master.after(1000, self.update_model_list)  # 添加这行，1秒后更新列表
 
+    def toggle_follow_mode(self):
+        follower = getattr(self, 'tail_ingester', None)
+        if follower is not None and follower.is_running():
+            follower.stop()
+            return
+        if not hasattr(self, 'directory'):
+            messagebox.showerror("错误", "请先选择CSV文件目录")
+            return
+
+        # 跟踪当天仍在写入的CSV，新追加的行几秒内入库
+        self.tail_ingester = TailIngester(
+            self.db_path,
+            self.directory,
+            table_name='optimized_data',
+            chunk_size=self.config['chunk_size'],
+            parse_mode=self.config['parse_mode'],
+            storage_schema=self.config['storage_schema'],
+            adaptive=self.config['batch_mode'] == 'adaptive',
+            on_log=self.log_message,
+            on_rows=self.on_follow_rows
+        )
+        self.tail_ingester.start()
+
+    def on_follow_rows(self, file_name, rows):
+        self.log_message(f"实时导入 {file_name}: 新增 {rows} 行")
+        # 新增数据可能带来新的测量位置
+        self.distribution_source.invalidate()
+
     def start_import_process(self):
         try:
             asyncio.run_coroutine_threadsafe(self.process_csv_files(), self.loop)
@@ -280,166 +413,43 @@ class OptimizedCSVToSQLiteApp:
             messagebox.showerror("错误", f"启动导入进程时出错: {e}")
 
     def log_message(self, message):
+        """可在任意线程调用；控制台和日志文件立即写入，日志区域由 Tk 线程批量追加"""
         print(message)  # 总是打印到控制台
-        if hasattr(self, 'log_text'):
-            self.log_text.insert(tk.END, message + "\n")
-            self.log_text.see(tk.END)
+        if hasattr(self, 'ui_events'):
+            self.ui_events.post_log(message)
         logging.info(message)
 
-
-    # def plot_distribution(self, model_name, page=1, locations_per_page=5):
-    #  try:
-    #     query = """
-    #     SELECT Name_, V_Current, V_Min, V_Max, A_Current, A_Min, A_Max, Offset, Offset_Min, Offset_Max
-    #     FROM all_data
-    #     WHERE ModelName = ?
-    #     """
-    #     rows = self.db_manager.execute_query(query, (model_name,))
-
-    #     if not rows:
-    #         messagebox.showinfo("信息", f"没有找到{model_name}的数据")
-    #         return
-
-    #     measurement_locations = sorted(set(row[0] for row in rows))
-    #     total_locations = len(measurement_locations)
-    #     total_pages = math.ceil(total_locations / locations_per_page)
-
-    #     start_index = (page - 1) * locations_per_page
-    #     end_index = min(start_index + locations_per_page, total_locations)
-    #     current_locations = measurement_locations[start_index:end_index]
-
-    #     fig = make_subplots(rows=len(current_locations), cols=3,
-    #                         subplot_titles=[f"{loc} - V_Current | A_Current | Offset" for loc in current_locations],
-    #                         vertical_spacing=0.1,
-    #                         horizontal_spacing=0.05)
-
-    #     colors = {'V': 'blue', 'A': 'red', 'O': 'green'}
-
-    #     for i, location in enumerate(current_locations):
-    #         location_data = [row for row in rows if row[0] == location]
-            
-    #         v_data = [row[1] for row in location_data]
-    #         a_data = [row[4] for row in location_data]
-    #         o_data = [row[7] for row in location_data]
-
-    #         row = i + 1
-
-    #         # V_Current
-    #         fig.add_trace(go.Histogram(x=v_data, name="V_Current", marker_color=colors['V'], opacity=0.7), row=row, col=1)
-    #         fig.add_vline(x=location_data[0][2], line_dash="dash", line_color=colors['V'], row=row, col=1)  # V_Min
-    #         fig.add_vline(x=location_data[0][3], line_dash="dash", line_color=colors['V'], row=row, col=1)  # V_Max
-
-    #         # A_Current
-    #         fig.add_trace(go.Histogram(x=a_data, name="A_Current", marker_color=colors['A'], opacity=0.7), row=row, col=2)
-    #         fig.add_vline(x=location_data[0][5], line_dash="dash", line_color=colors['A'], row=row, col=2)  # A_Min
-    #         fig.add_vline(x=location_data[0][6], line_dash="dash", line_color=colors['A'], row=row, col=2)  # A_Max
-
-    #         # Offset
-    #         fig.add_trace(go.Histogram(x=o_data, name="Offset", marker_color=colors['O'], opacity=0.7), row=row, col=3)
-    #         fig.add_vline(x=location_data[0][8], line_dash="dash", line_color=colors['O'], row=row, col=3)  # Offset_Min
-    #         fig.add_vline(x=location_data[0][9], line_dash="dash", line_color=colors['O'], row=row, col=3)  # Offset_Max
-
-    #     fig.update_layout(
-    #         height=300 * len(current_locations),
-    #         width=1200,
-    #         title_text=f"Distribution for {model_name} (Page {page}/{total_pages})",
-    #         showlegend=False,
-    #         font=dict(size=10)
-    #     )
-
-    #     for i in range(1, len(current_locations) + 1):
-    #         for j in range(1, 4):
-    #             fig.update_xaxes(title_text="Value", title_font=dict(size=8), tickfont=dict(size=8), row=i, col=j)
-    #             fig.update_yaxes(title_text="Frequency", title_font=dict(size=8), tickfont=dict(size=8), row=i, col=j)
-
-    #     fig.show()
-
-    #     # 添加分页控制
-    #     if total_pages > 1:
-    #         if page < total_pages:
-    #             messagebox.showinfo("分页", f"当前页面 {page}/{total_pages}。点击确定查看下一页。")
-    #             self.plot_distribution(model_name, page + 1, locations_per_page)
-    #         else:
-    #             messagebox.showinfo("分页", "已经是最后一页。")
-
-    #  except Exception as e:
-    #     messagebox.showerror("错误", f"生成图表时出错: {str(e)}")
-
+    def append_log_lines(self, messages):
+        self.log_text.insert(tk.END, "\n".join(messages) + "\n")
+        # 只保留最近的日志，避免导入大量文件时文本控件越来越慢
+        line_count = int(self.log_text.index('end-1c').split('.')[0])
+        if line_count > MAX_LOG_LINES:
+            self.log_text.delete('1.0', f'{line_count - MAX_LOG_LINES}.0')
+        self.log_text.see(tk.END)
 
     def plot_distribution(self, model_name, page=1, rows_per_page=10):
      try:
-        # 获取所有唯一的测量位置
-        location_query = """
-        SELECT DISTINCT Name_
-        FROM optimized_data
-        WHERE ModelName = ? AND Result = 'OK'
-        ORDER BY Name_
-        """
-        locations = self.db_manager.execute_query(location_query, (model_name,))
+        table_name = self.data_table()
+        if table_name != self.distribution_source.table_name:
+            self.distribution_source.table_name = table_name
+            self.distribution_source.invalidate()
+        # 位置列表在翻页间缓存，每页数据一次分组查询取出
+        locations = self.distribution_source.locations(model_name)
 
         if not locations:
             messagebox.showinfo("信息", f"没有找到{model_name}的数据")
             return
 
-        total_locations = len(locations)
-        total_pages = math.ceil(total_locations / rows_per_page)
-
-        start_index = (page - 1) * rows_per_page
-        end_index = min(start_index + rows_per_page, total_locations)
-        current_locations = locations[start_index:end_index]
-
-        fig = make_subplots(rows=len(current_locations), cols=3,
-                            subplot_titles=[f"{loc[0]} - V_Current | A_Current | Offset" for loc in current_locations for _ in range(3)],
-                            vertical_spacing=0.05,
-                            horizontal_spacing=0.02)
-
-        for i, (location,) in enumerate(current_locations):
-            row = i + 1
-
-            # 获取该位置的所有数据
-            data_query = """
-            SELECT V_Current, A_Current, Offset, V_Min, V_Max, A_Min, A_Max, Offset_Min, Offset_Max
-            FROM optimized_data
-            WHERE ModelName = ? AND Name_ = ?
-            """
-            data = self.db_manager.execute_query(data_query, (model_name, location))
-
-            if not data:
-                continue
-
-            v_data = [row[0] for row in data]
-            a_data = [row[1] for row in data]
-            o_data = [row[2] for row in data]
-            v_min, v_max, a_min, a_max, o_min, o_max = data[0][3:]
-
-            # V_Current
-            fig.add_trace(go.Histogram(x=v_data, name="V_Current", marker_color='blue', opacity=0.7), row=row, col=1)
-            fig.add_vline(x=v_min, line_dash="dash", line_color="red", row=row, col=1)
-            fig.add_vline(x=v_max, line_dash="dash", line_color="red", row=row, col=1)
-
-            # A_Current
-            fig.add_trace(go.Histogram(x=a_data, name="A_Current", marker_color='green', opacity=0.7), row=row, col=2)
-            fig.add_vline(x=a_min, line_dash="dash", line_color="red", row=row, col=2)
-            fig.add_vline(x=a_max, line_dash="dash", line_color="red", row=row, col=2)
-
-            # Offset
-            fig.add_trace(go.Histogram(x=o_data, name="Offset", marker_color='orange', opacity=0.7), row=row, col=3)
-            fig.add_vline(x=o_min, line_dash="dash", line_color="red", row=row, col=3)
-            fig.add_vline(x=o_max, line_dash="dash", line_color="red", row=row, col=3)
-
-        fig.update_layout(
-            height=300 * len(current_locations),
-            width=1500,
-            title_text=f"Distribution for {model_name} (Page {page}/{total_pages})",
-            showlegend=False,
-        )
-
-        for i in range(1, len(current_locations) + 1):
-            for j in range(1, 4):
-                fig.update_xaxes(title_text="Value", row=i, col=j)
-                fig.update_yaxes(title_text="Frequency", row=i, col=j)
+        total_pages = page_count(len(locations), rows_per_page)
+        page_data = self.distribution_source.page_data(model_name, page, rows_per_page)
 
+        percentiles = None
+        if self.sketch_store is not None:
+            with self.db_manager.reader() as conn:
+                percentiles = sketch_percentiles(SketchStore(conn), model_name)
+        fig = build_distribution_figure(model_name, page_data, page, total_pages, percentiles=percentiles)
         fig.show()
+        logging.debug(f"查询结果缓存: {self.db_manager.cache_stats()}")
 
         # 添加分页控制
         if total_pages > 1:
@@ -457,36 +467,89 @@ class OptimizedCSVToSQLiteApp:
     def show_config(self):
         new_config = show_config_dialog(self.master, self.config)
         if new_config:
+            storage_changed = new_config.get('storage_schema') != self.config['storage_schema']
             self.config.update(new_config)
-            self.csv_reader.chunk_size = self.config['chunk_size']
+            if storage_changed and hasattr(self, 'db_manager'):
+                self.create_table()
+            self.csv_reader = self.create_csv_reader()
             self.executor = ThreadPoolExecutor(max_workers=self.config['max_threads'])
             self.setup_logging()
             messagebox.showinfo("配置", "配置已更新")
 
     def calculate_statistics(self):
         try:
-            query = """
-            SELECT ModelName, V_Current, A_Current, Offset FROM optimized_data
-            """
-            rows = self.db_manager.execute_query(query)
-
-            if not rows:
+            with self.db_manager.reader() as conn:
+                # 优先读取导入时维护的汇总表，不再扫描原始数据
+                stats = LocationSummary(conn).model_statistics() if self.location_summary is not None else None
+                if not stats:
+                    # 汇总表不可用时在 SQL 中一次 GROUP BY 完成，不再把整表取到内存
+                    stats = DataAnalyzer.grouped_statistics(conn, self.data_table())
+            if not stats:
                 messagebox.showinfo("信息", "没有找到数据")
                 return
 
-            model_names = list(set(row[0] for row in rows))
-            
-            stats = {}
-            for model_name in model_names:
-                model_data = [{'V_Current': row[1], 'A_Current': row[2], 'Offset': row[3]} 
-                              for row in rows if row[0] == model_name]
-                stats[model_name] = DataAnalyzer.calculate_statistics(model_data)
-
             self.display_statistics(stats)
 
         except sqlite3.Error as e:
             messagebox.showerror("错误", f"查询数据库时出错: {e}")
 
+    def export_reports(self):
+        """在后台把所有模型的全部分布图页面写到 output 目录（进程池并行生成），完成后打开索引页"""
+        with self.db_manager.reader() as conn:
+            models = self.catalog_cache.models(conn)
+        if not models:
+            messagebox.showinfo("信息", "没有找到数据")
+            return
+        self.log_message(f"开始导出 {len(models)} 个模型的HTML报告...")
+        self.executor.submit(self.run_report_export, models)
+
+    def run_report_export(self, models):
+        # 后台线程使用自己的连接
+        db_manager = DatabaseManager(sqlite3.connect(self.db_path))
+        try:
+            if self.db_manager.partitions is not None:
+                db_manager.use_partitions(PartitionStore(db_manager.conn, self.db_manager.partitions.directory,
+                                                         'optimized_data'))
+            output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output')
+            reports = write_reports(db_manager, models, output_dir, table_name=self.data_table(db_manager),
+                                    max_workers=self.config['max_threads'],
+                                    on_model=lambda model_name, paths: self.log_message(
+                                        f"{model_name}: 已生成 {len(paths)} 页"))
+            index_path = os.path.join(output_dir, 'index.html')
+            self.log_message(f"HTML报告导出完成，共 {sum(len(paths) for paths in reports.values())} 页: {index_path}")
+            webbrowser.open(f"file://{index_path}")
+        except Exception as e:
+            self.log_message(f"导出HTML报告时出错: {e}")
+        finally:
+            db_manager.close()
+
+    def show_capability(self):
+        """在后台线程用只读连接计算（不写能力表），完成后由 Tk 线程显示"""
+        self.log_message("正在计算过程能力...")
+        self.executor.submit(self.run_capability, self.data_table())
+
+    def run_capability(self, table_name):
+        try:
+            with self.db_manager.reader() as conn:
+                results = compute_capability(conn, table_name, store=False)
+        except (sqlite3.Error, ValueError) as e:
+            self.ui_events.post_call(messagebox.showerror, "错误", f"计算过程能力时出错: {e}")
+            return
+        self.ui_events.post_call(self.display_capability, results)
+
+    def display_capability(self, results):
+        if not results:
+            messagebox.showinfo("信息", "没有找到数据")
+            return
+
+        capability_window = tk.Toplevel(self.master)
+        capability_window.title("过程能力（按 Cpk 从低到高）")
+        capability_window.geometry("900x500")
+        text_widget = tk.Text(capability_window, wrap=tk.NONE, font=("Courier", 10))
+        text_widget.pack(expand=True, fill=tk.BOTH)
+        text_widget.insert(tk.END, format_capability(results))
+        text_widget.config(state=tk.DISABLED)
+
     def display_statistics(self, stats):
         stats_window = tk.Toplevel(self.master)
         stats_window.title("数据统计")
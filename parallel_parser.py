@@ -0,0 +1,143 @@
+"""大文件的按字节范围并行解析
+
+文件经 mmap 按行边界切成若干字节范围（表头只读一次），各范围在工作进程中独立解析和验证，
+结果按文件顺序交给写入方。与 CSVReader.read_from_offset 一样按换行符切分，字段内不能含换行。
+"""
+import csv
+import math
+import mmap
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from csv_processor_helpers import CSVReader, PerformanceMonitor, validate_csv_row
+from columnar_parser import ColumnarCSVReader
+
+# 单个范围的大小上限，决定每个在途解析任务占用的内存
+RANGE_BYTES = 32 * 1024 * 1024
+# 范围不小于这个值，避免小文件切得过碎
+MIN_RANGE_BYTES = 4 * 1024 * 1024
+# 导入流水线中超过这个大小的文件才按范围拆分，较小的文件仍整个交给一个进程
+SPLIT_THRESHOLD_BYTES = 64 * 1024 * 1024
+
+
+def process_pool(max_workers):
+    """创建解析用的进程池
+
+    导入时写线程与进程池同时运行，直接 fork 的子进程可能继承被写线程占用的锁而卡死，
+    支持 forkserver 的平台（Linux）改用 forkserver；Windows 和 macOS 默认就是 spawn。
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('forkserver'))
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+
+def split_ranges(file_path, parts, start_offset=0, final=True, range_bytes=RANGE_BYTES):
+    """把 [start_offset, 文件末尾) 按行边界切成不少于 parts 个（每个不超过 range_bytes）的字节范围
+
+    返回 (表头字段列表, [(起始, 结束), ...])；表头不完整或没有可读数据时返回 (None, [])。
+    final 为 False 时，末尾没有换行符的行视为仍在写入，不计入范围。
+    """
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return None, []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header_end = mm.find(b'\n') + 1 or size
+            header_line = mm[:header_end]
+            if not header_line.strip() or (not final and not header_line.endswith(b'\n')):
+                return None, []
+            header = next(csv.reader([header_line.decode('utf-8-sig')]))
+            data_start = max(start_offset, header_end)
+            data_end = size if final else max(mm.rfind(b'\n', data_start) + 1, data_start)
+            if data_end <= data_start:
+                return header, []
+            count = max(parts, math.ceil((data_end - data_start) / range_bytes))
+            count = max(1, min(count, (data_end - data_start) // MIN_RANGE_BYTES))
+            span = (data_end - data_start) / count
+            ranges = []
+            start = data_start
+            for i in range(1, count):
+                newline = mm.find(b'\n', max(int(data_start + span * i), start), data_end)
+                if newline == -1:
+                    break
+                if newline + 1 < data_end:
+                    ranges.append((start, newline + 1))
+                    start = newline + 1
+            ranges.append((start, data_end))
+    return header, ranges
+
+
+def parse_csv_range(file_path, header, start, end, chunk_size, parse_mode='columnar'):
+    """在工作进程中解析 [start, end) 范围内的完整行，返回值与 import_pipeline.parse_csv_file 相同：
+    (数据块列表, 结束偏移, 分阶段耗时)
+    """
+    monitor = PerformanceMonitor()
+    read_start = time.perf_counter()
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        lines = mm[start:end].decode('utf-8').split('\n')
+    if lines and not lines[-1]:
+        lines.pop()
+    monitor.record('read', time.perf_counter() - read_start, len(lines))
+
+    if parse_mode == 'columnar':
+        reader = ColumnarCSVReader(chunk_size=chunk_size, monitor=monitor)
+    else:
+        reader = CSVReader(chunk_size=chunk_size, monitor=monitor)
+    chunks = []
+    for i in range(0, len(lines), chunk_size):
+        chunk = reader.parse_lines(header, lines[i:i + chunk_size])
+        if parse_mode != 'columnar':
+            with monitor.stage('validate', rows=len(chunk)):
+                chunk = [validate_csv_row(row) for row in chunk]
+        chunks.append(chunk)
+    return chunks, end, monitor.stage_totals()
+
+
+class ParallelCSVReader(CSVReader):
+    """把单个大文件按字节范围分给进程池解析，read_in_chunks 按文件顺序产出已验证的数据块
+
+    在途范围数限制为进程数的两倍，内存占用约为 2 × 进程数 × RANGE_BYTES 的解析结果。
+    """
+
+    def __init__(self, chunk_size: int = 1000, workers: int = None, parse_mode: str = 'columnar',
+                 range_bytes: int = RANGE_BYTES, monitor: PerformanceMonitor = None):
+        super().__init__(chunk_size, monitor)
+        self.workers = workers or os.cpu_count() or 4
+        self.parse_mode = parse_mode
+        self.range_bytes = range_bytes
+
+    def read_in_chunks(self, file_path: str):
+        yield from self.read_from_offset(file_path)
+
+    def read_from_offset(self, file_path: str, start_offset: int = 0, final: bool = True):
+        self.end_offset = start_offset
+        header, ranges = split_ranges(file_path, self.workers, start_offset, final, self.range_bytes)
+        if not ranges:
+            return
+        if self.workers <= 1:
+            # 单核时在本进程解析，省去结果在进程间传递的开销
+            for start, end in ranges:
+                yield from self._collect(parse_csv_range(file_path, header, start, end,
+                                                         self.chunk_size, self.parse_mode))
+            return
+        pool = process_pool(self.workers)
+        try:
+            pending = deque()
+            for start, end in ranges:
+                pending.append(pool.submit(parse_csv_range, file_path, header, start, end,
+                                           self.chunk_size, self.parse_mode))
+                if len(pending) >= self.workers * 2:
+                    yield from self._collect(pending.popleft().result())
+            while pending:
+                yield from self._collect(pending.popleft().result())
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _collect(self, result):
+        chunks, self.end_offset, stage_totals = result
+        if self.monitor is not None:
+            self.monitor.merge_stages(stage_totals)
+        return chunks
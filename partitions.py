@@ -0,0 +1,205 @@
+"""按月分区存储：每个月的原始数据是一个独立的 SQLite 文件（YYYY-MM.db），按需 ATTACH 到主连接
+
+日期范围查询只附加范围涉及的月份，数据量随历史增长时"最近 7 天"的查询代价不变；
+删除旧月份只需删除文件（并扣除汇总表、目录和草图中对应的部分）。
+分区内额外保存规范化的 Day 列（YYYY-MM-DD）及其索引，边界月份按 Day 过滤。
+"""
+import datetime
+import os
+import re
+import sqlite3
+
+import numpy as np
+
+from csv_processor_helpers import CSV_COLUMNS
+from database_manager import CREATE_DATA_TABLE_SQL
+from dedup import FINGERPRINT_COLUMN, backfill_fingerprints, insert_deduplicated, reset_outdated_fingerprints
+from location_summary import SUMMARY_TABLE, day_strings
+from model_catalog import CATALOG_TABLE, GENERATION_TABLE
+from quantile_sketch import SKETCH_TABLE
+
+# 无法解析 Time 的行放入这个分区，只有不限日期的查询才会读取
+UNDATED = 'undated'
+MONTH_PATTERN = re.compile(r'^\d{4}-\d{2}$')
+ATTACH_LIMIT = 10
+# 分区查询返回的列（与 optimized_data 一致）
+PARTITION_COLUMNS = ['id'] + CSV_COLUMNS + [FINGERPRINT_COLUMN]
+
+
+def default_partition_directory(conn):
+    """主数据库文件旁的 <文件名>_partitions 目录；内存数据库返回 None"""
+    for _, name, path in conn.execute("PRAGMA database_list"):
+        if name == 'main' and path:
+            return os.path.splitext(path)[0] + '_partitions'
+    return None
+
+
+def month_keys(times):
+    """Time 文本对应的分区名 'YYYY-MM'（无法解析的为 UNDATED），同时返回规范化的日期"""
+    days = day_strings(times)
+    months = np.array([day[:7] if day else UNDATED for day in days], dtype=object)
+    return months, days
+
+
+def schema_name(month):
+    return 'p_' + month.replace('-', '_')
+
+
+def parse_day(value):
+    """校验 'YYYY-MM-DD' 并原样返回（日期会直接写入 SQL，不能带任意文本）"""
+    return datetime.date.fromisoformat(value).isoformat()
+
+
+class PartitionStore:
+    """月分区的创建、写入、范围查询和删除；连接始终是 DatabaseManager 的主连接"""
+
+    def __init__(self, conn, directory, table_name='optimized_data'):
+        self.conn = conn
+        self.directory = directory
+        self.table_name = table_name
+        os.makedirs(directory, exist_ok=True)
+        # 已附加的分区，按最近使用顺序排列（dict 保持插入顺序）
+        self.attached = {}
+        # 可同时附加的数据库数量（默认编译选项下为 10）
+        self.attach_limit = (conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(conn, 'getlimit')
+                             else ATTACH_LIMIT)
+
+    def path(self, month):
+        return os.path.join(self.directory, f"{month}.db")
+
+    def months(self):
+        """已有分区按月份排序，UNDATED 排在最后"""
+        names = [os.path.splitext(name)[0] for name in os.listdir(self.directory) if name.endswith('.db')]
+        months = sorted(name for name in names if MONTH_PATTERN.match(name))
+        return months + [UNDATED] if UNDATED in names else months
+
+    def months_in_range(self, start_day=None, end_day=None):
+        """日期范围涉及的已有分区；两端都不限时包括 UNDATED"""
+        start_month = parse_day(start_day)[:7] if start_day else None
+        end_month = parse_day(end_day)[:7] if end_day else None
+        selected = []
+        for month in self.months():
+            if month == UNDATED:
+                if start_month is None and end_month is None:
+                    selected.append(month)
+            elif (start_month is None or month >= start_month) and (end_month is None or month <= end_month):
+                selected.append(month)
+        return selected
+
+    def attach(self, months, create=False):
+        """附加 months 中尚未附加的分区；超出 SQLite 可同时附加的数量时先提交并分离最久未用的分区"""
+        needed = [month for month in months if month not in self.attached]
+        # 主库和 temp 不占名额，attach_limit 即可附加的最大数量
+        if len(months) > self.attach_limit:
+            raise ValueError(f"日期范围涉及 {len(months)} 个分区，超过可同时附加的 {self.attach_limit} 个，"
+                             f"请缩小范围或改用汇总表")
+        overflow = len(self.attached) + len(needed) - self.attach_limit
+        if overflow > 0:
+            # 事务进行中不能分离数据库
+            self.conn.commit()
+            for month in [month for month in self.attached if month not in months][:overflow]:
+                self.detach(month)
+        for month in months:
+            if month in self.attached:
+                self.attached[month] = self.attached.pop(month)
+                continue
+            schema = schema_name(month)
+            self.conn.execute("ATTACH DATABASE ? AS " + schema, (self.path(month),))
+            self.attached[month] = schema
+            if create:
+                self._create_partition_table(schema)
+
+    def detach(self, month):
+        schema = self.attached.pop(month, None)
+        if schema is not None:
+            self.conn.execute(f"DETACH DATABASE {schema}")
+
+    def detach_all(self):
+        self.conn.commit()
+        for month in list(self.attached):
+            self.detach(month)
+
+    def _create_partition_table(self, schema):
+        self.conn.execute(CREATE_DATA_TABLE_SQL.format(table_name=f"{schema}.{self.table_name}"))
+        columns = [row[1] for row in self.conn.execute(f"PRAGMA {schema}.table_info({self.table_name})")]
+        if FINGERPRINT_COLUMN not in columns:
+            self.conn.execute(f"ALTER TABLE {schema}.{self.table_name} ADD COLUMN {FINGERPRINT_COLUMN} INTEGER")
+            self.conn.execute(f"ALTER TABLE {schema}.{self.table_name} ADD COLUMN Day TEXT")
+        for name, index_columns in (('row_hash', FINGERPRINT_COLUMN), ('day', 'Day'),
+                                    ('model_location', 'ModelName, Name_, Day')):
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_{self.table_name}_{name} "
+                              f"ON {self.table_name} ({index_columns})")
+        # 旧版本指纹的分区重新计算，否则重新导入时会与已有行对不上
+        if reset_outdated_fingerprints(self.conn, f"{schema}.{self.table_name}"):
+            backfill_fingerprints(self.conn, f"{schema}.{self.table_name}")
+
+    def insert_columns(self, columns):
+        """按月份拆分数据块并去重写入各分区，不提交；返回新增行在数据块中的位置数组"""
+        months, days = month_keys(columns['Time'])
+        unique_months = sorted(set(months.tolist()))
+        inserted = []
+        # 一个数据块跨越的月份超过附加上限时分批写入（批与批之间会提交）
+        for start in range(0, len(unique_months), self.attach_limit):
+            batch = unique_months[start:start + self.attach_limit]
+            self.attach(batch, create=True)
+            for month in batch:
+                rows = np.flatnonzero(months == month)
+                part = {name: np.asarray(values)[rows] for name, values in columns.items()}
+                part['Day'] = days[rows]
+                positions = insert_deduplicated(self.conn, f"{self.attached[month]}.{self.table_name}", part)
+                inserted.append(rows[positions])
+        if not inserted:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(inserted))
+
+    def range_table(self, start_day=None, end_day=None):
+        """附加范围涉及的分区，返回可放在 FROM 后面的子查询（UNION ALL，只有边界月份按 Day 过滤）"""
+        months = self.months_in_range(start_day, end_day)
+        column_list = ', '.join(PARTITION_COLUMNS)
+        if not months:
+            return f"(SELECT {', '.join(f'NULL AS {name}' for name in PARTITION_COLUMNS)} LIMIT 0)"
+        self.attach(months)
+        start_day = parse_day(start_day) if start_day else None
+        end_day = parse_day(end_day) if end_day else None
+        parts = []
+        for month in months:
+            clauses = []
+            if start_day and start_day[:7] == month:
+                clauses.append(f"Day >= '{start_day}'")
+            if end_day and end_day[:7] == month:
+                clauses.append(f"Day <= '{end_day}'")
+            where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+            parts.append(f"SELECT {column_list} FROM {self.attached[month]}.{self.table_name}{where}")
+        return f"({' UNION ALL '.join(parts)})"
+
+    def drop_month(self, month):
+        """删除一个月的分区文件，并从汇总表、模型目录和分位数草图中扣除该月的数据，返回删除的行数"""
+        if month not in self.months():
+            return 0
+        self.attach([month])
+        schema = self.attached[month]
+        rows = self.conn.execute(f"SELECT COUNT(*) FROM {schema}.{self.table_name}").fetchone()[0]
+        self._prune_derived(schema, month)
+        self.conn.commit()
+        self.detach(month)
+        for suffix in ('', '-journal', '-wal', '-shm'):
+            if os.path.exists(self.path(month) + suffix):
+                os.remove(self.path(month) + suffix)
+        return rows
+
+    def _prune_derived(self, schema, month):
+        existing = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        day_filter = "day = ''" if month == UNDATED else "day LIKE ?"
+        params = () if month == UNDATED else (f"{month}-%",)
+        for table in (SUMMARY_TABLE, SKETCH_TABLE):
+            if table in existing:
+                self.conn.execute(f"DELETE FROM {table} WHERE {day_filter}", params)
+        if CATALOG_TABLE in existing:
+            # 首末出现时间保持不变，只扣除行数；行数归零的位置从目录中移除
+            counts = self.conn.execute(
+                f"SELECT COUNT(*), ModelName, Name_ FROM {schema}.{self.table_name} GROUP BY ModelName, Name_"
+            ).fetchall()
+            self.conn.executemany(
+                f"UPDATE {CATALOG_TABLE} SET row_count = row_count - ? WHERE ModelName = ? AND Name_ = ?", counts)
+            self.conn.execute(f"DELETE FROM {CATALOG_TABLE} WHERE row_count <= 0")
+            self.conn.execute(f"UPDATE {GENERATION_TABLE} SET generation = generation + 1 WHERE id = 1")
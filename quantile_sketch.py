@@ -0,0 +1,185 @@
+"""按 (ModelName, Name_, 日期) 持久化的可合并分位数草图（t-digest）
+
+导入时每个数据块合并进当天的草图并以 BLOB 保存；任意日期范围的分位数查询
+只需合并几十到几百个草图，无需读取和排序原始数据。
+"""
+import numpy as np
+
+from compact_schema import table_exists
+from location_summary import day_strings
+
+SKETCH_TABLE = 'location_daily_sketch'
+SKETCH_MEASURES = ['V_Current', 'A_Current', 'Offset']
+# 压缩参数：越大越精确，草图约有 COMPRESSION / 2 个质心
+COMPRESSION = 200
+DEFAULT_QUANTILES = (0.01, 0.5, 0.99)
+
+CREATE_SKETCH_SQL = f"""
+CREATE TABLE IF NOT EXISTS {SKETCH_TABLE} (
+    ModelName TEXT,
+    Name_ TEXT,
+    day TEXT,
+    measure TEXT,
+    count INTEGER,
+    digest BLOB,
+    PRIMARY KEY (ModelName, Name_, day, measure)
+)
+"""
+
+
+class TDigest:
+    """合并式 t-digest：质心按 k1 尺度函数分桶压缩，压缩过程完全向量化"""
+
+    def __init__(self, means=None, weights=None, low=np.inf, high=-np.inf, compression=COMPRESSION):
+        self.means = np.empty(0) if means is None else np.asarray(means, dtype=np.float64)
+        self.weights = np.empty(0) if weights is None else np.asarray(weights, dtype=np.float64)
+        self.min = low
+        self.max = high
+        self.compression = compression
+
+    @property
+    def count(self):
+        return int(self.weights.sum())
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.means = np.concatenate([self.means, values])
+        self.weights = np.concatenate([self.weights, np.ones(len(values))])
+        return self.compress()
+
+    def merge(self, other):
+        if not len(other.weights):
+            return self
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.means = np.concatenate([self.means, other.means])
+        self.weights = np.concatenate([self.weights, other.weights])
+        return self.compress()
+
+    def compress(self):
+        if len(self.means) <= self.compression:
+            order = np.argsort(self.means, kind='stable')
+            self.means, self.weights = self.means[order], self.weights[order]
+            return self
+        order = np.argsort(self.means, kind='stable')
+        means, weights = self.means[order], self.weights[order]
+        total = weights.sum()
+        # 每个质心中点的分位位置映射到 k 尺度，k 值整数部分相同的相邻质心合并为一个
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+        buckets = np.floor(k - k[0]).astype(np.int64)
+        _, buckets = np.unique(buckets, return_inverse=True)
+        merged_weights = np.bincount(buckets, weights=weights)
+        self.means = np.bincount(buckets, weights=means * weights) / merged_weights
+        self.weights = merged_weights
+        return self
+
+    def quantiles(self, qs):
+        """返回各分位点的估计值；草图为空时全为 NaN"""
+        qs = np.asarray(qs, dtype=np.float64)
+        if not len(self.weights):
+            return np.full(len(qs), np.nan)
+        total = self.weights.sum()
+        positions = np.concatenate([[0.0], np.cumsum(self.weights) - self.weights / 2, [total]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return np.interp(qs * total, positions, values)
+
+    def to_bytes(self):
+        return np.concatenate([[self.min, self.max], self.means, self.weights]).tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob, compression=COMPRESSION):
+        data = np.frombuffer(blob, dtype=np.float64)
+        size = (len(data) - 2) // 2
+        return cls(data[2:2 + size].copy(), data[2 + size:].copy(), data[0], data[1], compression)
+
+
+class SketchStore:
+    """导入时维护每日草图（作为 DatabaseManager 的插入钩子，在原始数据的同一事务内更新）"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def ensure(self, table_name='optimized_data', batch_size=50000):
+        """创建草图表；草图表是新建的且原始表已有数据时从原始表回填，返回回填行数"""
+        created = not table_exists(self.conn, SKETCH_TABLE)
+        self.conn.execute(CREATE_SKETCH_SQL)
+        backfilled = 0
+        if created and (table_exists(self.conn, table_name) or table_exists(self.conn, table_name, 'view')):
+            names = ['ModelName', 'Name_', 'Time'] + SKETCH_MEASURES
+            cursor = self.conn.execute(f"SELECT {', '.join(names)} FROM {table_name}")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                self.update({name: np.array([row[i] for row in rows], dtype=object) for i, name in enumerate(names)})
+                backfilled += len(rows)
+        self.conn.commit()
+        return backfilled
+
+    def update(self, columns, positions=None):
+        """把数据块中 positions 指定的行（默认全部）合并进当天的草图，不提交"""
+        names = ['ModelName', 'Name_', 'Time'] + SKETCH_MEASURES
+        if positions is not None:
+            if not len(positions):
+                return
+            columns = {name: np.asarray(columns[name])[positions] for name in names}
+        models = np.asarray(columns['ModelName'], dtype=object).astype(str)
+        if not len(models):
+            return
+        locations = np.asarray(columns['Name_'], dtype=object).astype(str)
+        days = day_strings(columns['Time']).astype(str)
+        _, first, inverse = np.unique(np.char.add(np.char.add(np.char.add(models, '\x1f'), locations),
+                                                  np.char.add('\x1f', days)),
+                                      return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(first) + 1))
+
+        records = []
+        for measure in SKETCH_MEASURES:
+            values = np.asarray(columns[measure], dtype=np.float64)[order]
+            for g, i in enumerate(first):
+                key = (models[i], locations[i], days[i], measure)
+                digest = self.load(*key) or TDigest()
+                digest.add(values[bounds[g]:bounds[g + 1]])
+                records.append(key + (digest.count, digest.to_bytes()))
+        self.conn.executemany(f"INSERT OR REPLACE INTO {SKETCH_TABLE} VALUES (?, ?, ?, ?, ?, ?)", records)
+
+    def load(self, model_name, location, day, measure):
+        row = self.conn.execute(
+            f"SELECT digest FROM {SKETCH_TABLE} WHERE ModelName = ? AND Name_ = ? AND day = ? AND measure = ?",
+            (model_name, location, day, measure)).fetchone()
+        return TDigest.from_bytes(row[0]) if row else None
+
+    def merged(self, model_name, measure, location=None, start_day=None, end_day=None):
+        """合并日期范围内的草图；location 为空时按位置分别合并，返回 {位置: TDigest}"""
+        clauses, params = ["ModelName = ?", "measure = ?"], [model_name, measure]
+        for clause, value in (("Name_ = ?", location), ("day >= ?", start_day), ("day <= ?", end_day)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        digests = {}
+        for name, blob in self.conn.execute(
+                f"SELECT Name_, digest FROM {SKETCH_TABLE} WHERE {' AND '.join(clauses)} ORDER BY Name_", params):
+            sketch = TDigest.from_bytes(blob)
+            digests[name] = digests[name].merge(sketch) if name in digests else sketch
+        return digests
+
+    def percentiles(self, model_name, measure, quantiles=DEFAULT_QUANTILES, location=None,
+                    start_day=None, end_day=None):
+        """返回 {位置: [各分位点的值]}"""
+        return {name: digest.quantiles(quantiles).tolist()
+                for name, digest in self.merged(model_name, measure, location, start_day, end_day).items()}
+
+    def model_percentiles(self, model_name, measure, quantiles=DEFAULT_QUANTILES, start_day=None, end_day=None):
+        """合并模型所有位置的草图，返回整个模型的分位点"""
+        total = TDigest()
+        for digest in self.merged(model_name, measure, start_day=start_day, end_day=end_day).values():
+            total.merge(digest)
+        return total.quantiles(quantiles).tolist()
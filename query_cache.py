@@ -0,0 +1,79 @@
+"""execute_query 的结果缓存：按规范化 SQL、参数和数据库写入代数作键，按字节数上限做 LRU 淘汰"""
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+# 引号内的字面量保持原样，其余部分的空白合并为单个空格
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+
+def normalize_sql(query):
+    parts = _QUOTED.split(query)
+    return ''.join(part if i % 2 else re.sub(r'\s+', ' ', part) for i, part in enumerate(parts)).strip()
+
+
+def is_cacheable(normalized):
+    """只缓存只读查询"""
+    return normalized[:6].upper() == 'SELECT' or normalized[:4].upper() == 'WITH'
+
+
+def result_size(rows):
+    """估算结果集占用的字节数（列表、元组和其中的标量）"""
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+    return size
+
+
+class QueryResultCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """命中时返回结果并把它移到最近使用端，未命中返回 None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, rows):
+        size = result_size(rows)
+        # 超过上限的结果不缓存，免得把其他条目全部挤掉
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (rows, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'bytes': self.total_bytes,
+        }
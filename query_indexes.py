@@ -0,0 +1,121 @@
+"""绘图与统计查询使用的查找索引和可选的覆盖索引，以及基于 EXPLAIN QUERY PLAN 的索引检查"""
+import sqlite3
+
+from compact_schema import COMPACT_TABLE, table_exists
+
+# 每行数据的列顺序：测量值在前，规格上下限在后
+DATA_COLUMNS = ['V_Current', 'A_Current', 'Offset', 'V_Min', 'V_Max', 'A_Min', 'A_Max', 'Offset_Min', 'Offset_Max']
+
+# 默认只建 (ModelName, Name_, Result) 查找索引：位置列表只读索引，分组数据按 rowid 回表读取
+LOOKUP_INDEXES = {
+    'idx_{table}_model_location': ['ModelName', 'Name_', 'Result'],
+}
+# 另含测量值和规格上下限的完整覆盖索引，绘图查询不必回表，但大小接近数据表本身，
+# 只在 ensure_covering_indexes(covering=True)（cli.py advise --create --covering）时创建
+COVERING_INDEXES = {
+    'idx_{table}_model_location_cover': ['ModelName', 'Name_', 'Result'] + DATA_COLUMNS,
+}
+# 紧凑存储中按 (模型, 位置) 找 spec_id，再按 spec_id 读取测量值
+COMPACT_COVERING_INDEXES = {
+    'compact_spec_limits': {
+        'idx_compact_spec_model_name': ['model_id', 'name_id'],
+    },
+    COMPACT_TABLE: {
+        'idx_compact_data_spec_cover': ['spec_id', 'Result', 'V_Current', 'A_Current', 'Offset'],
+    },
+}
+
+
+def location_query(table_name='optimized_data'):
+    return f"""
+    SELECT DISTINCT Name_
+    FROM {table_name}
+    WHERE ModelName = ? AND Result = 'OK'
+    ORDER BY Name_
+    """
+
+
+def grouped_data_query(table_name='optimized_data', location_count=None):
+    """按 Name_ 排序的分组数据查询；location_count 不为空时带 Name_ IN (...) 过滤"""
+    location_filter = ''
+    if location_count is not None:
+        location_filter = f" AND Name_ IN ({', '.join(['?' for _ in range(location_count)])})"
+    return f"""
+    SELECT Name_, {', '.join(DATA_COLUMNS)}
+    FROM {table_name}
+    WHERE ModelName = ? AND Result = 'OK'{location_filter}
+    ORDER BY Name_
+    """
+
+
+def index_definitions(conn, table_name, covering=False):
+    """返回 [(索引名, 表名, 列)]；table_name 是紧凑存储的兼容视图时返回紧凑表上的索引"""
+    if table_exists(conn, table_name, 'view'):
+        return [(name, table, columns) for table, definitions in COMPACT_COVERING_INDEXES.items()
+                for name, columns in definitions.items()]
+    definitions = dict(LOOKUP_INDEXES, **(COVERING_INDEXES if covering else {}))
+    return [(name.format(table=table_name), table_name, columns) for name, columns in definitions.items()]
+
+
+def ensure_covering_indexes(conn, table_name='optimized_data', covering=False):
+    """创建缺少的查询索引（covering 为 True 时包括完整覆盖索引）并更新统计信息，返回新建的索引名列表"""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    created = []
+    for name, table, columns in index_definitions(conn, table_name, covering):
+        if name not in existing:
+            conn.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+            created.append(name)
+    if created:
+        # 让查询规划器知道新索引的选择性
+        conn.execute("PRAGMA optimize")
+    conn.commit()
+    return created
+
+
+def index_sizes(conn, table_name='optimized_data'):
+    """返回 (数据表字节数, [(索引名, 字节数)])，紧凑存储统计 compact_data；SQLite 未编译 dbstat 时返回 None"""
+    table = COMPACT_TABLE if table_exists(conn, table_name, 'view') else table_name
+    indexes = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? ORDER BY name", (table,))]
+    try:
+        sizes = dict(conn.execute(
+            f"SELECT name, SUM(pgsize) FROM dbstat WHERE name IN ({', '.join(['?' for _ in indexes + [table]])}) "
+            f"GROUP BY name", indexes + [table]).fetchall())
+    except sqlite3.OperationalError:
+        return None
+    return sizes.get(table, 0), [(name, sizes.get(name, 0)) for name in indexes]
+
+
+def known_queries(table_name='optimized_data'):
+    """应用中的绘图和统计查询：[(名称, SQL, 参数)]"""
+    return [
+        ('plot_distribution: 位置列表', location_query(table_name), ('',)),
+        ('plot_distribution: 分组数据', grouped_data_query(table_name, 10), ('',) * 11),
+        ('report: 整个模型数据', grouped_data_query(table_name), ('',)),
+        ('csv2sqlite5.plot_histograms',
+         f"SELECT V_Current, A_Current, Offset FROM {table_name} WHERE ModelName = ?", ('',)),
+        ('csv2sqlite5.plot_distribution',
+         f"SELECT V_Current, V_Min, V_Max, A_Current, Offset FROM {table_name} WHERE ModelName = ?", ('',)),
+        ('calculate_statistics: 原始数据',
+         f"SELECT ModelName, V_Current, A_Current, Offset FROM {table_name}", ()),
+    ]
+
+
+def classify_plan(details):
+    """根据查询计划判断访问方式：全表扫描、覆盖索引扫描、索引查找（+回表）或仅索引查找"""
+    if any(detail.startswith('SCAN') and 'INDEX' not in detail for detail in details):
+        return '全表扫描'
+    if any(detail.startswith('SCAN') for detail in details):
+        return '覆盖索引扫描'
+    if all('COVERING INDEX' in detail or not detail.startswith('SEARCH') for detail in details):
+        return '仅索引查找'
+    return '索引查找（需回表）'
+
+
+def advise(conn, table_name='optimized_data'):
+    """对已知查询运行 EXPLAIN QUERY PLAN，返回 [(名称, 访问方式, 计划明细)]"""
+    report = []
+    for name, sql, params in known_queries(table_name):
+        details = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        report.append((name, classify_plan(details), details))
+    return report
@@ -0,0 +1,246 @@
+import csv
+import os
+import sqlite3
+import threading
+import time
+
+from adaptive_batch import LIVE_TARGET_LATENCY, AdaptiveBatchSizer
+from csv_processor_helpers import CSVReader, PerformanceMonitor, validate_csv_row
+from columnar_parser import ColumnarCSVReader
+from database_manager import DatabaseManager
+from import_manifest import create_manifest_table, load_manifest, plan_import, record_import
+from import_pipeline import ChunkWriter
+
+# 与批量导入同时写库时等待写锁的秒数；仍然忙时本次追加的数据留到下次轮询重读
+BUSY_TIMEOUT = 30.0
+
+# 无法解析的追加行记入这张表后跳过，同一行重读时不会重复记录
+CREATE_REJECTED_SQL = """
+CREATE TABLE IF NOT EXISTS rejected_lines (
+    path TEXT,
+    offset INTEGER,
+    line TEXT,
+    error TEXT,
+    rejected_at REAL,
+    PRIMARY KEY (path, offset)
+)
+"""
+
+
+class FollowedFile:
+    """一个正在跟踪的CSV文件：保持打开的句柄、表头和已导入到的字节偏移"""
+
+    def __init__(self, path, handle, header, offset):
+        self.path = path
+        self.handle = handle
+        self.header = header
+        self.offset = offset
+        self.last_activity = time.time()
+
+
+class TailIngester:
+    """实时跟踪导入：轮询目录，只解析各文件新追加的完整行
+
+    文件句柄在两次轮询之间保持打开，每次只从上次的偏移处读取新增字节；
+    起始偏移取自导入清单，因此可以接着批量导入继续跟踪。导入清单只推进到已写入的数据块之后，
+    数据库忙或写入出错时下次轮询从同一位置重读；无法解析的行记入 rejected_lines 表后跳过。
+    """
+
+    def __init__(self, db_path, directory, table_name='optimized_data', chunk_size=1000, parse_mode='columnar',
+                 poll_interval=2.0, active_window=24 * 3600, deduplicate=True, storage_schema='wide',
+                 adaptive=False, on_log=None, on_rows=None):
+        self.db_path = db_path
+        self.directory = directory
+        self.table_name = table_name
+        self.parse_mode = parse_mode
+        self.reader = ColumnarCSVReader(chunk_size) if parse_mode == 'columnar' else CSVReader(chunk_size)
+        self.poll_interval = poll_interval
+        # 超过这个时间没有修改的文件交给批量导入，不再保持打开
+        self.active_window = active_window
+        self.deduplicate = deduplicate
+        self.storage_schema = storage_schema
+        # adaptive 为 True 时按实测写入延迟调整每次写入的块大小，使单块写入约 LIVE_TARGET_LATENCY 秒
+        self.adaptive = adaptive
+        self.on_log = on_log or print
+        self.on_rows = on_rows or (lambda file_name, rows: None)
+        self.files = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.sizer = None
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def run(self):
+        # 跟踪线程持有自己的写连接
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT)
+        conn.execute("PRAGMA journal_mode=WAL")
+        db_manager = DatabaseManager(conn)
+        chunk_writer = ChunkWriter(db_manager, self.table_name, self.deduplicate, self.storage_schema, self.on_log)
+        self.sizer = None
+        if self.adaptive:
+            db_manager.monitor = PerformanceMonitor()
+            # 每块写入后立即提交，新数据马上可见
+            self.sizer = AdaptiveBatchSizer(db_manager.monitor, target_latency=LIVE_TARGET_LATENCY,
+                                            chunk_size=self.reader.chunk_size, max_commit_delay=0.0,
+                                            on_log=self.on_log)
+            self.sizer.apply(db_manager)
+        try:
+            chunk_writer.prepare()
+            create_manifest_table(conn)
+            conn.execute(CREATE_REJECTED_SQL)
+            conn.commit()
+            self.on_log(f"开始实时跟踪目录: {self.directory}")
+            while not self.stop_event.is_set():
+                self.poll_once(chunk_writer)
+                self.stop_event.wait(self.poll_interval)
+        except Exception as e:
+            self.on_log(f"实时跟踪出错: {e}")
+        finally:
+            for followed in self.files.values():
+                followed.handle.close()
+            self.files.clear()
+            db_manager.close()
+            self.on_log("已停止实时跟踪")
+
+    def poll_once(self, chunk_writer):
+        now = time.time()
+        manifest = None
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.csv') or not entry.is_file():
+                continue
+            if entry.path not in self.files:
+                if now - entry.stat().st_mtime > self.active_window:
+                    continue
+                if manifest is None:
+                    manifest = load_manifest(chunk_writer.db_manager.conn)
+                self._open(entry.path, manifest)
+            followed = self.files[entry.path]
+            if not self._replaced(followed):
+                self._read_new(followed, chunk_writer)
+            elif self._read_new(followed, chunk_writer, record=False):
+                # 旧文件剩余的完整行已写入，改为从头跟踪路径上的新文件
+                self.on_log(f"文件被轮转或替换，重新跟踪: {entry.path}")
+                followed.handle.close()
+                self.files[entry.path] = FollowedFile(entry.path, open(entry.path, 'rb'), None, 0)
+                self._read_new(self.files[entry.path], chunk_writer)
+
+        for path, followed in list(self.files.items()):
+            if now - followed.last_activity > self.active_window or not os.path.exists(path):
+                followed.handle.close()
+                del self.files[path]
+
+    def _open(self, path, manifest):
+        action, start_offset, _ = plan_import(path, manifest)
+        handle = open(path, 'rb')
+        self.files[path] = FollowedFile(path, handle, None, start_offset if action != 'full' else 0)
+
+    def _replaced(self, followed):
+        """路径是否已指向另一个文件（改名轮转后新建、或被整个替换），每次轮询比较 inode"""
+        try:
+            current = os.stat(followed.path)
+        except FileNotFoundError:
+            return False
+        opened = os.fstat(followed.handle.fileno())
+        return (current.st_ino, current.st_dev) != (opened.st_ino, opened.st_dev)
+
+    def _read_header(self, followed):
+        followed.handle.seek(0)
+        header_line = followed.handle.readline()
+        if not header_line.endswith(b'\n'):
+            return False
+        followed.header = next(csv.reader([header_line.decode('utf-8-sig')]))
+        followed.offset = max(followed.offset, len(header_line))
+        return True
+
+    def _read_new(self, followed, chunk_writer, record=True):
+        """写入新追加的完整行，返回是否已读到句柄当前的末尾
+
+        record 为 False 时不更新导入清单（路径已指向新文件，旧句柄的偏移对它没有意义）。
+        """
+        size = os.fstat(followed.handle.fileno()).st_size
+        if size < followed.offset:
+            # 文件被截断或重写，从头开始
+            self.on_log(f"文件被重写，重新跟踪: {followed.path}")
+            followed.header, followed.offset = None, 0
+        if followed.header is None and not self._read_header(followed):
+            return True
+        if size <= followed.offset:
+            return True
+
+        followed.handle.seek(followed.offset)
+        data = followed.handle.read(size - followed.offset)
+        # 只处理完整的行，未写完的末行留到下一次轮询
+        end = data.rfind(b'\n') + 1
+        if not end:
+            return True
+        lines = data[:end].splitlines(keepends=True)
+        db_manager = chunk_writer.db_manager
+        rows_inserted = 0
+        done = False
+        try:
+            start = 0
+            while start < len(lines):
+                batch = lines[start:start + self.reader.chunk_size]
+                start += len(batch)
+                chunk = self._parse(db_manager.conn, followed, batch)
+                if chunk is not None:
+                    rows_inserted += chunk_writer.write(chunk)[1]
+                    if self.sizer is not None:
+                        self.sizer.adjust(chunk)
+                        self.sizer.apply(db_manager)
+                        self.reader.chunk_size = self.sizer.chunk_size
+                # 偏移只推进到已写入的数据块之后
+                followed.offset += sum(len(line) for line in batch)
+                if record:
+                    record_import(db_manager.conn, followed.path, followed.offset)
+                db_manager.maybe_commit()
+            done = True
+        except sqlite3.Error as e:
+            # 出错的数据块已回滚，偏移停在最后写入的块之后，下次轮询从那里重读
+            db_manager.rollback()
+            self.on_log(f"写入追加数据时出错 {followed.path}: {e}，下次轮询重试")
+        followed.last_activity = time.time()
+        if rows_inserted:
+            self.on_rows(os.path.basename(followed.path), rows_inserted)
+        return done
+
+    def _parse_lines(self, header, lines):
+        chunk = self.reader.parse_lines(header, lines)
+        if self.parse_mode != 'columnar':
+            chunk = [validate_csv_row(row) for row in chunk]
+        return chunk
+
+    def _parse(self, conn, followed, lines):
+        """解析一批完整行（字节串）；整批失败时逐行解析，无法解析的行记入 rejected_lines 后跳过"""
+        try:
+            return self._parse_lines(followed.header, [line.decode('utf-8') for line in lines])
+        except ValueError:
+            pass
+        good = []
+        offset = followed.offset
+        for line in lines:
+            try:
+                text = line.decode('utf-8')
+                self._parse_lines(followed.header, [text])
+                good.append(text)
+            except ValueError as e:
+                self.on_log(f"跳过无法解析的行 {followed.path} 偏移 {offset}: {e}")
+                conn.execute(
+                    "INSERT OR REPLACE INTO rejected_lines (path, offset, line, error, rejected_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (os.path.abspath(followed.path), offset, line.decode('utf-8', 'replace'), str(e), time.time())
+                )
+            offset += len(line)
+        return self._parse_lines(followed.header, good) if good else None
@@ -0,0 +1,111 @@
+"""行指纹去重的回归测试：用法 python -m pytest tests"""
+import os
+import sqlite3
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from csv_processor_helpers import CSV_COLUMNS, FLOAT_COLUMNS
+from dedup import (FINGERPRINT_COLUMN, FINGERPRINT_VERSION_TABLE, backfill_fingerprints, drop_unique_constraints,
+                   ensure_fingerprint_column, insert_deduplicated, row_fingerprints)
+from database_manager import CREATE_DATA_TABLE_SQL
+
+
+def make_columns(rows):
+    """rows 中每行是覆盖默认值的字段字典"""
+    base = {name: 0.0 if name in FLOAT_COLUMNS else '' for name in CSV_COLUMNS}
+    base.update(Time='2024/07/01 08:00:00', BarCode='SN001', ModelName='M1', Name_='L1',
+                V_Current=1.5, A_Current=0.2, Offset=0.01)
+    rows = [dict(base, **row) for row in rows]
+    return {name: np.array([row[name] for row in rows], dtype=np.float64 if name in FLOAT_COLUMNS else object)
+            for name in CSV_COLUMNS}
+
+
+def open_table():
+    conn = sqlite3.connect(':memory:')
+    conn.execute(CREATE_DATA_TABLE_SQL.format(table_name='optimized_data'))
+    ensure_fingerprint_column(conn, 'optimized_data')
+    return conn
+
+
+def count_rows(conn):
+    return conn.execute("SELECT COUNT(*) FROM optimized_data").fetchone()[0]
+
+
+def test_same_values_at_other_location_or_time_are_kept():
+    conn = open_table()
+    columns = make_columns([{}, {'Name_': 'L2'}, {'Time': '2024/07/01 08:00:01'}, {}])
+    positions = insert_deduplicated(conn, 'optimized_data', columns)
+    assert positions.tolist() == [0, 1, 2]
+    assert count_rows(conn) == 3
+    # 再次导入同一数据块不新增任何行
+    assert len(insert_deduplicated(conn, 'optimized_data', columns)) == 0
+    assert count_rows(conn) == 3
+
+
+def test_hash_collision_does_not_drop_rows():
+    conn = open_table()
+    columns = make_columns([{}, {'Name_': 'L2'}, {'Name_': 'L3'}])
+    # 人为让所有行指纹相同，是否重复必须由字段比较决定
+    collided = np.zeros(3, dtype=np.int64)
+    assert len(insert_deduplicated(conn, 'optimized_data', make_columns([{}]), hashes=collided[:1])) == 1
+    positions = insert_deduplicated(conn, 'optimized_data', columns, hashes=collided)
+    assert positions.tolist() == [1, 2]
+    assert count_rows(conn) == 3
+
+
+def test_outdated_fingerprints_are_recomputed():
+    conn = sqlite3.connect(':memory:')
+    conn.execute(CREATE_DATA_TABLE_SQL.format(table_name='optimized_data'))
+    conn.execute(f"ALTER TABLE optimized_data ADD COLUMN {FINGERPRINT_COLUMN} INTEGER")
+    columns = make_columns([{}, {'Name_': 'L2'}])
+    names = ', '.join(CSV_COLUMNS)
+    # 没有版本记录的旧库：RowHash 按旧算法计算，这里用错误的值代替
+    conn.executemany(f"INSERT INTO optimized_data ({names}, {FINGERPRINT_COLUMN}) "
+                     f"VALUES ({', '.join(['?' for _ in CSV_COLUMNS])}, 7)",
+                     zip(*(columns[name].tolist() for name in CSV_COLUMNS)))
+    ensure_fingerprint_column(conn, 'optimized_data')
+    stored = [row[0] for row in conn.execute(f"SELECT {FINGERPRINT_COLUMN} FROM optimized_data ORDER BY id")]
+    assert stored == row_fingerprints(columns).tolist()
+    assert conn.execute(f"SELECT version FROM {FINGERPRINT_VERSION_TABLE}").fetchone()[0] >= 2
+    assert len(insert_deduplicated(conn, 'optimized_data', columns)) == 0
+    # 已是当前版本时不再重算
+    conn.execute(f"UPDATE optimized_data SET {FINGERPRINT_COLUMN} = 7")
+    ensure_fingerprint_column(conn, 'optimized_data')
+    backfill_fingerprints(conn, 'optimized_data')
+    assert {row[0] for row in conn.execute(f"SELECT {FINGERPRINT_COLUMN} FROM optimized_data")} == {7}
+
+
+# 旧版 csv2sqlite5 建的 all_data：按测量值的 UNIQUE 约束，没有 RowHash
+LEGACY_ALL_DATA_SQL = f"""
+CREATE TABLE all_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    {', '.join(f"{name} {'REAL' if name in FLOAT_COLUMNS else 'TEXT'}" for name in CSV_COLUMNS)},
+    UNIQUE(ModelName, BarCode, V_Current, A_Current, Offset)
+)
+"""
+
+
+def test_legacy_unique_constraint_is_dropped():
+    conn = sqlite3.connect(':memory:')
+    conn.execute(LEGACY_ALL_DATA_SQL)
+    conn.execute("CREATE INDEX idx_all_data_model ON all_data (ModelName)")
+    columns = make_columns([{}])
+    names = ', '.join(CSV_COLUMNS)
+    conn.execute(f"INSERT INTO all_data (id, {names}) VALUES (5, {', '.join(['?' for _ in CSV_COLUMNS])})",
+                 [columns[name][0].item() if name in FLOAT_COLUMNS else columns[name][0] for name in CSV_COLUMNS])
+    conn.commit()
+    ensure_fingerprint_column(conn, 'all_data')
+    assert not any(row[3] == 'u' for row in conn.execute("PRAGMA index_list(all_data)"))
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE tbl_name = 'all_data'")}
+    assert 'idx_all_data_model' in indexes
+    assert conn.execute("SELECT id, BarCode FROM all_data").fetchall() == [(5, 'SN001')]
+    # 只有时间不同的行是新行，旧约束下会报 UNIQUE constraint failed
+    later = make_columns([{'Time': '2024/07/01 09:00:00'}, {}])
+    assert insert_deduplicated(conn, 'all_data', later).tolist() == [0]
+    conn.commit()
+    assert conn.execute("SELECT COUNT(*), MAX(id) FROM all_data").fetchone() == (2, 6)
+    # 已迁移的表不再重建
+    assert not drop_unique_constraints(conn, 'all_data')
@@ -0,0 +1,132 @@
+"""导入清单与导入流水线失败处理的回归测试：用法 python -m pytest tests"""
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parallel_parser
+from csv_processor_helpers import CSV_COLUMNS
+from import_manifest import create_manifest_table, load_manifest, plan_import, record_import
+from import_pipeline import ChunkWriter, ImportPipeline
+
+ROW_COUNT = 3000
+# 这个条码所在的范围写入时模拟 SQLite 出错
+FAILING_BARCODE = 'SN01500'
+
+
+def write_csv(path, start, count):
+    with open(path, 'a', encoding='utf-8') as f:
+        if not start:
+            f.write(','.join(CSV_COLUMNS) + '\n')
+        for i in range(start, start + count):
+            f.write(f"2024/07/01 08:00:00,SN{i:05d},M1,L{i % 10},OK,1.5,1.0,2.0,OK,0.2,0.1,0.3,OK,"
+                    f"0.01,-0.1,0.1,OK,OK,OK\n")
+    # 修改时间设为两小时前，plan_import 认为文件已写完
+    settled = time.time() - 7200
+    os.utime(path, (settled, settled))
+
+
+def stored_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM optimized_data").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def manifest_offset(db_path, file_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        entry = load_manifest(conn).get(os.path.abspath(file_path))
+    finally:
+        conn.close()
+    return None if entry is None else entry[3]
+
+
+def fail_writes_with_barcode(monkeypatch):
+    """含 FAILING_BARCODE 的数据块写入时抛出 sqlite3 错误，返回原来的 ChunkWriter.write"""
+    original_write = ChunkWriter.write
+
+    def failing_write(self, chunk):
+        if FAILING_BARCODE in chunk['BarCode']:
+            raise sqlite3.OperationalError("模拟写入失败")
+        return original_write(self, chunk)
+
+    monkeypatch.setattr(ChunkWriter, 'write', failing_write)
+    return original_write
+
+
+def run_pipeline(db_path, file_path, logs):
+    pipeline = ImportPipeline(db_path, max_workers=3, split_threshold=0, metrics_dir=None, on_log=logs.append)
+    pipeline.run([file_path])
+    return pipeline
+
+
+def test_plan_import_skips_appends_and_reimports(tmp_path):
+    file_path = str(tmp_path / 'data.csv')
+    write_csv(file_path, 0, 10)
+    conn = sqlite3.connect(':memory:')
+    create_manifest_table(conn)
+    assert plan_import(file_path, load_manifest(conn))[:2] == ('full', 0)
+
+    size = os.path.getsize(file_path)
+    record_import(conn, file_path, size)
+    assert plan_import(file_path, load_manifest(conn))[:2] == ('skip', size)
+
+    write_csv(file_path, 10, 5)
+    assert plan_import(file_path, load_manifest(conn))[:2] == ('append', size)
+
+    # 已导入的区域被改写时整体重新导入
+    with open(file_path, 'r+b') as f:
+        f.write(b'X')
+    assert plan_import(file_path, load_manifest(conn))[:2] == ('full', 0)
+
+
+def test_failed_range_stops_the_file_and_the_manifest(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'test.db')
+    file_path = str(tmp_path / 'data.csv')
+    write_csv(file_path, 0, ROW_COUNT)
+    # 小文件也按范围拆分成三段
+    monkeypatch.setattr(parallel_parser, 'MIN_RANGE_BYTES', 1)
+
+    original_write = fail_writes_with_barcode(monkeypatch)
+    logs = []
+    pipeline = run_pipeline(db_path, file_path, logs)
+    assert any('字节范围' in message for message in logs)
+    assert os.path.abspath(file_path) in {os.path.abspath(path) for path in pipeline.failed_files}
+    assert not any(message.startswith('成功处理文件') for message in logs)
+    # 第三个范围不能写入，清单不能越过失败的范围
+    assert stored_rows(db_path) < ROW_COUNT
+    offset = manifest_offset(db_path, file_path)
+    assert offset is None or offset < os.path.getsize(file_path)
+
+    # 故障排除后重新导入，补齐全部数据且没有重复
+    monkeypatch.setattr(ChunkWriter, 'write', original_write)
+    run_pipeline(db_path, file_path, [])
+    assert stored_rows(db_path) == ROW_COUNT
+    assert manifest_offset(db_path, file_path) == os.path.getsize(file_path)
+
+
+def test_write_failure_rolls_back_pending_files(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'test.db')
+    first, second = str(tmp_path / 'a.csv'), str(tmp_path / 'b.csv')
+    write_csv(first, 0, 100)
+    write_csv(second, 0, 100)
+    with open(second, 'a', encoding='utf-8') as f:
+        f.write(f"2024/07/02 08:00:00,{FAILING_BARCODE},M1,L1,OK,1.5,1.0,2.0,OK,0.2,0.1,0.3,OK,0.01,-0.1,0.1,OK,OK,OK\n")
+
+    original_write = fail_writes_with_barcode(monkeypatch)
+    # 批量导入合并提交：第一个文件写完后还未提交，第二个文件出错回滚时一起丢失
+    pipeline = ImportPipeline(db_path, max_workers=1, bulk_load=True, metrics_dir=None, on_log=lambda message: None)
+    pipeline.run([first, second])
+    assert pipeline.failed_files == {first, second}
+    assert stored_rows(db_path) == 0
+    assert manifest_offset(db_path, first) is None and manifest_offset(db_path, second) is None
+
+    monkeypatch.setattr(ChunkWriter, 'write', original_write)
+    run_pipeline(db_path, first, [])
+    run_pipeline(db_path, second, [])
+    # 第二个文件的 100 行与第一个文件相同，去重后只多出追加的一行
+    assert stored_rows(db_path) == 101
@@ -0,0 +1,66 @@
+"""位置汇总表统计合并的回归测试：用法 python -m pytest tests"""
+import os
+import sqlite3
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from location_summary import SUMMARY_MEASURES, SUMMARY_TABLE, LocationSummary, combine_statistics, merge_moments
+
+
+def make_columns(values, days):
+    count = len(values)
+    columns = {'Time': np.array([f"2024/07/{day:02d} 08:00:00" for day in days], dtype=object),
+               'ModelName': np.full(count, 'M1', dtype=object),
+               'Name_': np.full(count, 'L1', dtype=object),
+               'Result': np.full(count, 'OK', dtype=object)}
+    for measure, limit_min, limit_max in SUMMARY_MEASURES:
+        columns[measure] = values
+        columns[limit_min] = np.full(count, values.mean() - 0.01)
+        columns[limit_max] = np.full(count, values.mean() + 0.01)
+    return columns
+
+
+def test_merge_moments_matches_single_pass():
+    values = np.random.default_rng(1).normal(5.0, 2.0, 1000)
+    a, b = values[:300], values[300:]
+    count, mean, m2 = merge_moments(len(a), a.mean(), ((a - a.mean()) ** 2).sum(),
+                                    len(b), b.mean(), ((b - b.mean()) ** 2).sum())
+    stats = combine_statistics(count, mean, m2, values.min(), values.max())
+    assert count == 1000
+    assert np.isclose(stats['avg'], values.mean())
+    assert np.isclose(stats['std'], values.std(ddof=1))
+
+
+def test_summary_keeps_precision_for_large_clustered_values():
+    # 均值很大、离散度很小：平方和相减的算法在这里会丢掉全部有效数字
+    values = 1e6 + np.random.default_rng(2).normal(0, 1e-3, 3000)
+    days = [1 + i % 3 for i in range(len(values))]
+    summary = LocationSummary(sqlite3.connect(':memory:'))
+    summary.ensure()
+    columns = make_columns(values, days)
+    for start in range(0, len(values), 700):
+        summary.update({name: array[start:start + 700] for name, array in columns.items()})
+    stats = summary.location_statistics('M1')['L1']
+    assert stats['count'] == len(values)
+    assert np.isclose(stats['V_Current']['avg'], values.mean(), rtol=0, atol=1e-9)
+    assert np.isclose(stats['V_Current']['std'], values.std(ddof=1), rtol=1e-6)
+
+
+def test_legacy_sum_columns_are_converted():
+    conn = sqlite3.connect(':memory:')
+    measure_columns = ', '.join(f"{m}_sum REAL, {m}_sumsq REAL, {m}_min REAL, {m}_max REAL, {m}_hist BLOB"
+                                for m, _, _ in SUMMARY_MEASURES)
+    conn.execute(f"CREATE TABLE {SUMMARY_TABLE} (ModelName TEXT, Name_ TEXT, day TEXT, row_count INTEGER, "
+                 f"pass_count INTEGER, fail_count INTEGER, {measure_columns}, PRIMARY KEY (ModelName, Name_, day))")
+    hist = np.zeros(4, dtype=np.int64).tobytes()
+    # 值为 1、2、3：和 6，平方和 14
+    conn.execute(f"INSERT INTO {SUMMARY_TABLE} VALUES ('M1', 'L1', '2024-07-01', 3, 3, 0"
+                 f"{', 6, 14, 1, 3, ?' * len(SUMMARY_MEASURES)})", [hist] * len(SUMMARY_MEASURES))
+    summary = LocationSummary(conn)
+    # 没有原始表可回填，就地换算
+    assert summary.ensure('missing_table') == 0
+    stats = summary.location_statistics('M1')['L1']
+    assert stats['V_Current'] == {'min': 1, 'max': 3, 'avg': 2.0, 'std': 1.0}
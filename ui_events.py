@@ -0,0 +1,66 @@
+"""线程安全的界面事件通道：任意线程投递文件状态、日志和进度，Tk 线程按固定频率批量取出并合并后刷新界面"""
+import queue
+
+# 界面刷新间隔（毫秒）
+REFRESH_INTERVAL_MS = 100
+
+
+class UIEventBus:
+    """与 csv2sqlite5 的 message_queue 相同的模式，但同一文件的多次状态只保留最新一次，
+    日志合并为一次插入，进度只取最后的值，刷新频率固定，不随事件数增长。
+    """
+
+    def __init__(self, master, on_statuses, on_logs, on_progress, interval_ms=REFRESH_INTERVAL_MS):
+        self.master = master
+        self.on_statuses = on_statuses
+        self.on_logs = on_logs
+        self.on_progress = on_progress
+        self.interval_ms = interval_ms
+        self.events = queue.SimpleQueue()
+
+    def post_status(self, file_name, status):
+        self.events.put(('status', file_name, status))
+
+    def post_log(self, message):
+        self.events.put(('log', message, None))
+
+    def post_progress(self, done, total):
+        self.events.put(('progress', done, total))
+
+    def post_call(self, callback, *args):
+        """让 Tk 线程在下次刷新时调用 callback(*args)，后台任务用它把结果交给界面"""
+        self.events.put(('call', callback, args))
+
+    def start(self):
+        """在 Tk 线程中调用，之后每隔 interval_ms 刷新一次"""
+        self.master.after(self.interval_ms, self.flush)
+
+    def flush(self):
+        statuses = {}
+        logs = []
+        progress = None
+        calls = []
+        while True:
+            try:
+                kind, first, second = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'status':
+                statuses[first] = second
+            elif kind == 'log':
+                logs.append(first)
+            elif kind == 'call':
+                calls.append((first, second))
+            else:
+                progress = (first, second)
+        try:
+            if statuses:
+                self.on_statuses(statuses)
+            if logs:
+                self.on_logs(logs)
+            if progress is not None:
+                self.on_progress(*progress)
+            for callback, args in calls:
+                callback(*args)
+        finally:
+            self.master.after(self.interval_ms, self.flush)